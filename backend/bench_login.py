@@ -0,0 +1,87 @@
+#!/usr/bin/env python3
+"""Measure event loop lag while a login storm verifies passwords.
+
+Compares verifying inline on the event loop (the previous login path) with the
+bounded hashing pool, and shows throttled attempts never reaching PBKDF2.
+
+Run from the backend directory:
+    python bench_login.py
+"""
+import asyncio
+import statistics
+import time
+
+from server import (
+    PASSWORD_HASH_WORKERS,
+    LoginThrottle,
+    hash_password,
+    verify_password,
+    verify_password_async,
+)
+
+LOGINS = 200
+PROBE_INTERVAL = 0.005
+PASSWORD = "SecurePassword123!"
+
+
+async def probe_lag(samples, stop):
+    """Record how late the loop wakes up from a short sleep"""
+    while not stop.is_set():
+        started = time.perf_counter()
+        await asyncio.sleep(PROBE_INTERVAL)
+        samples.append((time.perf_counter() - started - PROBE_INTERVAL) * 1000)
+
+
+async def inline_login(password_hash):
+    return verify_password(PASSWORD, password_hash)
+
+
+async def pooled_login(password_hash):
+    return await verify_password_async(PASSWORD, password_hash)
+
+
+def throttled_login(throttle):
+    async def login(password_hash):
+        if throttle.retry_after("storm_user"):
+            return False
+        throttle.record_failure("storm_user")
+        return await verify_password_async("wrong password", password_hash)
+    return login
+
+
+async def run_storm(login, password_hash):
+    samples, stop = [], asyncio.Event()
+    prober = asyncio.create_task(probe_lag(samples, stop))
+    await asyncio.sleep(PROBE_INTERVAL * 2)
+    started = time.perf_counter()
+    await asyncio.gather(*(login(password_hash) for _ in range(LOGINS)))
+    elapsed = time.perf_counter() - started
+    stop.set()
+    await prober
+    samples.sort()
+    return {
+        "logins_per_second": LOGINS / elapsed,
+        "lag_p50_ms": statistics.median(samples),
+        "lag_p99_ms": samples[int(len(samples) * 0.99) - 1] if len(samples) > 1 else samples[-1],
+        "lag_max_ms": samples[-1],
+    }
+
+
+async def main():
+    password_hash = hash_password(PASSWORD)
+    print(f"{LOGINS} concurrent logins, {PASSWORD_HASH_WORKERS} hashing workers")
+    print(f"{'path':<20} {'logins/s':>10} {'lag p50 ms':>12} {'lag p99 ms':>12} {'lag max ms':>12}")
+    for name, login in [
+        ("inline on loop", inline_login),
+        ("hashing pool", pooled_login),
+        ("throttled storm", throttled_login(LoginThrottle(limit=5))),
+    ]:
+        result = await run_storm(login, password_hash)
+        print(
+            f"{name:<20} {result['logins_per_second']:>10.1f} {result['lag_p50_ms']:>12.2f} "
+            f"{result['lag_p99_ms']:>12.2f} {result['lag_max_ms']:>12.2f}"
+        )
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,81 @@
+#!/usr/bin/env python3
+"""Measure fuzzy patient lookups against a large trigram index.
+
+Indexes synthetic patients for a single doctor (the worst case, since the
+index is scoped by doctor) and times partial and misspelled name queries.
+
+Run from the backend directory:
+    python bench_patient_search.py [patients]
+"""
+import random
+import statistics
+import sys
+import time
+
+from patient_search import TrigramIndex
+
+FIRST_NAMES = [
+    "Aarav", "Aditi", "Ananya", "Arjun", "Deepa", "Farah", "Gaurav", "Ishaan", "Kavya", "Lakshmi",
+    "Meera", "Nikhil", "Priya", "Rahul", "Rohan", "Sanjay", "Shreya", "Sunita", "Vikram", "Zoya",
+    "James", "Maria", "John", "Elena", "David", "Sofia", "Michael", "Fatima", "Daniel", "Chen",
+]
+# Surnames are built from random syllables so that most full names are distinct
+ONSETS = ["", "b", "ch", "d", "g", "h", "j", "k", "kh", "l", "m", "n", "p", "r", "s", "sh", "t", "th", "v", "w", "y", "z"]
+VOWELS = ["a", "aa", "e", "i", "o", "u", "ai", "ee"]
+CODAS = ["", "", "", "n", "r", "l", "m", "sh", "t", "k"]
+QUERIES = 500
+LIMIT = 10
+
+
+def synthetic_name(rng):
+    surname = "".join(rng.choice(ONSETS) + rng.choice(VOWELS) + rng.choice(CODAS) for _ in range(rng.randint(2, 3)))
+    return f"{rng.choice(FIRST_NAMES)} {surname.capitalize()}"
+
+
+def misspell(name, rng):
+    """Drop, swap or replace one character of the name"""
+    position = rng.randrange(1, len(name) - 1)
+    edit = rng.choice(["drop", "swap", "replace"])
+    if edit == "drop":
+        return name[:position] + name[position + 1:]
+    if edit == "swap":
+        return name[:position - 1] + name[position] + name[position - 1] + name[position + 1:]
+    return name[:position] + rng.choice("aeiou") + name[position + 1:]
+
+
+def main():
+    patients = int(sys.argv[1]) if len(sys.argv) > 1 else 1_000_000
+    rng = random.Random(7)
+    index = TrigramIndex()
+
+    started = time.perf_counter()
+    names = []
+    for number in range(patients):
+        name = synthetic_name(rng)
+        names.append(name)
+        index.add("bench_doctor", f"PT{number:07d}", name)
+    build_seconds = time.perf_counter() - started
+    print(f"indexed {patients} patients in {build_seconds:.1f}s "
+          f"({build_seconds / patients * 1e6:.1f} us per patient), {index.metrics()['trigrams']} trigrams")
+
+    print(f"{'query kind':<16} {'p50 ms':>8} {'p99 ms':>8} {'max ms':>8} {'target found':>13}")
+    for kind, make_query in [
+        ("misspelled name", lambda target: misspell(names[target], rng)),
+        ("patient id", lambda target: f"PT{target:07d}"),
+        ("partial name", lambda target: names[target][:len(names[target].split()[0]) + 5]),
+    ]:
+        timings, found = [], 0
+        for _ in range(QUERIES):
+            target = rng.randrange(patients)
+            query = make_query(target)
+            started = time.perf_counter()
+            matches = index.search("bench_doctor", query, LIMIT)
+            timings.append((time.perf_counter() - started) * 1000)
+            found += any(match["patient_name"] == names[target] for match in matches)
+        timings.sort()
+        print(f"{kind:<16} {statistics.median(timings):>8.2f} {timings[int(len(timings) * 0.99) - 1]:>8.2f} "
+              f"{timings[-1]:>8.2f} {found / QUERIES:>12.0%}")
+
+
+if __name__ == "__main__":
+    main()
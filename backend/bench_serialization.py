@@ -0,0 +1,111 @@
+#!/usr/bin/env python3
+"""Compare the previous per-endpoint serialization with the orjson fast path.
+
+Run from the backend directory:
+    python bench_serialization.py
+"""
+import json
+import time
+import uuid
+from datetime import datetime, timedelta
+
+from fastapi.encoders import jsonable_encoder
+
+from server import ClinicalCase, FastJSONResponse
+
+SIZES = [100, 10_000]
+REPEATS = 5
+
+
+def make_case_document(index):
+    """A stored case as returned by MongoDB, with files and a full analysis"""
+    created_at = datetime.utcnow() - timedelta(minutes=index)
+    return {
+        "id": str(uuid.uuid4()),
+        "patient_summary": "45-year-old male presents with chest pain and shortness of breath. " * 4,
+        "patient_id": f"P{index:06d}",
+        "patient_name": f"Patient {index}",
+        "patient_age": 20 + index % 70,
+        "patient_gender": "male" if index % 2 else "female",
+        "doctor_id": "bench_doctor",
+        "doctor_name": "Bench",
+        "uploaded_files": [
+            {
+                "id": str(uuid.uuid4()),
+                "original_name": f"lab_{file_index}.pdf",
+                "saved_name": f"{uuid.uuid4()}.pdf",
+                "file_path": f"/app/backend/uploads/{uuid.uuid4()}.pdf",
+                "file_size": 20480,
+                "mime_type": "application/pdf",
+                "uploaded_at": created_at
+            }
+            for file_index in range(2)
+        ],
+        "analysis_result": {
+            "soap_note": {key: f"{key} text " * 20 for key in ("subjective", "objective", "assessment", "plan")},
+            "differential_diagnoses": [
+                {"diagnosis": "Acute coronary syndrome", "likelihood": 70, "rationale": "Chest pain " * 10},
+                {"diagnosis": "Pulmonary embolism", "likelihood": 20, "rationale": "Dyspnea " * 10}
+            ],
+            "treatment_recommendations": ["Aspirin", "Serial ECG"],
+            "investigation_suggestions": ["Troponin", "CT angiography"],
+            "file_interpretations": [
+                {"file_name": f"lab_{file_index}.pdf", "full_interpretation": "x" * 500}
+                for file_index in range(2)
+            ],
+            "confidence_score": 80,
+            "overall_assessment": "Assessment " * 30
+        },
+        "confidence_score": 80,
+        "version": 3,
+        "created_at": created_at,
+        "updated_at": created_at
+    }
+
+
+def legacy_model_roundtrip(documents):
+    """Previous get_cases/get_case: rebuild ClinicalCase models, then encode them"""
+    models = [ClinicalCase(**document) for document in documents]
+    return json.dumps(jsonable_encoder(models)).encode()
+
+
+def legacy_isoformat_loop(documents):
+    """Previous query/search endpoints: hand-convert datetimes, then encode"""
+    for document in documents:
+        for key in ("created_at", "updated_at"):
+            if hasattr(document.get(key), "isoformat"):
+                document[key] = document[key].isoformat()
+        for file_info in document.get("uploaded_files", []):
+            if hasattr(file_info.get("uploaded_at"), "isoformat"):
+                file_info["uploaded_at"] = file_info["uploaded_at"].isoformat()
+    return json.dumps(jsonable_encoder({"cases": documents})).encode()
+
+
+def orjson_fast_path(documents):
+    """Current endpoints: raw documents rendered by FastJSONResponse"""
+    return FastJSONResponse({"cases": documents}).body
+
+
+def measure(function, size):
+    timings = []
+    for _ in range(REPEATS):
+        # The legacy loop mutates documents, so each run gets fresh ones
+        documents = [make_case_document(index) for index in range(size)]
+        started = time.perf_counter()
+        body = function(documents)
+        timings.append(time.perf_counter() - started)
+    return min(timings) * 1000, len(body)
+
+
+if __name__ == "__main__":
+    print(f"{'documents':>10} {'path':<26} {'best ms':>10} {'bytes':>12} {'speedup':>8}")
+    for size in SIZES:
+        baseline = None
+        for name, function in [
+            ("model round-trip", legacy_model_roundtrip),
+            ("isoformat loop", legacy_isoformat_loop),
+            ("orjson fast path", orjson_fast_path),
+        ]:
+            elapsed_ms, body_size = measure(function, size)
+            baseline = baseline or elapsed_ms
+            print(f"{size:>10} {name:<26} {elapsed_ms:>10.2f} {body_size:>12} {baseline / elapsed_ms:>7.1f}x")
@@ -0,0 +1,362 @@
+"""Longitudinal lab trends across a patient's cases.
+
+Lab values come from the structured `lab_values` of file interpretations, or
+are parsed out of their free-text findings for older analyses. Values are
+converted into the unit of the test's reference range where the conversion is
+known; values in any other unit form a series of their own, so one series
+never mixes units. All of a patient's observations go into flat NumPy arrays
+sorted by (series, time), and deltas, slopes and out-of-range runs for every
+series are computed in one vectorized pass instead of per-test Python loops.
+"""
+import re
+from datetime import datetime
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+
+# Canonical test name -> aliases seen in reports
+LAB_ALIASES = {
+    "hemoglobin": ["hemoglobin", "haemoglobin", "hgb", "hb"],
+    "hematocrit": ["hematocrit", "haematocrit", "hct"],
+    "wbc": ["wbc", "white blood cells", "white blood cell count", "leukocytes"],
+    "platelets": ["platelets", "platelet count", "plt"],
+    "creatinine": ["creatinine", "serum creatinine", "creat", "cr"],
+    "urea": ["urea", "bun", "blood urea nitrogen"],
+    "egfr": ["egfr", "gfr"],
+    "sodium": ["sodium", "na"],
+    "potassium": ["potassium", "k"],
+    "glucose": ["glucose", "blood glucose", "fasting glucose", "fbs"],
+    "hba1c": ["hba1c", "a1c", "glycated hemoglobin"],
+    "alt": ["alt", "sgpt"],
+    "ast": ["ast", "sgot"],
+    "bilirubin": ["bilirubin", "total bilirubin"],
+    "tsh": ["tsh"],
+    "crp": ["crp", "c-reactive protein"],
+    "troponin": ["troponin", "troponin i", "troponin t", "hs-troponin"],
+    "cholesterol": ["cholesterol", "total cholesterol"],
+    "ldl": ["ldl", "ldl cholesterol"],
+}
+ALIAS_TO_TEST = {alias: test for test, aliases in LAB_ALIASES.items() for alias in aliases}
+
+# Adult reference intervals used when a report does not state its own
+REFERENCE_RANGES = {
+    "hemoglobin": (12.0, 17.5, "g/dL"),
+    "hematocrit": (36.0, 52.0, "%"),
+    "wbc": (4.0, 11.0, "10^9/L"),
+    "platelets": (150.0, 450.0, "10^9/L"),
+    "creatinine": (0.6, 1.3, "mg/dL"),
+    "urea": (7.0, 20.0, "mg/dL"),
+    "egfr": (90.0, np.inf, "mL/min/1.73m2"),
+    "sodium": (135.0, 145.0, "mmol/L"),
+    "potassium": (3.5, 5.1, "mmol/L"),
+    "glucose": (70.0, 100.0, "mg/dL"),
+    "hba1c": (4.0, 5.7, "%"),
+    "alt": (7.0, 56.0, "U/L"),
+    "ast": (10.0, 40.0, "U/L"),
+    "bilirubin": (0.1, 1.2, "mg/dL"),
+    "tsh": (0.4, 4.0, "mIU/L"),
+    "crp": (0.0, 10.0, "mg/L"),
+    "troponin": (0.0, 0.04, "ng/mL"),
+    "cholesterol": (0.0, 200.0, "mg/dL"),
+    "ldl": (0.0, 100.0, "mg/dL"),
+}
+
+# Reference change values (%): the smallest change between two results that is
+# unlikely to come from analytical and within-person biological variation alone
+REFERENCE_CHANGE_PERCENT = {
+    "hemoglobin": 8.0, "hematocrit": 8.0, "wbc": 32.0, "platelets": 25.0, "creatinine": 14.0,
+    "urea": 35.0, "egfr": 15.0, "sodium": 3.0, "potassium": 13.0, "glucose": 18.0, "hba1c": 7.0,
+    "alt": 54.0, "ast": 34.0, "bilirubin": 60.0, "tsh": 55.0, "crp": 120.0, "troponin": 50.0,
+    "cholesterol": 15.0, "ldl": 22.0,
+}
+DEFAULT_REFERENCE_CHANGE_PERCENT = 20.0
+
+# Two-sided 95% critical values of Student's t by degrees of freedom; degrees
+# of freedom between entries use the next lower (more conservative) entry
+T_CRITICAL_95 = [(1, 12.71), (2, 4.30), (3, 3.18), (4, 2.78), (5, 2.57), (6, 2.45), (7, 2.36),
+                 (8, 2.31), (9, 2.26), (10, 2.23), (15, 2.13), (20, 2.09), (30, 2.04), (60, 2.00), (120, 1.98)]
+
+# Factors converting other common report units into the unit of REFERENCE_RANGES,
+# keyed by unit_key(). Affine conversions (HbA1c mmol/mol) are left as their own series
+CELL_COUNT_UNITS = {"10^3/ul": 1.0, "k/ul": 1.0, "10^3/mm3": 1.0, "/ul": 0.001, "cells/ul": 0.001, "/mm3": 0.001}
+UNIT_CONVERSIONS = {
+    "hemoglobin": {"g/l": 0.1, "mmol/l": 1.611},
+    "hematocrit": {"l/l": 100.0},
+    "wbc": CELL_COUNT_UNITS,
+    "platelets": CELL_COUNT_UNITS,
+    "creatinine": {"umol/l": 1 / 88.42},
+    "urea": {"mmol/l": 2.801},
+    "sodium": {"meq/l": 1.0},
+    "potassium": {"meq/l": 1.0},
+    "glucose": {"mmol/l": 18.016},
+    "bilirubin": {"umol/l": 1 / 17.1},
+    "tsh": {"uiu/ml": 1.0, "mu/l": 1.0},
+    "crp": {"mg/dl": 10.0},
+    "troponin": {"ng/l": 0.001, "pg/ml": 0.001, "ug/l": 1.0},
+    "cholesterol": {"mmol/l": 38.67},
+    "ldl": {"mmol/l": 38.67},
+}
+
+# Aliases of one or two letters ("k", "hb") also occur inside ordinary words and
+# abbreviations, so in free text they only count when a value with a unit of
+# that test directly follows, as in "K 5.9 mmol/L" or "Hb: 11.2 g/dL"
+SHORT_ALIAS_LENGTH = 2
+UNIT_PATTERN = r"(?P<unit>[a-zA-Z%/^0-9.\u00b5\u03bc]+(?:/[a-zA-Z0-9.]+)?)"
+VALUE_PATTERN = re.compile(
+    r"(?<!\w)(?P<name>" + "|".join(sorted(
+        (re.escape(alias) for alias in ALIAS_TO_TEST if len(alias) > SHORT_ALIAS_LENGTH), key=len, reverse=True
+    )) + r")"
+    r"\b[^0-9\n]{0,20}?(?<![\w.])(?P<value>\d+(?:\.\d+)?)\s*" + UNIT_PATTERN + "?",
+    re.IGNORECASE
+)
+SHORT_VALUE_PATTERN = re.compile(
+    r"(?<!\w)(?P<name>" + "|".join(
+        re.escape(alias) for alias in ALIAS_TO_TEST if len(alias) <= SHORT_ALIAS_LENGTH
+    ) + r")"
+    r"\s*[:=]?\s*(?P<value>\d+(?:\.\d+)?)\s*" + UNIT_PATTERN,
+    re.IGNORECASE
+)
+
+
+def canonical_test(name: str) -> Optional[str]:
+    return ALIAS_TO_TEST.get(re.sub(r"\s+", " ", name.strip().lower()))
+
+
+def to_float(value: Any) -> Optional[float]:
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def unit_key(unit: Optional[str]) -> Optional[str]:
+    """Comparable form of a unit: "µmol/L" and "umol / l" both become "umol/l" """
+    if not unit or not str(unit).strip():
+        return None
+    key = re.sub(r"\s+", "", str(unit).lower()).replace("\u00b5", "u").replace("\u03bc", "u")
+    # "x10^9/L" and "10^9/L" are the same unit
+    return re.sub(r"^[x\u00d7*](?=10)", "", key)
+
+
+def known_unit(test: str, unit: Optional[str]) -> bool:
+    """Whether a unit is the test's reference unit or converts into it"""
+    key = unit_key(unit)
+    reference_unit = REFERENCE_RANGES.get(test, (None, None, None))[2]
+    return key is not None and (key == unit_key(reference_unit) or key in UNIT_CONVERSIONS.get(test, {}))
+
+
+def normalize_lab_value(test: str, value: float, unit: Optional[str], reference_low: Optional[float],
+                        reference_high: Optional[float]) -> Dict[str, Any]:
+    """Convert a value and its reported range into the test's reference unit where possible.
+
+    Values without a unit are taken to be in the reference unit; values in a
+    unit that cannot be converted keep it.
+    """
+    reference_unit = REFERENCE_RANGES.get(test, (None, None, None))[2]
+    key = unit_key(unit)
+    factor = None
+    if key is None or reference_unit is None or key == unit_key(reference_unit):
+        factor = 1.0
+    elif key in UNIT_CONVERSIONS.get(test, {}):
+        factor = UNIT_CONVERSIONS[test][key]
+    if factor is None:
+        return {"test": test, "value": value, "unit": unit,
+                "reference_low": reference_low, "reference_high": reference_high}
+    return {
+        "test": test,
+        "value": round(value * factor, 6),
+        "unit": reference_unit or unit,
+        "reference_low": None if reference_low is None else round(reference_low * factor, 6),
+        "reference_high": None if reference_high is None else round(reference_high * factor, 6)
+    }
+
+
+def series_name(observation: Dict[str, Any]) -> str:
+    """Trend series of an observation: the test, suffixed with the unit if it is not the reference unit"""
+    test = observation["test"]
+    unit = observation.get("unit")
+    if unit_key(unit) is None or unit_key(unit) == unit_key(REFERENCE_RANGES.get(test, (None, None, None))[2]):
+        return test
+    return f"{test} ({unit})"
+
+
+def extract_lab_values(interpretation: Dict[str, Any]) -> List[Dict[str, Any]]:
+    """Lab values of one file interpretation, structured where available, else parsed from findings"""
+    values = []
+    for item in interpretation.get("lab_values") or []:
+        test = canonical_test(str(item.get("test", "")))
+        value = to_float(item.get("value"))
+        if test and value is not None:
+            values.append(normalize_lab_value(
+                test, value, item.get("unit"), to_float(item.get("reference_low")), to_float(item.get("reference_high"))
+            ))
+    if values:
+        return values
+
+    seen = set()
+    for text in list(interpretation.get("abnormal_values") or []) + list(interpretation.get("key_findings") or []):
+        matches = sorted(
+            list(VALUE_PATTERN.finditer(str(text))) + list(SHORT_VALUE_PATTERN.finditer(str(text))),
+            key=lambda match: match.start()
+        )
+        for match in matches:
+            test = canonical_test(match.group("name"))
+            unit = match.group("unit")
+            if not test or test in seen:
+                continue
+            if not known_unit(test, unit):
+                if match.re is SHORT_VALUE_PATTERN:
+                    continue
+                # Free text runs on after the value ("2.1 on repeat"); that is not a unit
+                unit = None
+            # One value per test and file; abnormal_values come first and are the most specific
+            seen.add(test)
+            values.append(normalize_lab_value(test, float(match.group("value")), unit, None, None))
+    return values
+
+
+def collect_observations(analyses: Iterable[Tuple[str, datetime, Dict[str, Any]]]) -> List[Dict[str, Any]]:
+    """Flatten (case_id, observed_at, analysis result) into lab observations"""
+    observations = []
+    for case_id, observed_at, result in analyses:
+        for interpretation in (result or {}).get("file_interpretations") or []:
+            for lab_value in extract_lab_values(interpretation):
+                observations.append({"case_id": case_id, "observed_at": observed_at, **lab_value})
+    return observations
+
+
+def optional_float(value: float, digits: int = 4) -> Optional[float]:
+    return None if np.isnan(value) or np.isinf(value) else round(float(value), digits)
+
+
+def t_critical(degrees_of_freedom: np.ndarray) -> np.ndarray:
+    thresholds = np.array([df for df, _ in T_CRITICAL_95])
+    values = np.array([value for _, value in T_CRITICAL_95] + [1.96])
+    index = np.searchsorted(thresholds, degrees_of_freedom, side="right") - 1
+    # Beyond the table the normal approximation applies
+    index = np.where(degrees_of_freedom > thresholds[-1], len(values) - 1, np.maximum(index, 0))
+    return values[index]
+
+
+def compute_lab_trends(observations: List[Dict[str, Any]], tests: Optional[List[str]] = None) -> Dict[str, Any]:
+    """Per-series values, deltas, slopes and out-of-range runs for a patient's observations.
+
+    Series are keyed by test name, or "test (unit)" for values in a unit that
+    could not be converted into the reference unit.
+    """
+    if tests:
+        observations = [observation for observation in observations if observation["test"] in tests]
+    if not observations:
+        return {"tests": {}, "observation_count": 0}
+
+    series = [series_name(observation) for observation in observations]
+    names = sorted(set(series))
+    name_index = {name: index for index, name in enumerate(names)}
+    group_count = len(names)
+    # Default ranges only apply to series in the reference unit
+    series_tests = {name: observation["test"] for name, observation in zip(series, observations)}
+
+    group = np.fromiter((name_index[name] for name in series), dtype=np.int64, count=len(observations))
+    epoch = min(o["observed_at"] for o in observations)
+    days = np.fromiter(((o["observed_at"] - epoch).total_seconds() / 86400 for o in observations),
+                       dtype=np.float64, count=len(observations))
+    values = np.fromiter((o["value"] for o in observations), dtype=np.float64, count=len(observations))
+    default_low = np.array([REFERENCE_RANGES.get(name, (-np.inf, np.inf, None))[0] for name in names])
+    default_high = np.array([REFERENCE_RANGES.get(name, (-np.inf, np.inf, None))[1] for name in names])
+    low = np.fromiter((np.nan if o.get("reference_low") is None else o["reference_low"] for o in observations),
+                      dtype=np.float64, count=len(observations))
+    high = np.fromiter((np.nan if o.get("reference_high") is None else o["reference_high"] for o in observations),
+                       dtype=np.float64, count=len(observations))
+    low = np.where(np.isnan(low), default_low[group], low)
+    high = np.where(np.isnan(high), default_high[group], high)
+
+    order = np.lexsort((days, group))
+    group, days, values, low, high = group[order], days[order], values[order], low[order], high[order]
+
+    # Consecutive deltas within each test, flagged against the reference change value
+    same_test = np.concatenate(([False], group[1:] == group[:-1]))
+    previous = np.concatenate(([np.nan], values[:-1]))
+    delta = np.where(same_test, values - previous, np.nan)
+    rcv = np.array([
+        REFERENCE_CHANGE_PERCENT.get(series_tests[name], DEFAULT_REFERENCE_CHANGE_PERCENT) for name in names
+    ])[group]
+    with np.errstate(divide="ignore", invalid="ignore"):
+        percent_change = np.where(same_test & (previous != 0), delta / np.abs(previous) * 100, np.nan)
+    significant_change = np.abs(np.nan_to_num(percent_change)) >= rcv
+
+    # Least-squares slope per test from grouped sums
+    count = np.bincount(group, minlength=group_count).astype(np.float64)
+    sum_t = np.bincount(group, days, group_count)
+    sum_v = np.bincount(group, values, group_count)
+    sum_tt = np.bincount(group, days * days, group_count)
+    sum_tv = np.bincount(group, days * values, group_count)
+    denominator = count * sum_tt - sum_t ** 2
+    with np.errstate(divide="ignore", invalid="ignore"):
+        slope = np.where(denominator > 0, (count * sum_tv - sum_t * sum_v) / denominator, np.nan)
+        intercept = (sum_v - slope * sum_t) / count
+        residual = values - (intercept[group] + slope[group] * days)
+        residual_ss = np.bincount(group, residual ** 2, group_count)
+        # Rounding noise of an exact fit must not read as a tiny standard error
+        exact_fit = residual_ss <= 1e-12 * np.bincount(group, values ** 2, group_count)
+        residual_ss = np.where(exact_fit, 0.0, residual_ss)
+        t_variance = sum_tt - sum_t ** 2 / count
+        slope_se = np.sqrt(residual_ss / (count - 2) / t_variance)
+        t_stat = np.where((count > 2) & (slope_se > 0), slope / slope_se, np.nan)
+    trend_significant = (count > 2) & (np.abs(np.nan_to_num(t_stat)) >= t_critical(np.maximum(count - 2, 1)))
+    # An exact fit (zero residuals) over 3+ points is a significant trend when the slope is non-zero
+    trend_significant |= (count > 2) & (np.nan_to_num(slope) != 0) & exact_fit
+
+    # Out-of-range runs: run ids change whenever the test or the in/out state changes
+    out_of_range = (values < low) | (values > high)
+    run_break = np.concatenate(([True], (group[1:] != group[:-1]) | (out_of_range[1:] != out_of_range[:-1])))
+    run_id = np.cumsum(run_break) - 1
+    run_length = np.bincount(run_id)
+    run_group = group[run_break]
+    run_out = out_of_range[run_break]
+    longest_run = np.zeros(group_count, dtype=np.int64)
+    np.maximum.at(longest_run, run_group[run_out], run_length[run_out])
+    last_index = np.searchsorted(group, np.arange(group_count), side="right") - 1
+    current_run = np.where(out_of_range[last_index], run_length[run_id[last_index]], 0)
+    out_count = np.bincount(group, out_of_range, group_count).astype(np.int64)
+    minimum = np.full(group_count, np.inf)
+    maximum = np.full(group_count, -np.inf)
+    np.minimum.at(minimum, group, values)
+    np.maximum.at(maximum, group, values)
+
+    sorted_observations = [observations[index] for index in order]
+    result = {}
+    starts = np.searchsorted(group, np.arange(group_count), side="left")
+    for test_index, name in enumerate(names):
+        start, end = starts[test_index], last_index[test_index] + 1
+        points = [
+            {
+                "case_id": sorted_observations[position]["case_id"],
+                "observed_at": sorted_observations[position]["observed_at"],
+                "value": float(values[position]),
+                "unit": sorted_observations[position].get("unit"),
+                "out_of_range": bool(out_of_range[position]),
+                "delta": optional_float(delta[position]),
+                "significant_change": bool(significant_change[position])
+            }
+            for position in range(start, end)
+        ]
+        result[name] = {
+            "test": series_tests[name],
+            "unit": sorted_observations[end - 1].get("unit") or REFERENCE_RANGES.get(name, (None, None, None))[2],
+            "points": points,
+            "count": int(count[test_index]),
+            "latest": float(values[end - 1]),
+            "min": float(minimum[test_index]),
+            "max": float(maximum[test_index]),
+            "mean": optional_float(sum_v[test_index] / count[test_index]),
+            "reference_low": optional_float(low[end - 1]),
+            "reference_high": optional_float(high[end - 1]),
+            "slope_per_30_days": optional_float(slope[test_index] * 30),
+            "t_stat": optional_float(t_stat[test_index], 2),
+            "trend_significant": bool(trend_significant[test_index]),
+            "significant_changes": int(significant_change[start:end].sum()),
+            "out_of_range_count": int(out_count[test_index]),
+            "longest_out_of_range_run": int(longest_run[test_index]),
+            "current_out_of_range_run": int(current_run[test_index])
+        }
+    return {"tests": result, "observation_count": len(observations)}
@@ -0,0 +1,220 @@
+"""Fuzzy patient lookup over an in-memory trigram index.
+
+Every patient is one row holding the trigrams of its name and its patient id.
+Each trigram keeps a posting list of row numbers in an `array.array`, so
+indexing a new patient is a handful of appends. A query counts the rare
+trigrams it shares with every row over the concatenated posting lists in one
+vectorized pass, and checks the common trigrams only for the rows that can
+still reach the top results, which keeps lookups in milliseconds even with a
+million patients for a single doctor.
+
+The index is not thread safe; it is meant to be read and updated from the
+event loop only.
+"""
+import math
+import re
+import unicodedata
+from array import array
+from typing import Any, Dict, List, Optional, Set
+
+import numpy as np
+
+WORD_PATTERN = re.compile(r"\w+")
+
+# A row must contain at least this share of the query's trigrams to be a match
+MIN_CONTAINMENT = 0.4
+# Ranking weight of containment (how much of what was typed matches) versus
+# Dice similarity (how close the whole name is to the query)
+CONTAINMENT_WEIGHT = 0.75
+
+
+def normalize(text: str) -> str:
+    """Lower-case and strip accents so that "Jose" finds "José" """
+    decomposed = unicodedata.normalize("NFKD", text or "")
+    return "".join(char for char in decomposed if not unicodedata.combining(char)).lower()
+
+
+def trigrams(text: str) -> Set[str]:
+    """Padded word trigrams of a name or id, as in pg_trgm"""
+    grams = set()
+    for word in WORD_PATTERN.findall(normalize(text)):
+        padded = f"  {word} "
+        grams.update(padded[index:index + 3] for index in range(len(padded) - 2))
+    return grams
+
+
+class DoctorPatientIndex:
+    """Trigram postings for one doctor's patients"""
+
+    def __init__(self):
+        self.patient_ids: List[str] = []
+        self.names: List[Optional[str]] = []
+        self.gram_counts = array("i")
+        self.alive = bytearray()
+        self.rows: Dict[str, int] = {}
+        self.postings: Dict[str, array] = {}
+
+    def add(self, patient_id: str, patient_name: Optional[str]) -> bool:
+        row = self.rows.get(patient_id)
+        if row is not None:
+            if self.names[row] == patient_name:
+                return False
+            # A renamed patient gets a fresh row; the old one stays as a tombstone
+            self.alive[row] = 0
+
+        row = len(self.patient_ids)
+        grams = trigrams(patient_name or "") | trigrams(patient_id)
+        for gram in grams:
+            postings = self.postings.get(gram)
+            if postings is None:
+                postings = self.postings[gram] = array("i")
+            postings.append(row)
+        self.patient_ids.append(patient_id)
+        self.names.append(patient_name)
+        self.gram_counts.append(len(grams))
+        self.alive.append(1)
+        self.rows[patient_id] = row
+        return True
+
+    def remove(self, patient_id: str) -> bool:
+        row = self.rows.pop(patient_id, None)
+        if row is None:
+            return False
+        self.alive[row] = 0
+        return True
+
+    def search(self, query: str, limit: int) -> List[Dict[str, Any]]:
+        query_trigrams = trigrams(query)
+        grams = [gram for gram in query_trigrams if gram in self.postings]
+        if not grams:
+            return []
+        query_grams = len(query_trigrams)
+        min_shared = max(1, math.ceil(MIN_CONTAINMENT * query_grams))
+
+        def score(matched, row_grams):
+            return (CONTAINMENT_WEIGHT * matched / query_grams
+                    + (1 - CONTAINMENT_WEIGHT) * 2 * matched / (query_grams + row_grams))
+
+        # A match shares at least min_shared trigrams, so it carries at least
+        # one of the rarest len(grams) - min_shared + 1 of them. Only those are
+        # counted for every row; the common ones (id prefixes, frequent first
+        # names) are checked for the candidates they produce, best first,
+        # until no unchecked candidate can still enter the top results
+        grams.sort(key=lambda gram: len(self.postings[gram]))
+        split = max(1, len(grams) - min_shared + 1)
+        rare, frequent = grams[:split], grams[split:]
+
+        # Posting views must not outlive the search: an exported array cannot grow
+        lists = [np.frombuffer(self.postings[gram], dtype=np.int32) for gram in rare]
+        rows = np.concatenate(lists)
+        del lists
+        if len(rows) * 8 < len(self.patient_ids):
+            # Sorting a few postings beats zeroing a counter per row
+            candidates, rare_matched = np.unique(rows, return_counts=True)
+        else:
+            rare_matched = np.bincount(rows, minlength=len(self.patient_ids))
+            candidates = np.flatnonzero(rare_matched).astype(np.int32)
+            rare_matched = rare_matched[candidates]
+        del rows
+        possible = rare_matched >= max(1, min_shared - len(frequent))
+        candidates, rare_matched = candidates[possible], rare_matched[possible]
+        possible = np.frombuffer(self.alive, dtype=np.uint8)[candidates] == 1
+        candidates, rare_matched = candidates[possible], rare_matched[possible].astype(np.uint16)
+        gram_counts = np.frombuffer(self.gram_counts, dtype=np.int32)
+
+        verified_rows, verified_scores = [], []
+        exact_row = self.rows.get(query.strip())
+        if exact_row is not None:
+            # An exact patient id always ranks first
+            verified_rows.append(np.array([exact_row]))
+            verified_scores.append(np.array([2.0]))
+            keep = candidates != exact_row
+            candidates, rare_matched = candidates[keep], rare_matched[keep]
+
+        frequent_postings = [np.frombuffer(self.postings[gram], dtype=np.int32) for gram in frequent]
+        # Group candidates by level with a stable (radix) sort on the small counts
+        order = np.argsort(rare_matched, kind="stable")[::-1]
+        candidates, rare_matched = candidates[order], rare_matched[order]
+        bounds = np.flatnonzero(np.diff(rare_matched)) + 1
+        kth_score = 0.0
+        starts = np.concatenate(([0], bounds)) if len(candidates) else []
+        for start, end in zip(starts, np.concatenate((bounds, [len(candidates)]))):
+            level = int(rare_matched[start])
+            best = level + len(frequent)
+            if sum(len(scores) for scores in verified_scores) >= limit:
+                kth_score = np.partition(np.concatenate(verified_scores), -limit)[-limit]
+                # Row grams are at least the matched grams, which bounds the Dice term
+                if kth_score >= score(best, best):
+                    break
+            level_rows = candidates[start:end]
+            level_rows = level_rows[score(best, np.maximum(gram_counts[level_rows], best)) >= kth_score]
+            matched = np.full(len(level_rows), level)
+            # Rows and postings share a dtype, or searchsorted converts the whole posting list
+            for postings in frequent_postings:
+                positions = np.minimum(np.searchsorted(postings, level_rows), len(postings) - 1)
+                matched += postings[positions] == level_rows
+            enough = matched >= min_shared
+            verified_rows.append(level_rows[enough])
+            verified_scores.append(score(matched[enough], gram_counts[level_rows[enough]]))
+        del frequent_postings, gram_counts
+
+        if not verified_rows:
+            return []
+        candidates = np.concatenate(verified_rows)
+        scores = np.concatenate(verified_scores)
+        if len(candidates) > limit:
+            top = np.argpartition(-scores, limit - 1)[:limit]
+        else:
+            top = np.arange(len(candidates))
+        top = top[np.lexsort((candidates[top], -scores[top]))]
+        return [
+            {
+                "patient_id": self.patient_ids[candidates[position]],
+                "patient_name": self.names[candidates[position]],
+                "score": round(min(float(scores[position]), 1.0), 4)
+            }
+            for position in top
+        ]
+
+
+class TrigramIndex:
+    """Fuzzy patient name and id lookup, scoped by doctor"""
+
+    def __init__(self):
+        self._doctors: Dict[str, DoctorPatientIndex] = {}
+        self.ready = False
+
+    def add(self, doctor_id: str, patient_id: str, patient_name: Optional[str]) -> bool:
+        """Index a patient; re-adding an unchanged patient is a no-op"""
+        index = self._doctors.get(doctor_id)
+        if index is None:
+            index = self._doctors[doctor_id] = DoctorPatientIndex()
+        return index.add(patient_id, patient_name)
+
+    def contains(self, doctor_id: str, patient_id: str) -> bool:
+        index = self._doctors.get(doctor_id)
+        return index is not None and patient_id in index.rows
+
+    def remove(self, doctor_id: str, patient_id: str) -> bool:
+        index = self._doctors.get(doctor_id)
+        return index.remove(patient_id) if index else False
+
+    def search(self, doctor_id: str, query: str, limit: int = 10) -> List[Dict[str, Any]]:
+        """Best matching patients for a partial or misspelled name or id"""
+        index = self._doctors.get(doctor_id)
+        if index is None or not query.strip():
+            return []
+        return index.search(query, limit)
+
+    def __len__(self) -> int:
+        return sum(len(index.rows) for index in self._doctors.values())
+
+    def metrics(self) -> Dict[str, Any]:
+        rows = sum(len(index.patient_ids) for index in self._doctors.values())
+        return {
+            "ready": self.ready,
+            "doctors": len(self._doctors),
+            "patients": len(self),
+            "tombstones": rows - len(self),
+            "trigrams": sum(len(index.postings) for index in self._doctors.values())
+        }
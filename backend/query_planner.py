@@ -0,0 +1,370 @@
+"""Compile natural-language case queries into a single MongoDB filter.
+
+The planner recognises date ranges, patient ids and names, confidence
+thresholds, file presence, diagnosis and lab terms, and searches whatever text
+is left over. Recognised constraints become equality/range predicates on the
+indexed case fields, so only the residual text needs a regex scan.
+"""
+import calendar
+import re
+from datetime import datetime, timedelta
+from typing import Any, Dict, List, Optional, Tuple
+
+TEXT_SEARCH_FIELDS = [
+    "patient_summary",
+    "analysis_summary.overall_assessment",
+    "analysis_summary.soap_subjective",
+    "analysis_summary.soap_assessment",
+]
+LAB_TERMS = ["cbc", "blood", "lab", "labs", "test", "tests"]
+# Whole words only, or "lab" and "test" would match "available" and "latest"
+LAB_REGEX = r"\b(?:" + "|".join(LAB_TERMS) + r")\b"
+HIGH_CONFIDENCE = 80
+LOW_CONFIDENCE = 50
+
+# Index on (doctor_id, ...) each plan shape is expected to use, for explain output
+INDEX_PATIENT = "doctor_id_1_patient_id_1_created_at_-1_id_-1"
+INDEX_CONFIDENCE = "doctor_id_1_confidence_score_-1"
+INDEX_CREATED = "doctor_id_1_created_at_-1"
+
+MONTHS = {name.lower(): number for number, name in enumerate(calendar.month_name) if name}
+MONTHS.update({name.lower(): number for number, name in enumerate(calendar.month_abbr) if name})
+
+UNIT_DAYS = {"day": 1, "week": 7, "month": 30, "year": 365}
+# "last N years" reaches back at most this far, so huge N cannot overflow a date
+MAX_LOOKBACK_DAYS = 200 * 365
+ISO_DATE = r"(\d{4}-\d{2}-\d{2})"
+# Parsed years stay inside this range so the day or month after a date still exists
+MIN_YEAR, MAX_YEAR = 1, 9998
+MONTH_NAMES = "|".join(sorted(MONTHS, key=len, reverse=True))
+
+# Marks text already turned into a constraint
+CONSUMED = "\x00"
+
+STOPWORDS = {
+    "show", "find", "list", "get", "give", "me", "my", "all", "any", "the", "a", "an", "of", "for",
+    "cases", "case", "patients", "patient", "with", "from", "and", "in", "on", "that", "which",
+    "were", "was", "are", "is", "seen", "please", "what", "who", "have", "had", "has", "to", "by",
+}
+
+
+class QueryPlan:
+    """Parsed constraints of a query and the MongoDB filter compiled from them"""
+
+    def __init__(self, query: str, doctor_id: str):
+        self.query = query
+        self.doctor_id = doctor_id
+        self.date_from: Optional[datetime] = None
+        self.date_to: Optional[datetime] = None
+        self.date_label: Optional[str] = None
+        self.patient_id: Optional[str] = None
+        self.patient_name: Optional[str] = None
+        self.confidence_min: Optional[float] = None
+        self.confidence_max: Optional[float] = None
+        self.has_files: Optional[bool] = None
+        self.diagnosis: Optional[str] = None
+        self.lab_work = False
+        self.text_terms: List[str] = []
+        self.steps: List[str] = []
+
+    def mongo_filter(self) -> Dict[str, Any]:
+        mongo_query: Dict[str, Any] = {"doctor_id": self.doctor_id}
+        and_clauses = []
+
+        if self.date_from or self.date_to:
+            created_at = {}
+            if self.date_from:
+                created_at["$gte"] = self.date_from
+            if self.date_to:
+                created_at["$lt"] = self.date_to
+            mongo_query["created_at"] = created_at
+
+        if self.patient_id:
+            mongo_query["patient_id"] = self.patient_id
+        if self.patient_name:
+            mongo_query["patient_name"] = {"$regex": f"^{re.escape(self.patient_name)}", "$options": "i"}
+
+        if self.confidence_min is not None or self.confidence_max is not None:
+            confidence = {}
+            if self.confidence_min is not None:
+                confidence["$gte"] = self.confidence_min
+            if self.confidence_max is not None:
+                confidence["$lt"] = self.confidence_max
+            mongo_query["confidence_score"] = confidence
+
+        if self.has_files is True:
+            mongo_query["uploaded_files.0"] = {"$exists": True}
+        elif self.has_files is False:
+            mongo_query["uploaded_files.0"] = {"$exists": False}
+
+        if self.diagnosis:
+            mongo_query["analysis_summary.primary_diagnosis"] = {"$regex": re.escape(self.diagnosis), "$options": "i"}
+
+        if self.lab_work:
+            lab_regex = {"$regex": LAB_REGEX, "$options": "i"}
+            and_clauses.append({"$or": [
+                {"patient_summary": lab_regex},
+                {"analysis_summary.investigation_suggestions": lab_regex}
+            ]})
+
+        for term in self.text_terms:
+            text_regex = {"$regex": re.escape(term), "$options": "i"}
+            and_clauses.append({"$or": [{field: text_regex} for field in TEXT_SEARCH_FIELDS]})
+
+        if len(and_clauses) == 1:
+            mongo_query.update(and_clauses[0])
+        elif and_clauses:
+            mongo_query["$and"] = and_clauses
+        return mongo_query
+
+    def expected_index(self) -> str:
+        if self.patient_id:
+            return INDEX_PATIENT
+        if self.confidence_min is not None and not (self.date_from or self.date_to):
+            return INDEX_CONFIDENCE
+        return INDEX_CREATED
+
+    def describe(self) -> str:
+        parts = []
+        if self.date_label:
+            parts.append(self.date_label)
+        if self.patient_id:
+            parts.append(f"for patient {self.patient_id}")
+        if self.patient_name:
+            parts.append(f"for patient {self.patient_name}")
+        if self.diagnosis:
+            parts.append(f"diagnosed with {self.diagnosis}")
+        if self.lab_work:
+            parts.append("with lab/blood work")
+        if self.confidence_min is not None:
+            parts.append(f"with confidence of at least {self.confidence_min:g}")
+        if self.confidence_max is not None:
+            parts.append(f"with confidence below {self.confidence_max:g}")
+        if self.has_files is not None:
+            parts.append("with files" if self.has_files else "without files")
+        if self.text_terms:
+            parts.append("matching " + " and ".join(f"'{term}'" for term in self.text_terms))
+        return " ".join(parts) if parts else "recent"
+
+    def explain(self) -> Dict[str, Any]:
+        return {
+            "query": self.query,
+            "constraints": {
+                "date_from": self.date_from,
+                "date_to": self.date_to,
+                "patient_id": self.patient_id,
+                "patient_name": self.patient_name,
+                "confidence_min": self.confidence_min,
+                "confidence_max": self.confidence_max,
+                "has_files": self.has_files,
+                "diagnosis": self.diagnosis,
+                "lab_work": self.lab_work,
+                "text_terms": self.text_terms,
+            },
+            "steps": self.steps,
+            "filter": self.mongo_filter(),
+            "sort": {"created_at": -1},
+            "expected_index": self.expected_index(),
+        }
+
+
+def start_of_day(value: datetime) -> datetime:
+    return value.replace(hour=0, minute=0, second=0, microsecond=0)
+
+
+def month_range(year: int, month: int) -> Tuple[datetime, datetime]:
+    start = datetime(year, month, 1)
+    end = datetime(year + 1, 1, 1) if month == 12 else datetime(year, month + 1, 1)
+    return start, end
+
+
+def parse_iso_date(value: str) -> Optional[datetime]:
+    try:
+        parsed = datetime.fromisoformat(value)
+    except ValueError:
+        return None
+    return parsed if MIN_YEAR <= parsed.year <= MAX_YEAR else None
+
+
+def has_content(text: str) -> bool:
+    """Whether text has a word that is not a stopword"""
+    return any(word.lower() not in STOPWORDS for word in re.findall(r"[\w'-]+", text))
+
+
+class QueryPlanner:
+    """Extracts constraints from a query one rule at a time, consuming the matched text"""
+
+    def __init__(self, now: Optional[datetime] = None):
+        self.now = now
+
+    def plan(self, query: str, doctor_id: str) -> QueryPlan:
+        plan = QueryPlan(query, doctor_id)
+        now = self.now or datetime.utcnow()
+        remaining = " " + query.strip() + " "
+
+        for rule in (self._dates, self._patient, self._confidence, self._files, self._diagnosis, self._labs):
+            remaining = rule(plan, remaining, now)
+
+        # Text between recognised constraints is searched phrase by phrase
+        for segment in remaining.split(CONSUMED):
+            words = [word for word in re.finditer(r"[\w'-]+", segment) if word.group().lower() not in STOPWORDS]
+            if words:
+                plan.text_terms.append(segment[words[0].start():words[-1].end()])
+                plan.steps.append(f"text search: {plan.text_terms[-1]}")
+        return plan
+
+    @staticmethod
+    def _consume(remaining: str, match: "re.Match") -> str:
+        return remaining[:match.start()] + CONSUMED + remaining[match.end():]
+
+    def _set_dates(self, plan: QueryPlan, start: Optional[datetime], end: Optional[datetime], label: str):
+        plan.date_from, plan.date_to, plan.date_label = start, end, label
+        plan.steps.append(f"date range: {label}")
+
+    def _dates(self, plan: QueryPlan, remaining: str, now: datetime) -> str:
+        today = start_of_day(now)
+        rules = [
+            (rf"\b(?:between|from)\s+{ISO_DATE}\s+(?:and|to|until)\s+{ISO_DATE}\b", "between"),
+            (rf"\b(?:since|after)\s+{ISO_DATE}\b", "since"),
+            (rf"\bbefore\s+{ISO_DATE}\b", "before"),
+            (rf"\b(?:on\s+)?{ISO_DATE}\b", "on"),
+            (r"\b(?:in\s+the\s+)?(?:last|past)\s+(\d+)\s+(day|week|month|year)s?\b", "last_n"),
+            (r"\b(this|last)\s+(week|month)\b", "calendar"),
+            (rf"\b(?:in\s+)?({MONTH_NAMES})\.?(?:\s+(\d{{4}}))?\b", "month"),
+            (r"\byesterday(?:'s)?\b", "yesterday"),
+            (r"\btoday(?:'s)?\b", "today"),
+        ]
+        for pattern, kind in rules:
+            match = re.search(pattern, remaining, re.IGNORECASE)
+            if not match:
+                continue
+            if kind == "between":
+                start, end = parse_iso_date(match.group(1)), parse_iso_date(match.group(2))
+                if not start or not end:
+                    continue
+                self._set_dates(plan, start, end + timedelta(days=1), f"from {match.group(1)} to {match.group(2)}")
+            elif kind == "since":
+                start = parse_iso_date(match.group(1))
+                if not start:
+                    continue
+                self._set_dates(plan, start, None, f"since {match.group(1)}")
+            elif kind == "before":
+                end = parse_iso_date(match.group(1))
+                if not end:
+                    continue
+                self._set_dates(plan, None, end, f"before {match.group(1)}")
+            elif kind == "on":
+                day = parse_iso_date(match.group(1))
+                if not day:
+                    continue
+                self._set_dates(plan, day, day + timedelta(days=1), f"on {match.group(1)}")
+            elif kind == "last_n":
+                count, unit = int(match.group(1)), match.group(2).lower()
+                days = min(count * UNIT_DAYS[unit], MAX_LOOKBACK_DAYS)
+                self._set_dates(plan, today - timedelta(days=max(days - 1, 0)), None,
+                                f"from the last {count} {unit}{'s' if count != 1 else ''}")
+            elif kind == "calendar":
+                which, unit = match.group(1).lower(), match.group(2).lower()
+                if unit == "week":
+                    start = today - timedelta(days=today.weekday())
+                    if which == "last":
+                        start, end = start - timedelta(days=7), start
+                    else:
+                        end = None
+                else:
+                    start, end = month_range(today.year, today.month)
+                    if which == "last":
+                        previous = start - timedelta(days=1)
+                        start, end = month_range(previous.year, previous.month)
+                    else:
+                        end = None
+                self._set_dates(plan, start, end, f"from {which} {unit}")
+            elif kind == "month":
+                month = MONTHS[match.group(1).lower()]
+                # "may" is also a verb; only treat it as a month with an explicit year or "in"
+                if match.group(1).lower() == "may" and not match.group(2) and not match.group(0).lower().startswith("in"):
+                    continue
+                year = int(match.group(2)) if match.group(2) else (today.year if month <= today.month else today.year - 1)
+                if not MIN_YEAR <= year <= MAX_YEAR:
+                    continue
+                start, end = month_range(year, month)
+                self._set_dates(plan, start, end, f"from {calendar.month_name[month]} {year}")
+            elif kind == "yesterday":
+                self._set_dates(plan, today - timedelta(days=1), today, "from yesterday")
+            elif kind == "today":
+                self._set_dates(plan, today, None, "from today")
+            return self._consume(remaining, match)
+        return remaining
+
+    def _patient(self, plan: QueryPlan, remaining: str, now: datetime) -> str:
+        # Ids contain a digit: "patient P001", "patient id 12", "patient #12"
+        match = re.search(r"\bpatient(?:\s+id)?\s*[:#]?\s*([A-Za-z]*\d[\w-]*)", remaining, re.IGNORECASE)
+        if match:
+            plan.patient_id = match.group(1)
+            plan.steps.append(f"patient id equals {plan.patient_id}")
+            return self._consume(remaining, match)
+        # Names are capitalised words after "patient named" or "patient"; only the
+        # keywords ignore case, or "Patient" would swallow the words after it
+        match = re.search(r"\b(?i:patient(?:\s+named|\s+called)?)\s+([A-Z][a-z'-]+(?:\s+[A-Z][a-z'-]+)*)", remaining)
+        if not match:
+            match = re.search(r"\b(?i:named|called)\s+([A-Za-z][a-z'-]+(?:\s+[A-Z][a-z'-]+)*)", remaining)
+        if match:
+            plan.patient_name = match.group(1)
+            plan.steps.append(f"patient name starts with {plan.patient_name}")
+            return self._consume(remaining, match)
+        return remaining
+
+    def _confidence(self, plan: QueryPlan, remaining: str, now: datetime) -> str:
+        match = re.search(
+            r"\bconfidence(?:\s+score)?\s*(?:of\s+)?(>=|>|above|over|at\s+least|<=|<|below|under|at\s+most)\s*(\d+(?:\.\d+)?)\s*%?",
+            remaining, re.IGNORECASE
+        )
+        if match:
+            operator, value = re.sub(r"\s+", " ", match.group(1).lower()), float(match.group(2))
+            if operator in (">=", ">", "above", "over", "at least"):
+                plan.confidence_min = value
+            else:
+                plan.confidence_max = value
+            plan.steps.append(f"confidence {operator} {value:g}")
+            return self._consume(remaining, match)
+        match = re.search(r"\b(high|low)(?:\s+|-)confidence\b", remaining, re.IGNORECASE)
+        if match:
+            if match.group(1).lower() == "high":
+                plan.confidence_min = HIGH_CONFIDENCE
+            else:
+                plan.confidence_max = LOW_CONFIDENCE
+            plan.steps.append(f"{match.group(1).lower()} confidence")
+            return self._consume(remaining, match)
+        return remaining
+
+    def _files(self, plan: QueryPlan, remaining: str, now: datetime) -> str:
+        match = re.search(r"\b(with|has|having|without|no)\s+(?:uploaded\s+)?(?:files?|attachments?|uploads?)\b",
+                          remaining, re.IGNORECASE)
+        if match:
+            plan.has_files = match.group(1).lower() not in ("without", "no")
+            plan.steps.append("has files" if plan.has_files else "has no files")
+            return self._consume(remaining, match)
+        return remaining
+
+    def _diagnosis(self, plan: QueryPlan, remaining: str, now: datetime) -> str:
+        match = re.search(r"\b(?:diagnosed\s+with|diagnosis\s+(?:of\s+)?|diagnosis:\s*)\s*([\w' -]+?)(?=\s*(?:,|;|\.|$|\x00|\b(?:and|from|with|since|before|in|on)\b))",
+                          remaining.rstrip(), re.IGNORECASE)
+        # "diagnosis of" alone must not search for a diagnosis called "of"
+        if match and has_content(match.group(1)):
+            plan.diagnosis = match.group(1).strip()
+            plan.steps.append(f"primary diagnosis contains {plan.diagnosis}")
+            return self._consume(remaining, match)
+        return remaining
+
+    def _labs(self, plan: QueryPlan, remaining: str, now: datetime) -> str:
+        pattern = LAB_REGEX + r"(?:\s+(?:work|results?))?\b"
+        if re.search(pattern, remaining, re.IGNORECASE):
+            plan.lab_work = True
+            plan.steps.append("mentions lab/blood work")
+            return re.sub(pattern, CONSUMED, remaining, flags=re.IGNORECASE)
+        return remaining
+
+
+def plan_case_query(query: str, doctor_id: str, now: Optional[datetime] = None) -> QueryPlan:
+    """Plan a natural-language case query"""
+    return QueryPlanner(now).plan(query, doctor_id)
@@ -0,0 +1,111 @@
+#!/usr/bin/env python3
+"""Offline batch re-analysis of clinical cases.
+
+Examples:
+    python reanalyze.py start --exclude-model current --concurrency 4 --per-minute 60
+    python reanalyze.py start --doctor-id abc --date-from 2025-01-01 --date-to 2025-03-31
+    python reanalyze.py resume <job_id>
+    python reanalyze.py status <job_id>
+"""
+import argparse
+import asyncio
+import json
+
+from server import (
+    CLINICAL_ANALYSIS_MODEL,
+    ReanalysisFilters,
+    ReanalysisJobCreate,
+    ReanalysisRunner,
+    audit_writer,
+    client,
+    db,
+    json_default,
+)
+
+PROGRESS_INTERVAL = 10
+
+
+def resolve_model(model):
+    """Allow `current` as a shorthand for the model analyze_case uses today"""
+    return CLINICAL_ANALYSIS_MODEL if model == "current" else model
+
+
+async def report_progress(runner: ReanalysisRunner):
+    while True:
+        await asyncio.sleep(PROGRESS_INTERVAL)
+        progress = runner.progress()
+        eta = f"{progress['eta_seconds']}s" if progress["eta_seconds"] is not None else "unknown"
+        print(
+            f"[{runner.job_id}] {progress['processed']}/{progress['total']} processed, "
+            f"{progress['succeeded']} ok, {progress['failed']} failed, {progress['conflicts']} conflicts, "
+            f"{progress['cases_per_minute']} cases/min, ETA {eta}",
+            flush=True
+        )
+
+
+async def run_job(runner: ReanalysisRunner):
+    print(f"Running re-analysis job {runner.job_id} over {runner.total} cases")
+    reporter = asyncio.create_task(report_progress(runner))
+    try:
+        await runner.run()
+    finally:
+        reporter.cancel()
+    print(json.dumps(runner.progress(), indent=2))
+
+
+async def main(args):
+    try:
+        if args.command == "start":
+            runner = await ReanalysisRunner.create(ReanalysisJobCreate(
+                filters=ReanalysisFilters(
+                    doctor_id=args.doctor_id,
+                    date_from=args.date_from,
+                    date_to=args.date_to,
+                    model=resolve_model(args.model),
+                    exclude_model=resolve_model(args.exclude_model),
+                    only_analyzed=not args.include_unanalyzed
+                ),
+                concurrency=args.concurrency,
+                per_minute=args.per_minute
+            ))
+            await run_job(runner)
+        elif args.command == "resume":
+            runner = await ReanalysisRunner.load(args.job_id)
+            if not runner:
+                raise SystemExit(f"Job {args.job_id} not found")
+            await run_job(runner)
+        elif args.command == "status":
+            job = await db.reanalysis_jobs.find_one({"id": args.job_id}, {"_id": 0})
+            if not job:
+                raise SystemExit(f"Job {args.job_id} not found")
+            print(json.dumps(job, indent=2, default=json_default))
+    finally:
+        await audit_writer.stop()
+        client.close()
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Re-run clinical analysis over existing cases")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    start = subparsers.add_parser("start", help="Start a new re-analysis job")
+    start.add_argument("--doctor-id")
+    start.add_argument("--date-from", help="ISO date, inclusive")
+    start.add_argument("--date-to", help="ISO date, inclusive")
+    start.add_argument("--model", help="Only cases last analyzed by this model ('current' for the current one)")
+    start.add_argument("--exclude-model", help="Skip cases already analyzed by this model ('current' for the current one)")
+    start.add_argument("--include-unanalyzed", action="store_true", help="Also analyze cases never analyzed before")
+    start.add_argument("--concurrency", type=int, default=2)
+    start.add_argument("--per-minute", type=int, default=30, help="Maximum analyses started per minute, 0 for no limit")
+
+    resume = subparsers.add_parser("resume", help="Resume an interrupted job from its checkpoint")
+    resume.add_argument("job_id")
+
+    status = subparsers.add_parser("status", help="Show the checkpointed state of a job")
+    status.add_argument("job_id")
+
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    asyncio.run(main(parse_args()))
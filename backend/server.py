@@ -1,20 +1,46 @@
-from fastapi import FastAPI, APIRouter, File, UploadFile, Form, HTTPException
+from fastapi import FastAPI, APIRouter, File, UploadFile, Form, HTTPException, Request
 from fastapi.staticfiles import StaticFiles
+from fastapi.responses import FileResponse, Response, StreamingResponse
 from dotenv import load_dotenv
 from starlette.middleware.cors import CORSMiddleware
+from starlette.datastructures import Headers, MutableHeaders
+from starlette.requests import ClientDisconnect
 from motor.motor_asyncio import AsyncIOMotorClient
+from pymongo import ReturnDocument, UpdateOne
+from pymongo.errors import BulkWriteError, DuplicateKeyError, OperationFailure, PyMongoError
 import os
 import logging
 from pathlib import Path
-from pydantic import BaseModel, Field
-from typing import List, Optional, Dict, Any
+from pydantic import BaseModel, Field, ValidationError
+from typing import List, Optional, Dict, Any, Tuple
 import uuid
-from datetime import datetime
+import abc
+from datetime import datetime, timedelta, timezone
+from email.utils import format_datetime, parsedate_to_datetime
 import aiofiles
 import base64
 import mimetypes
 import asyncio
+import brotli
+import copy
+import gzip
+import hashlib
 import io
+import csv
+import json
+import re
+import time
+import zipfile
+import zlib
+from collections import OrderedDict, deque
+import orjson
+import multipart
+from multipart.multipart import parse_options_header
+import redis.asyncio as aioredis
+import zstandard
+from lab_trends import canonical_test, collect_observations, compute_lab_trends
+from patient_search import TrigramIndex
+from query_planner import plan_case_query
 
 # Import Gemini integration
 from emergentintegrations.llm.chat import LlmChat, UserMessage, FileContentWithMimeType
@@ -36,8 +62,155 @@ mongo_url = os.environ['MONGO_URL']
 client = AsyncIOMotorClient(mongo_url)
 db = client[os.environ['DB_NAME']]
 
+# Response Serialization
+def json_default(value: Any) -> Any:
+    """JSON fallback serializing datetimes as ISO strings and anything else (e.g. ObjectId) as str"""
+    if hasattr(value, "isoformat"):
+        return value.isoformat()
+    return str(value)
+
+class FastJSONResponse(Response):
+    """JSON response rendered with orjson, which serializes datetimes natively.
+    
+    Returning one directly from an endpoint also skips FastAPI's
+    jsonable_encoder/response_model pass, so raw MongoDB documents
+    (fetched without `_id`) can be sent as-is.
+    """
+    media_type = "application/json"
+    
+    def render(self, content: Any) -> bytes:
+        return orjson.dumps(content, default=json_default, option=orjson.OPT_NON_STR_KEYS)
+
+# Conditional Requests and Compression
+COMPRESSION_MINIMUM_SIZE = 1024
+
+def case_etag(case: Dict[str, Any]) -> str:
+    """Strong ETag of a case, changing with every write (version) or update time"""
+    updated_at = case.get("updated_at")
+    stamp = int(updated_at.replace(tzinfo=timezone.utc).timestamp() * 1000) if hasattr(updated_at, "timestamp") else 0
+    return f'"{case["id"]}-{case.get("version", 0)}-{stamp}"'
+
+def case_list_etag(cases: List[Dict[str, Any]], variant: str = "") -> str:
+    """Weak ETag of a case listing, derived from the ETags of its cases"""
+    digest = hashlib.sha1(variant.encode())
+    for case in cases:
+        digest.update(case_etag(case).encode())
+    return f'W/"{digest.hexdigest()}"'
+
+def http_date(value: datetime) -> str:
+    return format_datetime(value.replace(tzinfo=timezone.utc, microsecond=0), usegmt=True)
+
+def is_not_modified(request: Request, etag: str, last_modified: Optional[datetime] = None) -> bool:
+    """Evaluate If-None-Match (preferred) or If-Modified-Since against the current representation"""
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match:
+        candidates = [tag.strip() for tag in if_none_match.split(",")]
+        # Weak comparison, as required for If-None-Match
+        bare_etag = etag[2:] if etag.startswith("W/") else etag
+        return "*" in candidates or any(
+            (tag[2:] if tag.startswith("W/") else tag) == bare_etag for tag in candidates
+        )
+    if_modified_since = request.headers.get("if-modified-since")
+    if if_modified_since and last_modified:
+        try:
+            since = parsedate_to_datetime(if_modified_since).astimezone(timezone.utc).replace(tzinfo=None)
+        except (TypeError, ValueError):
+            return False
+        return last_modified.replace(microsecond=0) <= since
+    return False
+
+def conditional_json_response(request: Request, content: Any, etag: str,
+                              last_modified: Optional[datetime] = None) -> Response:
+    """Return 304 when the client's copy is current, otherwise the JSON body with validators"""
+    headers = {"ETag": etag, "Cache-Control": "no-cache"}
+    if last_modified:
+        headers["Last-Modified"] = http_date(last_modified)
+    if is_not_modified(request, etag, last_modified):
+        return Response(status_code=304, headers=headers)
+    return FastJSONResponse(content, headers=headers)
+
+def negotiate_encoding(accept_encoding: str, available: Tuple[str, ...] = ("br", "gzip")) -> Optional[str]:
+    """Pick one of the available codings from an Accept-Encoding header, honoring q-values (q=0 refuses a coding)"""
+    qualities = {}
+    for item in accept_encoding.split(","):
+        coding, _, params = item.strip().partition(";")
+        quality = 1.0
+        for param in params.split(";"):
+            name, _, value = param.strip().partition("=")
+            if name.lower() == "q":
+                try:
+                    quality = float(value)
+                except ValueError:
+                    quality = 0.0
+        if coding:
+            qualities[coding.strip().lower()] = quality
+    wildcard = qualities.get("*", 0.0)
+    candidates = [(qualities.get(coding, wildcard), coding) for coding in available]
+    quality, encoding = max(candidates, key=lambda candidate: candidate[0])
+    return encoding if quality > 0 else None
+
+def weaken_etag(headers: MutableHeaders):
+    """Mark the ETag weak, since compressed and identity bodies are not byte-identical"""
+    etag = headers.get("etag")
+    if etag and not etag.startswith("W/"):
+        headers["ETag"] = f"W/{etag}"
+
+class JSONCompressionMiddleware:
+    """Compress complete JSON responses with brotli or gzip, as negotiated.
+    
+    Streaming responses (exports, event streams) are passed through
+    untouched, so they are never buffered.
+    """
+    
+    def __init__(self, app, minimum_size: int = COMPRESSION_MINIMUM_SIZE):
+        self.app = app
+        self.minimum_size = minimum_size
+    
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        encoding = negotiate_encoding(Headers(scope=scope).get("accept-encoding", ""))
+        if encoding is None:
+            await self.app(scope, receive, send)
+            return
+        
+        start_message = None
+        
+        async def send_compressed(message):
+            nonlocal start_message
+            if message["type"] == "http.response.start":
+                # Hold the headers back until the body shows whether to compress
+                start_message = message
+                return
+            if message["type"] == "http.response.body" and start_message is not None:
+                headers = MutableHeaders(raw=start_message["headers"])
+                body = message.get("body", b"")
+                if (not message.get("more_body", False)
+                        and len(body) >= self.minimum_size
+                        and headers.get("content-type", "").startswith("application/json")
+                        and "content-encoding" not in headers):
+                    body = brotli.compress(body, quality=5) if encoding == "br" else gzip.compress(body, compresslevel=6)
+                    headers["Content-Encoding"] = encoding
+                    headers["Content-Length"] = str(len(body))
+                    headers.add_vary_header("Accept-Encoding")
+                    weaken_etag(headers)
+                    message = {**message, "body": body}
+                elif start_message["status"] == 304:
+                    # Revalidates a copy that may have been compressed
+                    weaken_etag(headers)
+                await send(start_message)
+                start_message = None
+            await send(message)
+        
+        await self.app(scope, receive, send_compressed)
+
 # Create the main app without a prefix
-app = FastAPI(title="Clinical Insight Assistant API", version="1.0.0")
+app = FastAPI(
+    title="Clinical Insight Assistant API",
+    version="1.0.0",
+    default_response_class=FastJSONResponse
+)
 
 # Configure CORS for Railway deployment
 app.add_middleware(
@@ -68,6 +241,10 @@ GEMINI_API_KEY = os.environ.get('GEMINI_API_KEY')
 if not GEMINI_API_KEY:
     raise ValueError("GEMINI_API_KEY environment variable is required")
 
+# Gemini models used for analysis, recorded on every stored analysis run
+FILE_ANALYSIS_MODEL = "gemini-2.5-pro-preview-05-06"
+CLINICAL_ANALYSIS_MODEL = "gemini-2.5-flash-preview-04-17"
+
 # Define Models
 class ClinicalCase(BaseModel):
     id: str = Field(default_factory=lambda: str(uuid.uuid4()))
@@ -79,8 +256,13 @@ class ClinicalCase(BaseModel):
     doctor_id: str = "default_doctor"  # Simple auth for now
     doctor_name: Optional[str] = None  # Doctor name
     uploaded_files: List[Dict[str, Any]] = Field(default_factory=list)
-    analysis_result: Optional[Dict[str, Any]] = None
+    analysis_result: Optional[Dict[str, Any]] = None  # Loaded lazily from case_analyses
+    analysis_id: Optional[str] = None  # Latest run in case_analyses
+    analysis_version: int = 0  # Number of analysis runs
+    analysis_summary: Optional[Dict[str, Any]] = None  # Searchable fields of the latest run
+    analysis_model: Optional[str] = None  # Model that produced the latest run
     confidence_score: Optional[float] = None
+    version: int = 0  # Incremented on every write, used for compare-and-swap updates
     created_at: datetime = Field(default_factory=datetime.utcnow)
     updated_at: datetime = Field(default_factory=datetime.utcnow)
 
@@ -98,7 +280,7 @@ class ClinicalAnalysisResult(BaseModel):
     differential_diagnoses: List[Dict[str, Any]]
     treatment_recommendations: List[str]
     investigation_suggestions: List[str]
-    file_interpretations: List[Dict[str, str]]
+    file_interpretations: List[Dict[str, Any]]
     confidence_score: float
     overall_assessment: str
 
@@ -149,136 +331,1972 @@ class AuditLog(BaseModel):
     timestamp: datetime = Field(default_factory=datetime.utcnow)
     ip_address: Optional[str] = None
 
-class SearchFilters(BaseModel):
-    doctor_id: str = "default_doctor"
-    date_from: Optional[str] = None
-    date_to: Optional[str] = None
-    confidence_min: Optional[float] = None
-    has_files: Optional[bool] = None
-    search_text: Optional[str] = None
-async def analyze_individual_files(uploaded_files: List[Dict[str, Any]]) -> List[Dict[str, str]]:
-    """Analyze each uploaded file individually to get per-file interpretations"""
-    file_interpretations = []
+class ReanalysisFilters(BaseModel):
+    doctor_id: Optional[str] = None
+    date_from: Optional[str] = None
+    date_to: Optional[str] = None
+    model: Optional[str] = None  # Only cases whose latest analysis came from this model
+    exclude_model: Optional[str] = None  # Skip cases already analyzed by this model
+    only_analyzed: bool = True  # Skip cases that were never analyzed
+
+class ReanalysisJobCreate(BaseModel):
+    filters: ReanalysisFilters = Field(default_factory=ReanalysisFilters)
+    concurrency: int = 2
+    per_minute: int = 30
+
+class SearchFilters(BaseModel):
+    doctor_id: str = "default_doctor"
+    date_from: Optional[str] = None
+    date_to: Optional[str] = None
+    confidence_min: Optional[float] = None
+    has_files: Optional[bool] = None
+    search_text: Optional[str] = None
+    skip: int = 0
+    limit: int = 100
+    facets: bool = False
+
+class BatchPdfExportRequest(BaseModel):
+    case_ids: Optional[List[str]] = None
+    # Owner of the listed case_ids; filters carry their own doctor_id
+    doctor_id: Optional[str] = None
+    filters: Optional[SearchFilters] = None
+
+# Case List Projections
+# Fields always returned by list/search endpoints; heavy fields are opt-in via `fields=`
+CASE_SUMMARY_FIELDS = [
+    "id", "patient_id", "patient_name", "patient_age", "patient_gender",
+    "doctor_id", "doctor_name", "confidence_score", "version", "analysis_id", "analysis_version",
+    "created_at", "updated_at"
+]
+CASE_OPTIONAL_FIELDS = ["patient_summary", "uploaded_files", "analysis_result"]
+CASE_SUMMARY_PREVIEW_LENGTH = 200
+
+def parse_case_fields(fields: Optional[str]) -> List[str]:
+    """Parse a comma separated `fields=` parameter into extra case fields"""
+    if not fields:
+        return []
+    requested = [field.strip() for field in fields.split(",") if field.strip()]
+    unknown = [field for field in requested if field not in CASE_OPTIONAL_FIELDS]
+    if unknown:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Unknown fields: {', '.join(unknown)}. Allowed: {', '.join(CASE_OPTIONAL_FIELDS)}"
+        )
+    return requested
+
+def build_case_summary_projection(extra_fields: Optional[List[str]] = None) -> Dict[str, Any]:
+    """Build a $project stage returning lightweight case summaries computed inside MongoDB"""
+    extra_fields = extra_fields or []
+    projection: Dict[str, Any] = {"_id": 0}
+    for field in CASE_SUMMARY_FIELDS:
+        projection[field] = 1
+    
+    projection["file_count"] = {"$size": {"$ifNull": ["$uploaded_files", []]}}
+    projection["has_analysis"] = {"$gt": ["$analysis_id", None]}
+    projection["primary_diagnosis"] = "$analysis_summary.primary_diagnosis"
+    
+    # Only a preview of the summary unless the full text is requested
+    if "patient_summary" not in extra_fields:
+        projection["patient_summary"] = {
+            "$substrCP": [{"$ifNull": ["$patient_summary", ""]}, 0, CASE_SUMMARY_PREVIEW_LENGTH]
+        }
+    
+    for field in extra_fields:
+        projection[field] = 1
+    
+    return projection
+
+async def attach_analysis_results(cases: List[Dict[str, Any]]):
+    """Load the latest analysis result of each case in a single query"""
+    analysis_ids = [case["analysis_id"] for case in cases if case.get("analysis_id")]
+    results = {}
+    if analysis_ids:
+        async for analysis in db.case_analyses.find({"id": {"$in": analysis_ids}}, {"_id": 0, "id": 1, "result": 1}):
+            results[analysis["id"]] = analysis["result"]
+    for case in cases:
+        if case.get("analysis_id"):
+            case["analysis_result"] = results.get(case["analysis_id"])
+
+def case_summary_stages(limit: int, extra_fields: Optional[List[str]] = None,
+                        sort: Optional[Dict[str, int]] = None, skip: int = 0) -> List[Dict[str, Any]]:
+    """Pipeline stages turning matched cases into a sorted page of summaries"""
+    stages: List[Dict[str, Any]] = [{"$sort": sort or {"created_at": -1}}]
+    if skip:
+        stages.append({"$skip": skip})
+    stages.append({"$limit": limit})
+    stages.append({"$project": build_case_summary_projection(extra_fields)})
+    return stages
+
+async def find_case_summaries(query: Dict[str, Any], limit: int = 100,
+                              extra_fields: Optional[List[str]] = None,
+                              sort: Optional[Dict[str, int]] = None, skip: int = 0) -> List[Dict[str, Any]]:
+    """Find cases matching a query and return summary projections, newest first by default"""
+    extra_fields = extra_fields or []
+    pipeline = [{"$match": query}] + case_summary_stages(limit, extra_fields, sort, skip)
+    cases = await db.clinical_cases.aggregate(pipeline).to_list(limit)
+    if "analysis_result" in extra_fields:
+        await attach_analysis_results(cases)
+    return cases
+
+def summarize_query_explain(explain: Dict[str, Any]) -> Dict[str, Any]:
+    """Indexes and work done by the winning plan of a find explain"""
+    index_names = []
+    
+    def collect(stage: Dict[str, Any]):
+        if stage.get("indexName"):
+            index_names.append(stage["indexName"])
+        for child in [stage.get("inputStage")] + stage.get("inputStages", []):
+            if child:
+                collect(child)
+    
+    winning_plan = explain.get("queryPlanner", {}).get("winningPlan", {})
+    collect(winning_plan.get("queryPlan", winning_plan))
+    stats = explain.get("executionStats", {})
+    return {
+        "indexes_used": index_names,
+        "collection_scan": not index_names,
+        "keys_examined": stats.get("totalKeysExamined"),
+        "documents_examined": stats.get("totalDocsExamined"),
+        "returned": stats.get("nReturned"),
+        "execution_ms": stats.get("executionTimeMillis")
+    }
+
+def parse_date_filter(value: str, name: str) -> datetime:
+    """Parse an ISO 8601 date filter, rejecting bad input with a 400"""
+    try:
+        return datetime.fromisoformat(value)
+    except ValueError:
+        raise HTTPException(status_code=400, detail=f"{name} must be an ISO 8601 date")
+
+def build_search_query(filters: SearchFilters) -> Dict[str, Any]:
+    """Translate search filters into a MongoDB case query"""
+    mongo_query = {"doctor_id": filters.doctor_id}
+    
+    # Date range filter
+    if filters.date_from or filters.date_to:
+        date_filter = {}
+        if filters.date_from:
+            date_filter["$gte"] = parse_date_filter(filters.date_from, "date_from")
+        if filters.date_to:
+            date_filter["$lte"] = parse_date_filter(filters.date_to, "date_to")
+        mongo_query["created_at"] = date_filter
+    
+    # Confidence score filter
+    if filters.confidence_min is not None:
+        mongo_query["confidence_score"] = {"$gte": filters.confidence_min}
+    
+    # Alternatives of different filters must all hold, so each goes into its own $and clause
+    alternatives = []
+    
+    # Files filter
+    if filters.has_files is not None:
+        if filters.has_files:
+            mongo_query["uploaded_files"] = {"$ne": [], "$exists": True}
+        else:
+            alternatives.append([
+                {"uploaded_files": {"$size": 0}},
+                {"uploaded_files": {"$exists": False}}
+            ])
+    
+    # Text search
+    if filters.search_text:
+        text_regex = {"$regex": filters.search_text, "$options": "i"}
+        alternatives.append([
+            {"patient_summary": text_regex},
+            {"analysis_summary.overall_assessment": text_regex},
+            {"analysis_summary.soap_subjective": text_regex},
+            {"analysis_summary.soap_assessment": text_regex}
+        ])
+    
+    if len(alternatives) == 1:
+        mongo_query["$or"] = alternatives[0]
+    elif alternatives:
+        mongo_query["$and"] = [{"$or": clauses} for clauses in alternatives]
+    
+    return mongo_query
+
+# Search Facets
+# Counts over every matching case, computed by a $facet pass next to the indexed page
+# query. The facets only group, so no blocking sort runs over the whole match
+SEARCH_MAX_LIMIT = 100
+SEARCH_FACET_TOP_DIAGNOSES = 10
+
+def build_search_facets() -> Dict[str, List[Dict[str, Any]]]:
+    """Facet sub-pipelines for confidence bands, weeks, files and diagnoses"""
+    return {
+        "total": [{"$count": "count"}],
+        "confidence": [
+            {"$match": {"confidence_score": {"$ne": None}}},
+            {"$group": {
+                "_id": {"$min": [{"$multiply": [{"$floor": {"$divide": ["$confidence_score", 10]}}, 10]}, 90]},
+                "count": {"$sum": 1}
+            }}
+        ],
+        "weeks": [
+            {"$group": {"_id": {"$dateToString": {"format": "%G-W%V", "date": "$created_at"}}, "count": {"$sum": 1}}},
+            {"$sort": {"_id": 1}}
+        ],
+        "files": [
+            {"$group": {"_id": {"$gt": [{"$size": {"$ifNull": ["$uploaded_files", []]}}, 0]}, "count": {"$sum": 1}}}
+        ],
+        "diagnoses": [
+            {"$match": {"analysis_summary.primary_diagnosis": {"$nin": [None, ""]}}},
+            {"$sortByCount": "$analysis_summary.primary_diagnosis"},
+            {"$limit": SEARCH_FACET_TOP_DIAGNOSES}
+        ]
+    }
+
+def format_search_facets(raw: Dict[str, List[Dict[str, Any]]]) -> Dict[str, Any]:
+    """Shape raw $facet output for the API"""
+    files = {row["_id"]: row["count"] for row in raw["files"]}
+    return {
+        "total": raw["total"][0]["count"] if raw["total"] else 0,
+        "confidence_histogram": {
+            confidence_bucket(row["_id"]): row["count"]
+            for row in sorted(raw["confidence"], key=lambda row: row["_id"])
+        },
+        "cases_per_week": {row["_id"]: row["count"] for row in raw["weeks"]},
+        "files": {"with_files": files.get(True, 0), "without_files": files.get(False, 0)},
+        "top_diagnoses": [{"diagnosis": row["_id"], "count": row["count"]} for row in raw["diagnoses"]]
+    }
+
+# Change Stream Fanout
+# Caches and indexes follow writes from other workers through one database-wide
+# change stream per worker instead of one stream each. Without change streams
+# (standalone server) or while the stream is down they fall back to their own
+# expiry, and are told when events may have been missed.
+CHANGE_STREAM_MAX_BACKOFF = 300
+
+class ChangeStreamConsumer:
+    """A reader of the shared change stream: which events it wants and how it recovers.
+    
+    on_change(change) handles one event. on_open(resumed) runs whenever the
+    stream opens, resumed being False when it could not continue where it left
+    off; on_lost() runs whenever it closes. `match` narrows what the server
+    sends for this consumer, so on_change may still see other events of its
+    collections.
+    """
+    
+    def __init__(self, name: str, collections: List[str], operations: List[str], on_change,
+                 document_fields: Optional[List[str]] = None, match: Optional[Dict[str, Any]] = None,
+                 on_open=None, on_lost=None):
+        self.name = name
+        self.collections = set(collections)
+        self.operations = set(operations)
+        self.on_change = on_change
+        self.document_fields = document_fields or []
+        self.match = match or {}
+        self.on_open = on_open
+        self.on_lost = on_lost
+
+class ChangeStreamFanout:
+    """Follows one change stream and hands each event to the consumers of its collection"""
+    
+    def __init__(self):
+        self.consumers: List[ChangeStreamConsumer] = []
+        self.active = False
+        self.stats = {"events": 0, "consumer_errors": 0, "disconnects": 0}
+    
+    def register(self, consumer: ChangeStreamConsumer) -> ChangeStreamConsumer:
+        self.consumers.append(consumer)
+        return consumer
+    
+    def pipeline(self) -> List[Dict[str, Any]]:
+        clauses = [
+            {
+                "ns.coll": {"$in": sorted(consumer.collections)},
+                "operationType": {"$in": sorted(consumer.operations)},
+                **consumer.match
+            }
+            for consumer in self.consumers
+        ]
+        # Events carry only what some consumer reads
+        projection = {"ns": 1, "operationType": 1, "documentKey": 1}
+        for consumer in self.consumers:
+            projection.update({f"fullDocument.{field}": 1 for field in consumer.document_fields})
+        return [{"$match": {"$or": clauses}}, {"$project": projection}]
+    
+    def _dispatch(self, change: Dict[str, Any]):
+        collection, operation = change["ns"]["coll"], change["operationType"]
+        for consumer in self.consumers:
+            if collection in consumer.collections and operation in consumer.operations:
+                try:
+                    consumer.on_change(change)
+                except Exception as e:
+                    self.stats["consumer_errors"] += 1
+                    logging.error(f"Change stream consumer {consumer.name} error: {str(e)}")
+    
+    async def _lost(self):
+        self.active = False
+        for consumer in self.consumers:
+            if consumer.on_lost:
+                try:
+                    await consumer.on_lost()
+                except Exception as e:
+                    logging.error(f"Change stream consumer {consumer.name} recovery error: {str(e)}")
+    
+    async def run(self):
+        resume_token = None
+        backoff = 1
+        while True:
+            error = None
+            try:
+                async with db.watch(self.pipeline(), full_document="updateLookup", resume_after=resume_token) as stream:
+                    self.active = True
+                    backoff = 1
+                    for consumer in self.consumers:
+                        if consumer.on_open:
+                            await consumer.on_open(resume_token is not None)
+                    async for change in stream:
+                        self.stats["events"] += 1
+                        self._dispatch(change)
+                        resume_token = stream.resume_token
+                # The stream was invalidated (database dropped); it cannot be resumed
+                resume_token = None
+            except asyncio.CancelledError:
+                self.active = False
+                raise
+            except PyMongoError as e:
+                if isinstance(e, OperationFailure):
+                    # History lost, or change streams are unsupported (standalone server)
+                    resume_token = None
+                error = e
+            self.stats["disconnects"] += 1
+            # Changes may have been missed while disconnected
+            await self._lost()
+            if error is not None:
+                logging.warning(f"Change stream unavailable, retrying in {backoff}s: {str(error)}")
+                await asyncio.sleep(backoff)
+                backoff = min(backoff * 2, CHANGE_STREAM_MAX_BACKOFF)
+    
+    def metrics(self) -> Dict[str, Any]:
+        return {"active": self.active, "consumers": [consumer.name for consumer in self.consumers], **self.stats}
+
+change_stream_fanout = ChangeStreamFanout()
+
+# Case Read Cache
+# Bounded LRU/TTL cache of case documents. Local writes invalidate entries
+# directly; writes from other workers arrive through a change stream.
+CASE_CACHE_SIZE = int(os.environ.get('CASE_CACHE_SIZE', '1000'))
+CASE_CACHE_TTL = float(os.environ.get('CASE_CACHE_TTL', '30'))
+
+class CaseCache:
+    """LRU cache of case documents with a time-to-live per entry.
+    
+    Readers capture `generation()` before reading a case from the database;
+    `set` drops the document if the case was invalidated after that, so a
+    read racing a write cannot cache the old version.
+    """
+    
+    def __init__(self, max_size: int = CASE_CACHE_SIZE, ttl: float = CASE_CACHE_TTL):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._entries: "OrderedDict[str, tuple]" = OrderedDict()
+        # MongoDB _id -> case id, since change events only carry the _id
+        self._object_ids: Dict[Any, str] = {}
+        # Case id or _id -> generation of its latest invalidation, oldest first.
+        # Reads captured before `_horizon` may have lost their record and are not cached
+        self._clock = 0
+        self._horizon = 0
+        self._invalidated: "OrderedDict[Any, int]" = OrderedDict()
+        self.stats = {"hits": 0, "misses": 0, "stale": 0, "expired": 0, "evictions": 0, "invalidations": 0}
+    
+    def generation(self) -> int:
+        return self._clock
+    
+    def get(self, case_id: str) -> Optional[Dict[str, Any]]:
+        entry = self._entries.get(case_id)
+        if entry is None:
+            self.stats["misses"] += 1
+            return None
+        expires_at, object_id, case = entry
+        if expires_at < time.monotonic():
+            self._remove(case_id)
+            self.stats["expired"] += 1
+            self.stats["misses"] += 1
+            return None
+        self._entries.move_to_end(case_id)
+        self.stats["hits"] += 1
+        return copy.deepcopy(case)
+    
+    def set(self, case_id: str, object_id: Any, case: Dict[str, Any], generation: int):
+        """Store a case read at `generation`, unless it was invalidated since"""
+        if generation < self._horizon or max(
+            self._invalidated.get(case_id, 0), self._invalidated.get(object_id, 0)
+        ) > generation:
+            self.stats["stale"] += 1
+            return
+        if case_id in self._entries:
+            self._remove(case_id)
+        self._entries[case_id] = (time.monotonic() + self.ttl, object_id, copy.deepcopy(case))
+        self._object_ids[object_id] = case_id
+        while len(self._entries) > self.max_size:
+            oldest_id = next(iter(self._entries))
+            self._remove(oldest_id)
+            self.stats["evictions"] += 1
+    
+    def _record_invalidation(self, key: Any):
+        self._clock += 1
+        self._invalidated[key] = self._clock
+        self._invalidated.move_to_end(key)
+        while len(self._invalidated) > self.max_size:
+            _, self._horizon = self._invalidated.popitem(last=False)
+    
+    def invalidate(self, case_id: str):
+        self._record_invalidation(case_id)
+        if case_id in self._entries:
+            self._remove(case_id)
+            self.stats["invalidations"] += 1
+    
+    def invalidate_object_id(self, object_id: Any):
+        # Recorded even when not cached, as a read of this case may be in flight
+        self._record_invalidation(object_id)
+        case_id = self._object_ids.get(object_id)
+        if case_id:
+            self.invalidate(case_id)
+    
+    def clear(self):
+        self._entries.clear()
+        self._object_ids.clear()
+        self._invalidated.clear()
+        self._clock += 1
+        self._horizon = self._clock
+    
+    def _remove(self, case_id: str):
+        _, object_id, _ = self._entries.pop(case_id)
+        self._object_ids.pop(object_id, None)
+    
+    def metrics(self) -> Dict[str, Any]:
+        lookups = self.stats["hits"] + self.stats["misses"]
+        return {
+            "size": len(self._entries),
+            "capacity": self.max_size,
+            "ttl_seconds": self.ttl,
+            **self.stats,
+            "hit_ratio": round(self.stats["hits"] / lookups, 4) if lookups else 0.0,
+            "change_stream_active": change_stream_fanout.active
+        }
+
+case_cache = CaseCache()
+
+async def get_cached_case(case_id: str) -> Optional[Dict[str, Any]]:
+    """Get a case document (without _id) through the read cache.
+    
+    For reads only: a cached copy can trail the database by up to
+    CASE_CACHE_TTL, so writes that compare-and-set on version read the case
+    from the database instead.
+    """
+    case = case_cache.get(case_id)
+    if case is not None:
+        return case
+    generation = case_cache.generation()
+    case = await db.clinical_cases.find_one({"id": case_id})
+    if not case:
+        return None
+    object_id = case.pop("_id")
+    case_cache.set(case_id, object_id, case, generation)
+    return case
+
+def with_case_defaults(case: Dict[str, Any]) -> Dict[str, Any]:
+    """Fill fields missing from legacy case documents with their ClinicalCase defaults"""
+    for name, field in ClinicalCase.model_fields.items():
+        if name not in case and not field.is_required():
+            case[name] = field.get_default(call_default_factory=True)
+    return case
+
+async def clear_case_cache():
+    case_cache.clear()
+
+# Invalidate cached cases on writes from any worker
+change_stream_fanout.register(ChangeStreamConsumer(
+    "case_cache", ["clinical_cases"], ["update", "replace", "delete"],
+    on_change=lambda change: case_cache.invalidate_object_id(change["documentKey"]["_id"]),
+    on_lost=clear_case_cache
+))
+
+# Case Change Feed
+# Per-doctor Server-Sent Events backed by a MongoDB change stream over cases and
+# feedback. Each process runs one shared stream while clients are connected and
+# fans its events out to them by doctor. Event ids are change stream resume
+# tokens, so a reconnecting client (EventSource sends Last-Event-ID) first
+# replays exactly what it missed from its own short-lived stream.
+CHANGE_FEED_HEARTBEAT = 15
+CHANGE_FEED_RETRY_MS = 5000
+CHANGE_FEED_MAX_AWAIT_MS = 1000
+CHANGE_FEED_QUEUE_SIZE = int(os.environ.get('CHANGE_FEED_QUEUE_SIZE', '1000'))
+
+def build_change_feed_pipeline(doctor_id: Optional[str] = None) -> List[Dict[str, Any]]:
+    """Change stream pipeline keeping one doctor's (or every doctor's) events, trimmed to compact deltas"""
+    match: Dict[str, Any] = {
+        "ns.coll": {"$in": ["clinical_cases", "case_feedback"]},
+        "operationType": {"$in": ["insert", "update", "replace"]}
+    }
+    if doctor_id is not None:
+        match["fullDocument.doctor_id"] = doctor_id
+    return [
+        {"$match": match},
+        {"$project": {
+            "operationType": 1,
+            "ns": 1,
+            "changed_fields": {"$map": {
+                "input": {"$objectToArray": {"$ifNull": ["$updateDescription.updatedFields", {}]}},
+                "in": "$$this.k"
+            }},
+            # Same shape as the list summaries, so clients can merge deltas directly
+            "document": {
+                "id": "$fullDocument.id",
+                "case_id": "$fullDocument.case_id",
+                "feedback_type": "$fullDocument.feedback_type",
+                "patient_id": "$fullDocument.patient_id",
+                "patient_name": "$fullDocument.patient_name",
+                "patient_age": "$fullDocument.patient_age",
+                "patient_gender": "$fullDocument.patient_gender",
+                "doctor_id": "$fullDocument.doctor_id",
+                "doctor_name": "$fullDocument.doctor_name",
+                "patient_summary": {"$cond": [
+                    {"$eq": ["$ns.coll", "clinical_cases"]},
+                    {"$substrCP": [{"$ifNull": ["$fullDocument.patient_summary", ""]}, 0, CASE_SUMMARY_PREVIEW_LENGTH]},
+                    "$$REMOVE"
+                ]},
+                "file_count": {"$cond": [
+                    {"$eq": ["$ns.coll", "clinical_cases"]},
+                    {"$size": {"$ifNull": ["$fullDocument.uploaded_files", []]}},
+                    "$$REMOVE"
+                ]},
+                "has_analysis": {"$cond": [
+                    {"$eq": ["$ns.coll", "clinical_cases"]},
+                    {"$gt": ["$fullDocument.analysis_id", None]},
+                    "$$REMOVE"
+                ]},
+                "primary_diagnosis": "$fullDocument.analysis_summary.primary_diagnosis",
+                "confidence_score": "$fullDocument.confidence_score",
+                "analysis_version": "$fullDocument.analysis_version",
+                "version": "$fullDocument.version",
+                "created_at": "$fullDocument.created_at",
+                "updated_at": "$fullDocument.updated_at"
+            }
+        }}
+    ]
+
+def change_to_delta(change: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+    """Classify a change event into a dashboard delta"""
+    document = change.get("document", {})
+    if change["ns"]["coll"] == "case_feedback":
+        if change["operationType"] != "insert":
+            return None
+        return {"type": "feedback_submitted", "feedback": document}
+    
+    if change["operationType"] == "insert":
+        event_type = "case_created"
+    else:
+        changed_fields = change.get("changed_fields", [])
+        if "analysis_id" in changed_fields:
+            event_type = "analysis_completed"
+        elif any(field.startswith("uploaded_files") for field in changed_fields):
+            event_type = "files_added"
+        else:
+            event_type = "case_updated"
+    return {"type": event_type, "case": document}
+
+def format_sse(event_type: str, data: Any = None, event_id: Optional[str] = None) -> bytes:
+    lines = []
+    if event_id:
+        lines.append(f"id: {event_id}")
+    lines.append(f"event: {event_type}")
+    lines.append(f"data: {orjson.dumps(data, default=json_default).decode()}")
+    return ("\n".join(lines) + "\n\n").encode()
+
+class CaseEventSubscription:
+    """One SSE client's queue of (event type, data, resume token) messages"""
+    
+    def __init__(self, doctor_id: str, queue_size: int):
+        self.doctor_id = doctor_id
+        self.queue: asyncio.Queue = asyncio.Queue(queue_size)
+        # Set when the client fell too far behind and must reconnect
+        self.dropped = False
+
+class CaseEventHub:
+    """Fans one per-process change stream out to the SSE clients of each doctor.
+    
+    The stream is opened by the first subscriber and closed once the last one
+    leaves. A client whose queue fills up is dropped; it reconnects with its
+    last event id and catches up from there.
+    """
+    
+    def __init__(self, queue_size: int = CHANGE_FEED_QUEUE_SIZE):
+        self.queue_size = queue_size
+        self._subscriptions: Dict[str, set] = {}
+        self._task: Optional[asyncio.Task] = None
+        self.last_token: Optional[str] = None
+        self.active = False
+        self.stats = {"events": 0, "delivered": 0, "dropped_clients": 0}
+    
+    def subscribe(self, doctor_id: str) -> CaseEventSubscription:
+        subscription = CaseEventSubscription(doctor_id, self.queue_size)
+        self._subscriptions.setdefault(doctor_id, set()).add(subscription)
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run())
+        return subscription
+    
+    def unsubscribe(self, subscription: CaseEventSubscription):
+        subscriptions = self._subscriptions.get(subscription.doctor_id)
+        if subscriptions is not None:
+            subscriptions.discard(subscription)
+            if not subscriptions:
+                del self._subscriptions[subscription.doctor_id]
+    
+    def _publish(self, doctor_id: Optional[str], message: tuple):
+        for subscription in list(self._subscriptions.get(doctor_id, ())):
+            try:
+                subscription.queue.put_nowait(message)
+                self.stats["delivered"] += 1
+            except asyncio.QueueFull:
+                subscription.dropped = True
+                self.unsubscribe(subscription)
+                self.stats["dropped_clients"] += 1
+    
+    def _publish_all(self, message: tuple):
+        for doctor_id in list(self._subscriptions):
+            self._publish(doctor_id, message)
+    
+    async def _run(self):
+        resume_token = None
+        backoff = 1
+        while self._subscriptions:
+            try:
+                async with db.watch(
+                    build_change_feed_pipeline(),
+                    full_document="updateLookup",
+                    resume_after=resume_token,
+                    max_await_time_ms=CHANGE_FEED_MAX_AWAIT_MS
+                ) as stream:
+                    self.active = True
+                    backoff = 1
+                    while self._subscriptions:
+                        change = await stream.try_next()
+                        if stream.resume_token:
+                            resume_token = stream.resume_token
+                            self.last_token = resume_token["_data"]
+                        if change is None:
+                            continue
+                        delta = change_to_delta(change)
+                        if delta:
+                            self.stats["events"] += 1
+                            doctor_id = change.get("document", {}).get("doctor_id")
+                            self._publish(doctor_id, (delta["type"], delta, self.last_token))
+            except OperationFailure as e:
+                self.active = False
+                if resume_token is None:
+                    # Change streams need a replica set; tell the clients to keep polling
+                    logging.warning(f"Case change feed unavailable: {str(e)}")
+                    self._publish_all(("unavailable", {"detail": "Live updates are not available"}, None))
+                    return
+                # The resume point fell out of the oplog; clients must reload fully
+                logging.warning(f"Case change feed resume failed, resetting clients: {str(e)}")
+                self._publish_all(("reset", {"detail": "Missed changes could not be replayed, reload required"}, None))
+                resume_token = None
+            except PyMongoError as e:
+                self.active = False
+                logging.error(f"Case change feed error, retrying in {backoff}s: {str(e)}")
+                await asyncio.sleep(backoff)
+                backoff = min(backoff * 2, 300)
+        self.active = False
+    
+    def close(self):
+        if self._task is not None:
+            self._task.cancel()
+    
+    def metrics(self) -> Dict[str, Any]:
+        return {
+            "clients": sum(len(subscriptions) for subscriptions in self._subscriptions.values()),
+            "doctors": len(self._subscriptions),
+            "change_stream_active": self.active,
+            **self.stats
+        }
+
+case_event_hub = CaseEventHub()
+
+async def replay_case_events(doctor_id: str, resume_from: str):
+    """Yield (event type, data, token) for one doctor's changes after a resume token, until caught up"""
+    async with db.watch(
+        build_change_feed_pipeline(doctor_id),
+        full_document="updateLookup",
+        resume_after={"_data": resume_from},
+        max_await_time_ms=CHANGE_FEED_MAX_AWAIT_MS
+    ) as stream:
+        while True:
+            change = await stream.try_next()
+            if change is None:
+                return
+            delta = change_to_delta(change)
+            if delta:
+                yield delta["type"], delta, stream.resume_token["_data"]
+
+async def case_event_stream(request: Request, doctor_id: str, resume_from: Optional[str] = None):
+    """Yield SSE messages for one doctor until the client disconnects"""
+    yield f"retry: {CHANGE_FEED_RETRY_MS}\n\n".encode()
+    # Subscribed before the replay, so nothing falls between the two
+    subscription = case_event_hub.subscribe(doctor_id)
+    try:
+        replayed_until = None
+        if resume_from:
+            try:
+                async for event_type, data, token in replay_case_events(doctor_id, resume_from):
+                    yield format_sse(event_type, data, token)
+                    replayed_until = token
+            except OperationFailure as e:
+                # The resume point fell out of the oplog; the client must reload fully
+                logging.warning(f"Change feed resume failed, resetting client: {str(e)}")
+                yield format_sse("reset", {"detail": "Missed changes could not be replayed, reload required"})
+        
+        last_heartbeat = time.monotonic()
+        while not await request.is_disconnected():
+            if subscription.dropped:
+                # The client reconnects with its last event id and replays the rest
+                return
+            try:
+                event_type, data, token = await asyncio.wait_for(
+                    subscription.queue.get(), CHANGE_FEED_MAX_AWAIT_MS / 1000
+                )
+            except asyncio.TimeoutError:
+                if time.monotonic() - last_heartbeat >= CHANGE_FEED_HEARTBEAT:
+                    # Heartbeats carry the latest token so idle clients resume from now
+                    yield format_sse("heartbeat", {"time": datetime.utcnow()}, case_event_hub.last_token)
+                    last_heartbeat = time.monotonic()
+                continue
+            # Resume tokens of one deployment sort in change order
+            if token and replayed_until and token <= replayed_until:
+                continue
+            yield format_sse(event_type, data, token)
+            if event_type == "unavailable":
+                return
+    finally:
+        case_event_hub.unsubscribe(subscription)
+
+# Query Result Cache
+# Rendered /query and /cases/search responses per doctor. Every write to a
+# doctor's cases or feedback bumps that doctor's generation, which makes all of
+# their cached entries stale at once without scanning the cache. Entries are
+# evicted least recently used first once either the entry count or the total
+# size of the cached bodies is over budget.
+QUERY_CACHE_SIZE = int(os.environ.get('QUERY_CACHE_SIZE', '2000'))
+QUERY_CACHE_TTL = float(os.environ.get('QUERY_CACHE_TTL', '60'))
+QUERY_CACHE_MAX_BYTES = int(os.environ.get('QUERY_CACHE_MAX_MB', '64')) * 1024 * 1024
+
+class QueryResultCache:
+    """LRU/TTL cache of response bodies keyed by doctor, query kind and fingerprint"""
+    
+    def __init__(self, max_size: int = QUERY_CACHE_SIZE, ttl: float = QUERY_CACHE_TTL,
+                 max_bytes: int = QUERY_CACHE_MAX_BYTES):
+        self.max_size = max_size
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self._entries: "OrderedDict[tuple, tuple]" = OrderedDict()
+        self._bytes = 0
+        self._generations: Dict[str, int] = {}
+        self.stats = {"hits": 0, "misses": 0, "stale": 0, "expired": 0, "evictions": 0, "invalidations": 0,
+                      "too_large": 0}
+        self.kind_stats: Dict[str, Dict[str, int]] = {}
+    
+    @staticmethod
+    def fingerprint(*parts: Any) -> str:
+        return hashlib.sha1(orjson.dumps(parts, default=json_default, option=orjson.OPT_SORT_KEYS)).hexdigest()
+    
+    def generation(self, doctor_id: str) -> int:
+        return self._generations.get(doctor_id, 0)
+    
+    def get(self, doctor_id: str, kind: str, fingerprint: str) -> Optional[bytes]:
+        kind_stats = self.kind_stats.setdefault(kind, {"hits": 0, "misses": 0})
+        key = (doctor_id, kind, fingerprint)
+        entry = self._entries.get(key)
+        if entry is not None:
+            expires_at, generation, body = entry
+            if generation != self.generation(doctor_id):
+                self._remove(key)
+                self.stats["stale"] += 1
+            elif expires_at < time.monotonic():
+                self._remove(key)
+                self.stats["expired"] += 1
+            else:
+                self._entries.move_to_end(key)
+                self.stats["hits"] += 1
+                kind_stats["hits"] += 1
+                return body
+        self.stats["misses"] += 1
+        kind_stats["misses"] += 1
+        return None
+    
+    def set(self, doctor_id: str, kind: str, fingerprint: str, generation: int, body: bytes):
+        """Store a body computed at `generation`; stale at once if a write landed meanwhile"""
+        key = (doctor_id, kind, fingerprint)
+        if key in self._entries:
+            self._remove(key)
+        if len(body) > self.max_bytes:
+            # Would flush the whole cache and still not fit
+            self.stats["too_large"] += 1
+            return
+        self._entries[key] = (time.monotonic() + self.ttl, generation, body)
+        self._bytes += len(body)
+        while len(self._entries) > self.max_size or self._bytes > self.max_bytes:
+            self._remove(next(iter(self._entries)))
+            self.stats["evictions"] += 1
+    
+    def _remove(self, key: tuple):
+        _, _, body = self._entries.pop(key)
+        self._bytes -= len(body)
+    
+    def bump(self, *doctor_ids: Optional[str]):
+        for doctor_id in set(doctor_ids):
+            if doctor_id:
+                self._generations[doctor_id] = self.generation(doctor_id) + 1
+                self.stats["invalidations"] += 1
+    
+    def clear(self):
+        self._entries.clear()
+        self._bytes = 0
+        for doctor_id in self._generations:
+            self._generations[doctor_id] += 1
+    
+    def metrics(self) -> Dict[str, Any]:
+        lookups = self.stats["hits"] + self.stats["misses"]
+        return {
+            "size": len(self._entries),
+            "capacity": self.max_size,
+            "bytes": self._bytes,
+            "max_bytes": self.max_bytes,
+            "ttl_seconds": self.ttl,
+            "change_stream_active": change_stream_fanout.active,
+            "hit_ratio": round(self.stats["hits"] / lookups, 3) if lookups else None,
+            **self.stats,
+            "by_kind": self.kind_stats
+        }
+
+query_cache = QueryResultCache()
+
+def cached_json_response(body: bytes) -> Response:
+    return Response(content=body, media_type="application/json", headers={"X-Cache": "hit"})
+
+def invalidate_query_results(change: Dict[str, Any]):
+    """Bump the doctor generation of a case or feedback write"""
+    doctor_id = (change.get("fullDocument") or {}).get("doctor_id")
+    if doctor_id:
+        query_cache.bump(doctor_id)
+    else:
+        # Deletes carry no document, so the owner is unknown
+        query_cache.clear()
+
+async def clear_query_cache():
+    query_cache.clear()
+
+change_stream_fanout.register(ChangeStreamConsumer(
+    "query_cache", ["clinical_cases", "case_feedback"], ["insert", "update", "replace", "delete"],
+    on_change=invalidate_query_results, document_fields=["doctor_id"], on_lost=clear_query_cache
+))
+
+# Case Update Helpers
+def case_version_filter(case: Dict[str, Any]) -> Dict[str, Any]:
+    """Build a compare-and-swap filter matching a case at the version it was read"""
+    version = case.get("version")
+    if version is None:
+        # Cases created before versioning was introduced
+        return {"id": case["id"], "version": {"$exists": False}}
+    return {"id": case["id"], "version": version}
+
+async def push_case_files(case_id: str, uploaded_files: List[Dict[str, Any]]) -> bool:
+    """Atomically append uploaded files to a case without rewriting the document"""
+    case = await db.clinical_cases.find_one_and_update(
+        {"id": case_id},
+        {
+            "$push": {"uploaded_files": {"$each": uploaded_files}},
+            "$set": {"updated_at": datetime.utcnow()},
+            "$inc": {"version": 1}
+        },
+        projection={"_id": 0, "doctor_id": 1}
+    )
+    case_cache.invalidate(case_id)
+    if case:
+        query_cache.bump(case.get("doctor_id"))
+    return case is not None
+
+async def set_case_fields_if_unchanged(case: Dict[str, Any], fields: Dict[str, Any]) -> bool:
+    """Set fields on a case only if nobody else wrote it since it was read"""
+    fields = {**fields, "updated_at": datetime.utcnow()}
+    result = await db.clinical_cases.update_one(
+        case_version_filter(case),
+        {"$set": fields, "$inc": {"version": 1}}
+    )
+    case_cache.invalidate(case["id"])
+    query_cache.bump(case.get("doctor_id"))
+    return result.modified_count > 0
+
+# Dashboard Rollup Helpers
+# Per-doctor counters kept in dashboard_rollups and updated with $inc on writes
+ROLLUP_RECONCILE_INTERVAL = int(os.environ.get('ROLLUP_RECONCILE_INTERVAL', '3600'))
+ROLLUP_RETENTION_DAYS = 365
+
+def confidence_bucket(confidence_score: Optional[float]) -> Optional[str]:
+    """Map a confidence score to its 10-point histogram bucket ("0" ... "90")"""
+    if confidence_score is None:
+        return None
+    bucket = int(max(0, min(float(confidence_score), 99.999)) // 10) * 10
+    return str(bucket)
+
+async def increment_rollup(doctor_id: Optional[str], increments: Dict[str, int]):
+    """Apply counter increments to a doctor's dashboard rollup"""
+    if not doctor_id or not increments:
+        return
+    try:
+        await db.dashboard_rollups.update_one(
+            {"doctor_id": doctor_id},
+            {"$inc": increments, "$set": {"updated_at": datetime.utcnow()}},
+            upsert=True
+        )
+    except Exception as e:
+        logging.error(f"Rollup update error: {str(e)}")
+
+async def record_case_created_rollup(case: Dict[str, Any]):
+    """Count a new case towards its doctor's per-day totals"""
+    await record_cases_created_rollup([case])
+
+async def record_cases_created_rollup(cases: List[Dict[str, Any]]):
+    """Count new cases towards per-day totals with one update per doctor"""
+    increments_by_doctor: Dict[str, Dict[str, int]] = {}
+    for case in cases:
+        increments = increments_by_doctor.setdefault(case.get("doctor_id"), {"cases_total": 0})
+        day_key = f"cases_per_day.{case['created_at'].strftime('%Y-%m-%d')}"
+        increments["cases_total"] += 1
+        increments[day_key] = increments.get(day_key, 0) + 1
+    for doctor_id, increments in increments_by_doctor.items():
+        await increment_rollup(doctor_id, increments)
+
+async def record_analysis_rollup(case: Dict[str, Any], confidence_score: Optional[float], file_count: int):
+    """Count an analysis run, moving the case to its new confidence bucket"""
+    increments = {"analyses_total": 1, "files_analyzed": file_count}
+    previous_bucket = confidence_bucket(case.get("confidence_score"))
+    new_bucket = confidence_bucket(confidence_score)
+    if previous_bucket != new_bucket:
+        if previous_bucket is not None:
+            increments[f"confidence_histogram.{previous_bucket}"] = -1
+        if new_bucket is not None:
+            increments[f"confidence_histogram.{new_bucket}"] = 1
+    await increment_rollup(case.get("doctor_id"), increments)
+
+async def record_feedback_rollup(feedback: Dict[str, Any]):
+    """Count submitted feedback by type"""
+    if feedback.get("feedback_type") in ("positive", "negative"):
+        await increment_rollup(feedback.get("doctor_id"), {f"feedback.{feedback['feedback_type']}": 1})
+
+async def reconcile_rollups():
+    """Recompute all dashboard rollups from the source collections.
+    
+    Increments racing a reconciliation may be overwritten; the next run
+    corrects them.
+    """
+    rollups: Dict[str, Dict[str, Any]] = {}
+    
+    def rollup_for(doctor_id: str) -> Dict[str, Any]:
+        return rollups.setdefault(doctor_id, {
+            "cases_total": 0,
+            "cases_per_day": {},
+            "confidence_histogram": {},
+            "analyses_total": 0,
+            "files_analyzed": 0,
+            "feedback": {"positive": 0, "negative": 0}
+        })
+    
+    since = datetime.utcnow() - timedelta(days=ROLLUP_RETENTION_DAYS)
+    async for row in db.clinical_cases.aggregate([
+        {"$group": {"_id": "$doctor_id", "count": {"$sum": 1}}}
+    ]):
+        rollup_for(row["_id"])["cases_total"] = row["count"]
+    
+    async for row in db.clinical_cases.aggregate([
+        {"$match": {"created_at": {"$gte": since}}},
+        {"$group": {
+            "_id": {
+                "doctor_id": "$doctor_id",
+                "day": {"$dateToString": {"format": "%Y-%m-%d", "date": "$created_at"}}
+            },
+            "count": {"$sum": 1}
+        }}
+    ]):
+        rollup_for(row["_id"]["doctor_id"])["cases_per_day"][row["_id"]["day"]] = row["count"]
+    
+    async for row in db.clinical_cases.aggregate([
+        {"$match": {"confidence_score": {"$ne": None}}},
+        {"$group": {
+            "_id": {
+                "doctor_id": "$doctor_id",
+                "bucket": {"$min": [{"$multiply": [{"$floor": {"$divide": ["$confidence_score", 10]}}, 10]}, 90]}
+            },
+            "count": {"$sum": 1}
+        }}
+    ]):
+        bucket = confidence_bucket(row["_id"]["bucket"])
+        rollup_for(row["_id"]["doctor_id"])["confidence_histogram"][bucket] = row["count"]
+    
+    async for row in db.case_analyses.aggregate([
+        {"$group": {"_id": "$doctor_id", "runs": {"$sum": 1}, "files": {"$sum": "$file_count"}}}
+    ]):
+        rollup = rollup_for(row["_id"])
+        rollup["analyses_total"] = row["runs"]
+        rollup["files_analyzed"] = row["files"]
+    
+    async for row in db.case_feedback.aggregate([
+        {"$match": {"feedback_type": {"$in": ["positive", "negative"]}}},
+        {"$group": {"_id": {"doctor_id": "$doctor_id", "type": "$feedback_type"}, "count": {"$sum": 1}}}
+    ]):
+        rollup_for(row["_id"]["doctor_id"])["feedback"][row["_id"]["type"]] = row["count"]
+    
+    now = datetime.utcnow()
+    for doctor_id, rollup in rollups.items():
+        if not doctor_id:
+            continue
+        await db.dashboard_rollups.update_one(
+            {"doctor_id": doctor_id},
+            {"$set": {**rollup, "updated_at": now, "reconciled_at": now}},
+            upsert=True
+        )
+    logging.info(f"Reconciled dashboard rollups for {len(rollups)} doctors")
+
+async def run_rollup_reconciliation():
+    """Periodically reconcile dashboard rollups and the patient index against the source collections"""
+    # Migrated analyses increment the rollups, so the first reconciliation
+    # must see the collections after the migration has finished
+    try:
+        await migrate_embedded_analyses()
+    except Exception as e:
+        logging.error(f"Analysis migration error: {str(e)}")
+    while True:
+        try:
+            await reconcile_rollups()
+        except Exception as e:
+            logging.error(f"Rollup reconciliation error: {str(e)}")
+        try:
+            await reconcile_patients()
+        except Exception as e:
+            logging.error(f"Patient index reconciliation error: {str(e)}")
+        await asyncio.sleep(ROLLUP_RECONCILE_INTERVAL)
+
+# Patient Index
+# One document per (doctor_id, patient_id) in `patients`, upserted on case
+# writes and rebuilt by the periodic reconciliation.
+PATIENT_TIMELINE_MAX_LIMIT = 100
+
+def patient_case_update(case: Dict[str, Any]) -> UpdateOne:
+    demographics = {
+        field: case[field]
+        for field in ("patient_name", "patient_age", "patient_gender")
+        if case.get(field) not in (None, "")
+    }
+    return UpdateOne(
+        {"doctor_id": case["doctor_id"], "patient_id": case["patient_id"]},
+        {
+            "$set": {**demographics, "updated_at": datetime.utcnow()},
+            "$inc": {"case_count": 1},
+            "$min": {"first_case_at": case["created_at"]},
+            "$max": {"last_case_at": case["created_at"]}
+        },
+        upsert=True
+    )
+
+async def record_patient_cases(cases: List[Dict[str, Any]]):
+    """Add new cases to their patients' index entries"""
+    updates = [patient_case_update(case) for case in cases if case.get("patient_id")]
+    if not updates:
+        return
+    try:
+        await db.patients.bulk_write(updates, ordered=False)
+    except Exception as e:
+        # The periodic reconciliation repairs missed updates
+        logging.error(f"Patient index update error: {str(e)}")
+        return
+    for case in cases:
+        # A case without a name keeps the name already on the patient entry
+        if case.get("patient_id") and (
+            case.get("patient_name") or not patient_name_index.contains(case["doctor_id"], case["patient_id"])
+        ):
+            patient_name_index.add(case["doctor_id"], case["patient_id"], case.get("patient_name"))
+
+async def record_patient_analysis(case: Dict[str, Any]):
+    """Count a stored analysis on the patient entry, which invalidates cached lab trends"""
+    if not case.get("patient_id"):
+        return
+    try:
+        await db.patients.update_one(
+            {"doctor_id": case["doctor_id"], "patient_id": case["patient_id"]},
+            {"$inc": {"analysis_count": 1}, "$set": {"updated_at": datetime.utcnow()}}
+        )
+    except Exception as e:
+        logging.error(f"Patient index update error: {str(e)}")
+
+async def reconcile_patients():
+    """Rebuild the patient index from the cases collection"""
+    await db.clinical_cases.aggregate([
+        {"$match": {"patient_id": {"$nin": [None, ""]}}},
+        {"$sort": {"created_at": 1}},
+        {"$group": {
+            "_id": {"doctor_id": "$doctor_id", "patient_id": "$patient_id"},
+            "patient_name": {"$last": "$patient_name"},
+            "patient_age": {"$last": "$patient_age"},
+            "patient_gender": {"$last": "$patient_gender"},
+            "case_count": {"$sum": 1},
+            "first_case_at": {"$min": "$created_at"},
+            "last_case_at": {"$max": "$created_at"}
+        }},
+        {"$project": {
+            "_id": 0,
+            "doctor_id": "$_id.doctor_id",
+            "patient_id": "$_id.patient_id",
+            "patient_name": 1,
+            "patient_age": 1,
+            "patient_gender": 1,
+            "case_count": 1,
+            "first_case_at": 1,
+            "last_case_at": 1,
+            "updated_at": "$$NOW"
+        }},
+        {"$merge": {"into": "patients", "on": ["doctor_id", "patient_id"], "whenMatched": "merge", "whenNotMatched": "insert"}}
+    ]).to_list(None)
+    logging.info("Reconciled patient index")
+
+# Patient Name Index
+# Fuzzy name and id lookup over an in-memory trigram index of `patients`.
+# Each worker loads the index at startup, indexes its own case writes
+# directly and follows other workers' writes through a change stream.
+PATIENT_SEARCH_MAX_LIMIT = 50
+PATIENT_INDEX_LOAD_BATCH = int(os.environ.get('PATIENT_INDEX_LOAD_BATCH', '5000'))
+
+patient_name_index = TrigramIndex()
+
+async def load_patient_name_index():
+    """Index every patient entry, yielding to the event loop between batches"""
+    loaded = 0
+    async for patient in db.patients.find(
+        {}, {"_id": 0, "doctor_id": 1, "patient_id": 1, "patient_name": 1}
+    ).batch_size(PATIENT_INDEX_LOAD_BATCH):
+        patient_name_index.add(patient["doctor_id"], patient["patient_id"], patient.get("patient_name"))
+        loaded += 1
+        if loaded % PATIENT_INDEX_LOAD_BATCH == 0:
+            await asyncio.sleep(0)
+    patient_name_index.ready = True
+    logging.info(f"Indexed {loaded} patients for name search")
+
+def index_patient_change(change: Dict[str, Any]):
+    patient = change.get("fullDocument")
+    if patient:
+        patient_name_index.add(patient["doctor_id"], patient["patient_id"], patient.get("patient_name"))
+
+async def reload_patient_name_index(resumed: bool):
+    # Loading after the stream opens replays writes made during the load
+    if not resumed or not patient_name_index.ready:
+        await load_patient_name_index()
+
+async def ensure_patient_name_index():
+    if not patient_name_index.ready:
+        # Without change streams this worker's index follows its own writes only
+        await load_patient_name_index()
+
+# Follow patient entry writes from any worker; patient entries are updated with
+# every case, so only name changes are sent
+change_stream_fanout.register(ChangeStreamConsumer(
+    "patient_name_index", ["patients"], ["insert", "replace", "update"],
+    on_change=index_patient_change, document_fields=["doctor_id", "patient_id", "patient_name"],
+    match={"$or": [
+        {"operationType": {"$ne": "update"}},
+        {"updateDescription.updatedFields.patient_name": {"$exists": True}}
+    ]},
+    on_open=reload_patient_name_index, on_lost=ensure_patient_name_index
+))
+
+# Lab Trend Cache
+# Trends are recomputed only when the patient gains a case or an analysis,
+# detected through the counters on the patient index entry.
+LAB_TREND_CACHE_SIZE = int(os.environ.get('LAB_TREND_CACHE_SIZE', '500'))
+
+class LabTrendCache:
+    """LRU cache of computed lab trends per patient, validated by a patient stamp"""
+    
+    def __init__(self, max_size: int = LAB_TREND_CACHE_SIZE):
+        self.max_size = max_size
+        self._entries: "OrderedDict[tuple, tuple]" = OrderedDict()
+        self.stats = {"hits": 0, "misses": 0, "compute_ms_total": 0.0}
+    
+    @staticmethod
+    def stamp(patient: Dict[str, Any]) -> tuple:
+        return (patient.get("case_count"), patient.get("last_case_at"), patient.get("analysis_count", 0))
+    
+    def get(self, patient: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        key = (patient["doctor_id"], patient["patient_id"])
+        entry = self._entries.get(key)
+        if entry and entry[0] == self.stamp(patient):
+            self._entries.move_to_end(key)
+            self.stats["hits"] += 1
+            return entry[1]
+        self.stats["misses"] += 1
+        return None
+    
+    def set(self, patient: Dict[str, Any], trends: Dict[str, Any]):
+        key = (patient["doctor_id"], patient["patient_id"])
+        self._entries[key] = (self.stamp(patient), trends)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+    
+    def metrics(self) -> Dict[str, Any]:
+        lookups = self.stats["hits"] + self.stats["misses"]
+        return {
+            "size": len(self._entries),
+            "hit_ratio": round(self.stats["hits"] / lookups, 3) if lookups else None,
+            "avg_compute_ms": round(self.stats["compute_ms_total"] / self.stats["misses"], 2) if self.stats["misses"] else None,
+            **self.stats
+        }
+
+lab_trend_cache = LabTrendCache()
+
+async def load_patient_lab_trends(patient: Dict[str, Any]) -> Dict[str, Any]:
+    """Lab trends across all analyzed cases of a patient"""
+    trends = lab_trend_cache.get(patient)
+    if trends is not None:
+        return trends
+    
+    started = time.perf_counter()
+    cases = await db.clinical_cases.find(
+        {"doctor_id": patient["doctor_id"], "patient_id": patient["patient_id"]},
+        {"_id": 0, "id": 1, "created_at": 1, "analysis_id": 1, "analysis_result.file_interpretations": 1}
+    ).to_list(None)
+    analysis_ids = [case["analysis_id"] for case in cases if case.get("analysis_id")]
+    results = {}
+    if analysis_ids:
+        async for analysis in db.case_analyses.find(
+            {"id": {"$in": analysis_ids}}, {"_id": 0, "id": 1, "result.file_interpretations": 1}
+        ):
+            results[analysis["id"]] = analysis["result"]
+    
+    # Cases not yet migrated still carry their analysis inline
+    observations = collect_observations(
+        (case["id"], case["created_at"], results.get(case.get("analysis_id")) or case.get("analysis_result"))
+        for case in cases
+    )
+    trends = compute_lab_trends(observations)
+    lab_trend_cache.stats["compute_ms_total"] += (time.perf_counter() - started) * 1000
+    lab_trend_cache.set(patient, trends)
+    return trends
+
+# Analysis Storage Helpers
+def build_analysis_summary(result: Dict[str, Any]) -> Dict[str, Any]:
+    """Extract the fields of an analysis result kept on the case for listing and search"""
+    diagnoses = result.get("differential_diagnoses") or []
+    soap_note = result.get("soap_note") or {}
+    return {
+        "primary_diagnosis": diagnoses[0].get("diagnosis") if diagnoses else None,
+        "overall_assessment": result.get("overall_assessment"),
+        "soap_subjective": soap_note.get("subjective"),
+        "soap_assessment": soap_note.get("assessment"),
+        "investigation_suggestions": result.get("investigation_suggestions", [])
+    }
+
+async def store_case_analysis(case: Dict[str, Any], result: Dict[str, Any],
+                              model: Optional[str] = CLINICAL_ANALYSIS_MODEL,
+                              created_at: Optional[datetime] = None) -> Optional[Dict[str, Any]]:
+    """Store an analysis run as a new version and point the case at it.
+    
+    Returns None if the case was modified since it was read, in which case
+    the stored run is discarded again.
+    """
+    analysis_doc = {
+        "id": str(uuid.uuid4()),
+        "case_id": case["id"],
+        "doctor_id": case.get("doctor_id"),
+        "version": (case.get("analysis_version") or 0) + 1,
+        "model": model,
+        "file_count": len(case.get("uploaded_files") or []),
+        "confidence_score": result.get("confidence_score"),
+        "result": result,
+        "created_at": created_at or datetime.utcnow()
+    }
+    try:
+        await db.case_analyses.insert_one(analysis_doc)
+    except DuplicateKeyError:
+        # A concurrent run already claimed this version number
+        return None
+    analysis_doc.pop("_id", None)
+    
+    stored = await set_case_fields_if_unchanged(case, {
+        "analysis_id": analysis_doc["id"],
+        "analysis_version": analysis_doc["version"],
+        "analysis_summary": build_analysis_summary(result),
+        "analysis_model": model,
+        "analysis_result": None,
+        "confidence_score": result.get("confidence_score")
+    })
+    if not stored:
+        await db.case_analyses.delete_one({"id": analysis_doc["id"]})
+        return None
+    
+    await record_analysis_rollup(case, analysis_doc["confidence_score"], analysis_doc["file_count"])
+    await record_patient_analysis(case)
+    
+    return analysis_doc
+
+async def load_case_analysis(case: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+    """Lazily load the latest analysis result of a case"""
+    if case.get("analysis_id"):
+        analysis = await db.case_analyses.find_one({"id": case["analysis_id"]}, {"_id": 0, "result": 1})
+        return analysis["result"] if analysis else None
+    # Cases analyzed before results moved to their own collection
+    return case.get("analysis_result")
+
+async def migrate_embedded_analyses():
+    """Move analysis results still embedded in case documents into case_analyses"""
+    migrated = 0
+    cursor = db.clinical_cases.find({"analysis_result": {"$ne": None}, "analysis_id": None})
+    async for case in cursor:
+        try:
+            stored = await store_case_analysis(
+                case, case["analysis_result"], model=None, created_at=case.get("updated_at")
+            )
+            if stored:
+                migrated += 1
+        except Exception as e:
+            logging.error(f"Analysis migration error for case {case.get('id')}: {str(e)}")
+    if migrated:
+        logging.info(f"Migrated {migrated} embedded analysis results to case_analyses")
+
+async def analyze_individual_files(uploaded_files: List[Dict[str, Any]]) -> List[Dict[str, str]]:
+    """Analyze each uploaded file individually to get per-file interpretations"""
+    file_interpretations = []
+    for file_info in uploaded_files:
+        file_interpretation = await analyze_single_file(file_info)
+        if file_interpretation is not None:
+            file_interpretations.append(file_interpretation)
+    return file_interpretations
+
+async def analyze_single_file(file_info: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+    """Interpret one uploaded file; None if the file is missing on disk"""
+    if not os.path.exists(file_info["file_path"]):
+        return None
+        
+    try:
+        # Create a new Gemini chat instance for individual file analysis
+        session_id = f"file-analysis-{uuid.uuid4()}"
+        chat = LlmChat(
+            api_key=GEMINI_API_KEY,
+            session_id=session_id,
+            system_message="""You are a medical file analysis specialist. Analyze the provided medical file and return a structured interpretation.
+            
+            For lab files (CSV/PDF): Extract and interpret lab values, identify abnormal results, clinical significance.
+            For medical images: Describe findings, identify abnormalities, suggest differential diagnoses.
+            For text files: Summarize key medical information and clinical relevance.
+            
+            Respond in JSON format:
+            {
+                "file_type": "lab_report|medical_image|text_document",
+                "key_findings": ["finding1", "finding2"],
+                "abnormal_values": ["abnormal1", "abnormal2"],
+                "lab_values": [{"test": "Hemoglobin", "value": 13.2, "unit": "g/dL", "reference_low": 13.5, "reference_high": 17.5}],
+                "clinical_significance": "detailed interpretation",
+                "recommendations": ["recommendation1", "recommendation2"]
+            }
+            
+            List every numeric lab result in lab_values, with the reference range printed on the report (null if absent)."""
+        ).with_model("gemini", FILE_ANALYSIS_MODEL).with_max_tokens(4096)
+        
+        # Analyze the individual file
+        file_content = FileContentWithMimeType(
+            file_path=file_info["file_path"],
+            mime_type=file_info["mime_type"]
+        )
+        
+        analysis_prompt = f"""
+        ANALYZE THIS MEDICAL FILE:
+        File name: {file_info["original_name"]}
+        File type: {file_info["mime_type"]}
+        
+        Please provide a detailed medical interpretation of this file including:
+        1. Key findings
+        2. Any abnormal values or concerning features
+        3. Clinical significance
+        4. Recommendations for follow-up or treatment
+        
+        Format your response as JSON.
+        """
+        
+        user_message = UserMessage(
+            text=analysis_prompt,
+            file_contents=[file_content]
+        )
+        
+        response = await chat.send_message(user_message)
+        
+        # Try to parse JSON response
+        try:
+            import json
+            analysis_data = json.loads(response)
+            
+            file_interpretation = {
+                "file_name": file_info["original_name"],
+                "file_type": analysis_data.get("file_type", "unknown"),
+                "key_findings": analysis_data.get("key_findings", []),
+                "abnormal_values": analysis_data.get("abnormal_values", []),
+                "lab_values": analysis_data.get("lab_values", []),
+                "clinical_significance": analysis_data.get("clinical_significance", "No specific findings"),
+                "recommendations": analysis_data.get("recommendations", []),
+                "full_interpretation": response[:500]  # Keep full response as backup
+            }
+        except json.JSONDecodeError:
+            # Fallback if response is not JSON
+            file_interpretation = {
+                "file_name": file_info["original_name"],
+                "file_type": "analysis_completed",
+                "key_findings": ["See detailed interpretation"],
+                "abnormal_values": [],
+                "clinical_significance": response[:300],
+                "recommendations": ["Review detailed analysis"],
+                "full_interpretation": response[:500]
+            }
+        
+        return file_interpretation
+        
+    except Exception as e:
+        logging.error(f"Error analyzing file {file_info['original_name']}: {str(e)}")
+        return {
+            "file_name": file_info["original_name"],
+            "file_type": "error",
+            "key_findings": ["Analysis failed"],
+            "abnormal_values": [],
+            "clinical_significance": f"Error in analysis: {str(e)}",
+            "recommendations": ["Retry analysis"],
+            "full_interpretation": f"Error: {str(e)}"
+        }
+
+# Authentication Helper Functions
+import hashlib
+import hmac
+import secrets
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+PASSWORD_HASH_ITERATIONS = 100000
+# hashlib releases the GIL while deriving keys, so threads hash in parallel
+# without blocking the event loop; the pool size caps CPU spent on hashing
+PASSWORD_HASH_WORKERS = int(os.environ.get('PASSWORD_HASH_WORKERS', '4'))
+LOGIN_THROTTLE_WINDOW = int(os.environ.get('LOGIN_THROTTLE_WINDOW', '300'))
+LOGIN_MAX_FAILURES_PER_USER = int(os.environ.get('LOGIN_MAX_FAILURES_PER_USER', '5'))
+LOGIN_MAX_FAILURES_PER_IP = int(os.environ.get('LOGIN_MAX_FAILURES_PER_IP', '20'))
+LOGIN_THROTTLE_MAX_KEYS = 10000
+
+password_hash_executor = ThreadPoolExecutor(max_workers=PASSWORD_HASH_WORKERS, thread_name_prefix="password-hash")
+
+def hash_password(password: str) -> str:
+    """Hash password with salt"""
+    salt = secrets.token_hex(16)
+    password_hash = hashlib.pbkdf2_hmac('sha256', password.encode(), salt.encode(), PASSWORD_HASH_ITERATIONS)
+    return f"{salt}${password_hash.hex()}"
+
+def verify_password(password: str, password_hash: str) -> bool:
+    """Verify password against hash"""
+    try:
+        salt, hash_hex = password_hash.split('$')
+        password_check = hashlib.pbkdf2_hmac('sha256', password.encode(), salt.encode(), PASSWORD_HASH_ITERATIONS)
+        return hmac.compare_digest(password_check.hex(), hash_hex)
+    except:
+        return False
+
+async def hash_password_async(password: str) -> str:
+    """Hash a password on the bounded hashing pool"""
+    return await asyncio.get_running_loop().run_in_executor(password_hash_executor, hash_password, password)
+
+async def verify_password_async(password: str, password_hash: str) -> bool:
+    """Verify a password on the bounded hashing pool"""
+    return await asyncio.get_running_loop().run_in_executor(
+        password_hash_executor, verify_password, password, password_hash
+    )
+
+class LoginThrottle:
+    """Sliding-window count of failed logins per key, checked before any hashing"""
+    
+    def __init__(self, limit: int, window: int = LOGIN_THROTTLE_WINDOW, max_keys: int = LOGIN_THROTTLE_MAX_KEYS):
+        self.limit = limit
+        self.window = window
+        self.max_keys = max_keys
+        self._failures: "OrderedDict[str, deque]" = OrderedDict()
+        self.rejected = 0
+    
+    def _recent(self, key: str) -> Optional[deque]:
+        failures = self._failures.get(key)
+        if failures is None:
+            return None
+        cutoff = time.monotonic() - self.window
+        while failures and failures[0] < cutoff:
+            failures.popleft()
+        if not failures:
+            del self._failures[key]
+            return None
+        return failures
+    
+    def retry_after(self, key: str) -> Optional[int]:
+        """Seconds until the key may try again, or None when it is not throttled"""
+        failures = self._recent(key)
+        if failures is None or len(failures) < self.limit:
+            return None
+        self.rejected += 1
+        return max(1, int(failures[0] + self.window - time.monotonic()) + 1)
+    
+    def record_failure(self, key: str):
+        failures = self._recent(key) or deque()
+        failures.append(time.monotonic())
+        self._failures[key] = failures
+        self._failures.move_to_end(key)
+        while len(self._failures) > self.max_keys:
+            self._failures.popitem(last=False)
+    
+    def forgive(self, key: str):
+        """Drop one recorded failure, for an attempt that turned out to succeed"""
+        failures = self._recent(key)
+        if failures:
+            failures.pop()
+    
+    def reset(self, key: str):
+        self._failures.pop(key, None)
+    
+    def metrics(self) -> Dict[str, Any]:
+        return {"tracked_keys": len(self._failures), "limit": self.limit, "rejected": self.rejected}
+
+username_login_throttle = LoginThrottle(LOGIN_MAX_FAILURES_PER_USER)
+ip_login_throttle = LoginThrottle(LOGIN_MAX_FAILURES_PER_IP)
+
+def create_session_token() -> str:
+    """Create a simple session token"""
+    return secrets.token_urlsafe(32)
+
+# Audit Trail Helper Functions
+AUDIT_QUEUE_SIZE = int(os.environ.get('AUDIT_QUEUE_SIZE', '10000'))
+AUDIT_BATCH_SIZE = int(os.environ.get('AUDIT_BATCH_SIZE', '500'))
+AUDIT_FLUSH_INTERVAL = float(os.environ.get('AUDIT_FLUSH_INTERVAL', '1.0'))
+# What to do when the queue is full: "block" (wait for space), "drop_newest" or "drop_oldest"
+AUDIT_OVERFLOW_POLICY = os.environ.get('AUDIT_OVERFLOW_POLICY', 'block')
+AUDIT_OVERFLOW_POLICIES = ("block", "drop_newest", "drop_oldest")
+
+class AuditLogWriter:
+    """Buffers audit events in a bounded queue and writes them with insert_many.
+    
+    A background task flushes a batch once it reaches batch_size events or
+    flush_interval seconds after its first event. Until the writer is
+    started (and after it is stopped) events are written inline.
+    """
+    
+    def __init__(self, max_queue_size: int = AUDIT_QUEUE_SIZE, batch_size: int = AUDIT_BATCH_SIZE,
+                 flush_interval: float = AUDIT_FLUSH_INTERVAL, overflow_policy: str = AUDIT_OVERFLOW_POLICY):
+        if overflow_policy not in AUDIT_OVERFLOW_POLICIES:
+            raise ValueError(f"Unknown audit overflow policy: {overflow_policy}")
+        self.max_queue_size = max_queue_size
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.overflow_policy = overflow_policy
+        self.queue: Optional[asyncio.Queue] = None
+        self._task: Optional[asyncio.Task] = None
+        self._stopping = False
+        self.stats = {
+            "enqueued": 0,
+            "written": 0,
+            "dropped": 0,
+            "failed": 0,
+            "flushes": 0,
+            "last_flush_latency_ms": 0.0,
+            "max_flush_latency_ms": 0.0,
+            "total_flush_latency_ms": 0.0
+        }
+    
+    @property
+    def running(self) -> bool:
+        return self._task is not None and not self._stopping
+    
+    def start(self):
+        """Start the background flush task"""
+        self.queue = asyncio.Queue(maxsize=self.max_queue_size)
+        self._stopping = False
+        self._task = asyncio.create_task(self._run())
+    
+    async def stop(self):
+        """Flush all pending events and stop the background task"""
+        if not self._task:
+            return
+        self._stopping = True
+        await self._task
+        self._task = None
+    
+    async def enqueue(self, event: Dict[str, Any]):
+        """Queue an event, applying the overflow policy when the queue is full"""
+        if not self.running:
+            await self._write([event])
+            return
+        
+        if self.overflow_policy == "block":
+            await self.queue.put(event)
+        else:
+            if self.queue.full():
+                self.stats["dropped"] += 1
+                if self.overflow_policy == "drop_newest":
+                    return
+                self.queue.get_nowait()
+            self.queue.put_nowait(event)
+        self.stats["enqueued"] += 1
+    
+    async def _collect_batch(self) -> List[Dict[str, Any]]:
+        """Collect events until the batch is full or the flush interval elapsed"""
+        loop = asyncio.get_running_loop()
+        batch = []
+        deadline = loop.time() + self.flush_interval
+        while len(batch) < self.batch_size:
+            if self._stopping:
+                # Drain whatever is left without waiting
+                if self.queue.empty():
+                    break
+                batch.append(self.queue.get_nowait())
+                continue
+            timeout = deadline - loop.time()
+            if timeout <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(self.queue.get(), timeout))
+            except asyncio.TimeoutError:
+                break
+        return batch
+    
+    async def _write(self, batch: List[Dict[str, Any]]):
+        """Write a batch of events, recording flush latency"""
+        started = time.perf_counter()
+        try:
+            await write_audit_events(batch)
+            self.stats["written"] += len(batch)
+        except Exception as e:
+            self.stats["failed"] += len(batch)
+            logging.error(f"Failed to write {len(batch)} audit events: {str(e)}")
+        latency_ms = (time.perf_counter() - started) * 1000
+        self.stats["flushes"] += 1
+        self.stats["last_flush_latency_ms"] = round(latency_ms, 3)
+        self.stats["max_flush_latency_ms"] = round(max(self.stats["max_flush_latency_ms"], latency_ms), 3)
+        self.stats["total_flush_latency_ms"] += latency_ms
+    
+    async def _run(self):
+        while not (self._stopping and self.queue.empty()):
+            batch = await self._collect_batch()
+            if batch:
+                await self._write(batch)
+    
+    def metrics(self) -> Dict[str, Any]:
+        """Queue depth and flush statistics"""
+        flushes = self.stats["flushes"]
+        return {
+            "queue_depth": self.queue.qsize() if self.queue else 0,
+            "queue_capacity": self.max_queue_size,
+            "overflow_policy": self.overflow_policy,
+            "running": self.running,
+            "enqueued": self.stats["enqueued"],
+            "written": self.stats["written"],
+            "dropped": self.stats["dropped"],
+            "failed": self.stats["failed"],
+            "flushes": flushes,
+            "last_flush_latency_ms": self.stats["last_flush_latency_ms"],
+            "max_flush_latency_ms": self.stats["max_flush_latency_ms"],
+            "avg_flush_latency_ms": round(self.stats["total_flush_latency_ms"] / flushes, 3) if flushes else 0.0
+        }
+
+audit_writer = AuditLogWriter()
+
+# Audit Storage Lifecycle
+# Events are bucketed into monthly collections (audit_logs_YYYY_MM); months older
+# than AUDIT_HOT_MONTHS are moved into zstd-compressed JSONL archives on disk.
+AUDIT_HOT_MONTHS = int(os.environ.get('AUDIT_HOT_MONTHS', '6'))
+AUDIT_ARCHIVE_DIR = Path(os.environ.get('AUDIT_ARCHIVE_DIR', str(ROOT_DIR / "audit_archive")))
+AUDIT_ARCHIVE_INTERVAL = int(os.environ.get('AUDIT_ARCHIVE_INTERVAL', '86400'))
+AUDIT_ARCHIVE_LEVEL = 10
+AUDIT_COLLECTION_PATTERN = re.compile(r"^audit_logs_(\d{4}_\d{2})$")
+AUDIT_ARCHIVE_CHUNK_SIZE = 64 * 1024
+AUDIT_ARCHIVE_LEASE_SECONDS = int(os.environ.get('AUDIT_ARCHIVE_LEASE_SECONDS', '3600'))
+
+_indexed_audit_months = set()
+
+def audit_month_key(timestamp: datetime) -> str:
+    """Month bucket key of a timestamp, e.g. 2025_06"""
+    return timestamp.strftime("%Y_%m")
+
+def shift_audit_month(month_key: str, months: int) -> str:
+    """Move a month bucket key by a number of months"""
+    year, month = map(int, month_key.split("_"))
+    index = year * 12 + (month - 1) + months
+    return f"{index // 12:04d}_{index % 12 + 1:02d}"
+
+def audit_collection(month_key: str):
+    return db[f"audit_logs_{month_key}"]
+
+def audit_archive_path(month_key: str) -> Path:
+    return AUDIT_ARCHIVE_DIR / f"audit_logs_{month_key}.jsonl.zst"
+
+async def ensure_audit_month_indexes(month_key: str):
+    """Create the indexes of a monthly audit collection once per process"""
+    if month_key in _indexed_audit_months:
+        return
+    collection = audit_collection(month_key)
+    await collection.create_index([("timestamp", -1)])
+    await collection.create_index([("user_id", 1), ("timestamp", -1)])
+    await collection.create_index([("action", 1), ("timestamp", -1)])
+    _indexed_audit_months.add(month_key)
+
+async def write_audit_events(events: List[Dict[str, Any]]):
+    """Insert audit events into their monthly collections"""
+    by_month: Dict[str, List[Dict[str, Any]]] = {}
+    for event in events:
+        by_month.setdefault(audit_month_key(event["timestamp"]), []).append(event)
+    for month_key, month_events in by_month.items():
+        await ensure_audit_month_indexes(month_key)
+        await audit_collection(month_key).insert_many(month_events, ordered=False)
+
+async def list_audit_months() -> Dict[str, str]:
+    """Map every month with audit data to where it lives ("hot" or "archived")"""
+    months = {}
+    if AUDIT_ARCHIVE_DIR.exists():
+        for path in AUDIT_ARCHIVE_DIR.glob("audit_logs_*.jsonl.zst"):
+            months[path.name[len("audit_logs_"):-len(".jsonl.zst")]] = "archived"
+    # A month being archived is still served from MongoDB until its collection is dropped
+    for name in await db.list_collection_names(filter={"name": {"$regex": "^audit_logs_"}}):
+        match = AUDIT_COLLECTION_PATTERN.match(name)
+        if match:
+            months[match.group(1)] = "hot"
+    return months
+
+def audit_event_matches(event: Dict[str, Any], filters: Dict[str, Any],
+                        since: Optional[datetime], until: Optional[datetime]) -> bool:
+    """Check an archived event against equality filters and a time range"""
+    for key, value in filters.items():
+        if event.get(key) != value:
+            return False
+    if since or until:
+        timestamp = datetime.fromisoformat(event["timestamp"])
+        if since and timestamp < since:
+            return False
+        if until and timestamp > until:
+            return False
+    return True
+
+def read_archived_audit_month(month_key: str, filters: Dict[str, Any], since: Optional[datetime],
+                              until: Optional[datetime], limit: int) -> List[Dict[str, Any]]:
+    """Return the newest matching events of an archived month (blocking, run in a thread)"""
+    matches = deque(maxlen=limit)
+    with open(audit_archive_path(month_key), "rb") as raw:
+        reader = zstandard.ZstdDecompressor().stream_reader(raw, read_across_frames=True)
+        for line in io.TextIOWrapper(reader, encoding="utf-8"):
+            if not line.strip():
+                continue
+            event = json.loads(line)
+            if audit_event_matches(event, filters, since, until):
+                matches.append(event)
+    # Archives are written oldest first
+    return list(reversed(matches))
+
+def parse_audit_date(value: Optional[str]) -> Optional[datetime]:
+    """Parse an ISO 8601 date filter into the naive UTC datetimes audit events are stored with"""
+    if not value:
+        return None
+    parsed = datetime.fromisoformat(value)
+    if parsed.tzinfo is not None:
+        parsed = parsed.astimezone(timezone.utc).replace(tzinfo=None)
+    return parsed
+
+async def query_audit_logs(filters: Dict[str, Any], limit: int = 100, since: Optional[datetime] = None,
+                           until: Optional[datetime] = None) -> List[Dict[str, Any]]:
+    """Query audit events newest first across hot collections and archives.
+    
+    Months are visited newest first and the scan stops as soon as `limit`
+    events were found, so recent queries only touch the current month.
+    """
+    months = await list_audit_months()
+    last_month = audit_month_key(until or datetime.utcnow())
+    first_month = audit_month_key(since) if since else None
+    candidates = sorted(
+        (month for month in months if month <= last_month and (first_month is None or month >= first_month)),
+        reverse=True
+    )
+    
+    logs = []
+    for month_key in candidates:
+        remaining = limit - len(logs)
+        if remaining <= 0:
+            break
+        if months[month_key] == "hot":
+            query = dict(filters)
+            if since or until:
+                query["timestamp"] = {}
+                if since:
+                    query["timestamp"]["$gte"] = since
+                if until:
+                    query["timestamp"]["$lte"] = until
+            logs.extend(
+                await audit_collection(month_key).find(query, {"_id": 0})
+                .sort("timestamp", -1).limit(remaining).to_list(remaining)
+            )
+        else:
+            logs.extend(await asyncio.to_thread(
+                read_archived_audit_month, month_key, filters, since, until, remaining
+            ))
+    return logs
+
+async def acquire_audit_archive_lease(month_key: str) -> Optional[str]:
+    """Take the archive lease of a month; None if another worker holds it"""
+    token = uuid.uuid4().hex
+    now = datetime.utcnow()
+    try:
+        await db.audit_archive_state.find_one_and_update(
+            {"_id": month_key, "$or": [{"lease_expires_at": None}, {"lease_expires_at": {"$lt": now}}]},
+            {"$set": {"lease_owner": token, "lease_expires_at": now + timedelta(seconds=AUDIT_ARCHIVE_LEASE_SECONDS)}},
+            upsert=True
+        )
+    except DuplicateKeyError:
+        # The state document exists and its lease has not expired
+        return None
+    return token
+
+async def set_audit_archive_state(month_key: str, token: str, fields: Dict[str, Any]):
+    """Record an archive step, failing if the lease was lost to another worker"""
+    result = await db.audit_archive_state.update_one(
+        {"_id": month_key, "lease_owner": token}, {"$set": fields}
+    )
+    if result.matched_count == 0:
+        raise RuntimeError(f"Lost the audit archive lease for {month_key}")
+
+def truncate_audit_archive(path: Path, size: int):
+    """Cut an archive back to its size before an interrupted append"""
+    if size == 0:
+        path.unlink(missing_ok=True)
+    elif path.exists() and path.stat().st_size > size:
+        with open(path, "r+b") as archive:
+            archive.truncate(size)
+
+async def archive_audit_month(month_key: str) -> bool:
+    """Compress a monthly audit collection into a JSONL archive and drop it.
     
-    for file_info in uploaded_files:
-        if not os.path.exists(file_info["file_path"]):
-            continue
-            
+    Each step is recorded in audit_archive_state under a per-month lease, so
+    only one worker archives a month at a time and a run interrupted at any
+    point is resumed without appending the same events twice. Returns False
+    if another worker holds the lease.
+    """
+    token = await acquire_audit_archive_lease(month_key)
+    if token is None:
+        return False
+    try:
+        AUDIT_ARCHIVE_DIR.mkdir(parents=True, exist_ok=True)
+        path = audit_archive_path(month_key)
+        collection = audit_collection(month_key)
+        state = await db.audit_archive_state.find_one({"_id": month_key}) or {}
+        
+        if state.get("status") == "appending":
+            # Interrupted mid-append: the collection is intact, so start over
+            truncate_audit_archive(path, state["archive_size"])
+        elif state.get("status") == "appended":
+            # Interrupted between the append and the drop: the events are already archived
+            await collection.drop()
+            _indexed_audit_months.discard(month_key)
+            await set_audit_archive_state(month_key, token, {"status": "archived", "archived_at": datetime.utcnow()})
+            logging.info(f"Finished interrupted audit archive of {month_key}")
+            return True
+        
+        temp_path = path.with_name(f"{path.name}.{uuid.uuid4().hex}.tmp")
+        count = 0
         try:
-            # Create a new Gemini chat instance for individual file analysis
-            session_id = f"file-analysis-{uuid.uuid4()}"
-            chat = LlmChat(
-                api_key=GEMINI_API_KEY,
-                session_id=session_id,
-                system_message="""You are a medical file analysis specialist. Analyze the provided medical file and return a structured interpretation.
-                
-                For lab files (CSV/PDF): Extract and interpret lab values, identify abnormal results, clinical significance.
-                For medical images: Describe findings, identify abnormalities, suggest differential diagnoses.
-                For text files: Summarize key medical information and clinical relevance.
-                
-                Respond in JSON format:
-                {
-                    "file_type": "lab_report|medical_image|text_document",
-                    "key_findings": ["finding1", "finding2"],
-                    "abnormal_values": ["abnormal1", "abnormal2"],
-                    "clinical_significance": "detailed interpretation",
-                    "recommendations": ["recommendation1", "recommendation2"]
-                }"""
-            ).with_model("gemini", "gemini-2.5-pro-preview-05-06").with_max_tokens(4096)
-            
-            # Analyze the individual file
-            file_content = FileContentWithMimeType(
-                file_path=file_info["file_path"],
-                mime_type=file_info["mime_type"]
-            )
-            
-            analysis_prompt = f"""
-            ANALYZE THIS MEDICAL FILE:
-            File name: {file_info["original_name"]}
-            File type: {file_info["mime_type"]}
-            
-            Please provide a detailed medical interpretation of this file including:
-            1. Key findings
-            2. Any abnormal values or concerning features
-            3. Clinical significance
-            4. Recommendations for follow-up or treatment
-            
-            Format your response as JSON.
-            """
-            
-            user_message = UserMessage(
-                text=analysis_prompt,
-                file_contents=[file_content]
-            )
-            
-            response = await chat.send_message(user_message)
-            
-            # Try to parse JSON response
-            try:
-                import json
-                analysis_data = json.loads(response)
-                
-                file_interpretation = {
-                    "file_name": file_info["original_name"],
-                    "file_type": analysis_data.get("file_type", "unknown"),
-                    "key_findings": analysis_data.get("key_findings", []),
-                    "abnormal_values": analysis_data.get("abnormal_values", []),
-                    "clinical_significance": analysis_data.get("clinical_significance", "No specific findings"),
-                    "recommendations": analysis_data.get("recommendations", []),
-                    "full_interpretation": response[:500]  # Keep full response as backup
-                }
-            except json.JSONDecodeError:
-                # Fallback if response is not JSON
-                file_interpretation = {
-                    "file_name": file_info["original_name"],
-                    "file_type": "analysis_completed",
-                    "key_findings": ["See detailed interpretation"],
-                    "abnormal_values": [],
-                    "clinical_significance": response[:300],
-                    "recommendations": ["Review detailed analysis"],
-                    "full_interpretation": response[:500]
-                }
+            with open(temp_path, "wb") as raw:
+                writer = zstandard.ZstdCompressor(level=AUDIT_ARCHIVE_LEVEL).stream_writer(raw)
+                lines = []
+                async for event in collection.find({}, {"_id": 0}).sort("timestamp", 1):
+                    lines.append(json.dumps(event, default=json_default))
+                    count += 1
+                    if len(lines) >= 1000:
+                        await asyncio.to_thread(writer.write, ("\n".join(lines) + "\n").encode())
+                        lines = []
+                if lines:
+                    await asyncio.to_thread(writer.write, ("\n".join(lines) + "\n").encode())
+                writer.flush(zstandard.FLUSH_FRAME)
             
-            file_interpretations.append(file_interpretation)
-            
-        except Exception as e:
-            logging.error(f"Error analyzing file {file_info['original_name']}: {str(e)}")
-            file_interpretations.append({
-                "file_name": file_info["original_name"],
-                "file_type": "error",
-                "key_findings": ["Analysis failed"],
-                "abnormal_values": [],
-                "clinical_significance": f"Error in analysis: {str(e)}",
-                "recommendations": ["Retry analysis"],
-                "full_interpretation": f"Error: {str(e)}"
-            })
-    
-    return file_interpretations
+            archive_size = path.stat().st_size if path.exists() else 0
+            await set_audit_archive_state(month_key, token, {"status": "appending", "archive_size": archive_size})
+            if archive_size:
+                # zstd frames can be concatenated, so late events are simply appended
+                with open(path, "ab") as archive, open(temp_path, "rb") as frame:
+                    archive.write(frame.read())
+            else:
+                os.replace(temp_path, path)
+        finally:
+            temp_path.unlink(missing_ok=True)
+        
+        # Marked before the drop, so a retry never appends these events again
+        await set_audit_archive_state(month_key, token, {"status": "appended"})
+        await collection.drop()
+        _indexed_audit_months.discard(month_key)
+        await set_audit_archive_state(month_key, token, {"status": "archived", "archived_at": datetime.utcnow()})
+        logging.info(f"Archived {count} audit events for {month_key} to {path}")
+        return True
+    finally:
+        await db.audit_archive_state.update_one(
+            {"_id": month_key, "lease_owner": token}, {"$set": {"lease_expires_at": None}}
+        )
 
-# Authentication Helper Functions
-import hashlib
-import secrets
+async def archive_cold_audit_months():
+    """Archive every hot month older than the retention window"""
+    cutoff = shift_audit_month(audit_month_key(datetime.utcnow()), -AUDIT_HOT_MONTHS)
+    months = await list_audit_months()
+    for month_key in sorted(months):
+        if months[month_key] == "hot" and month_key < cutoff:
+            await archive_audit_month(month_key)
 
-def hash_password(password: str) -> str:
-    """Hash password with salt"""
-    salt = secrets.token_hex(16)
-    password_hash = hashlib.pbkdf2_hmac('sha256', password.encode(), salt.encode(), 100000)
-    return f"{salt}${password_hash.hex()}"
+async def migrate_legacy_audit_logs():
+    """Move events from the unbucketed audit_logs collection into monthly collections"""
+    moved = 0
+    while True:
+        events = await db.audit_logs.find({}).limit(1000).to_list(1000)
+        if not events:
+            break
+        ids = [event.pop("_id") for event in events]
+        await write_audit_events(events)
+        await db.audit_logs.delete_many({"_id": {"$in": ids}})
+        moved += len(events)
+    if moved:
+        logging.info(f"Moved {moved} legacy audit events into monthly collections")
 
-def verify_password(password: str, password_hash: str) -> bool:
-    """Verify password against hash"""
+async def run_audit_lifecycle():
+    """Bucket legacy events, then periodically archive cold months"""
     try:
-        salt, hash_hex = password_hash.split('$')
-        password_check = hashlib.pbkdf2_hmac('sha256', password.encode(), salt.encode(), 100000)
-        return password_check.hex() == hash_hex
-    except:
-        return False
+        await migrate_legacy_audit_logs()
+    except Exception as e:
+        logging.error(f"Legacy audit migration error: {str(e)}")
+    while True:
+        try:
+            await archive_cold_audit_months()
+        except Exception as e:
+            logging.error(f"Audit archive error: {str(e)}")
+        await asyncio.sleep(AUDIT_ARCHIVE_INTERVAL)
 
-def create_session_token() -> str:
-    """Create a simple session token"""
-    return secrets.token_urlsafe(32)
+async def stream_audit_export(first_month: str, last_month: str):
+    """Yield NDJSON audit events of a month range, oldest first, from MongoDB or archives"""
+    months = await list_audit_months()
+    for month_key in sorted(month for month in months if first_month <= month <= last_month):
+        if months[month_key] == "hot":
+            lines = []
+            async for event in audit_collection(month_key).find({}, {"_id": 0}).sort("timestamp", 1):
+                lines.append(json.dumps(event, default=json_default))
+                if len(lines) >= 1000:
+                    yield ("\n".join(lines) + "\n").encode()
+                    lines = []
+            if lines:
+                yield ("\n".join(lines) + "\n").encode()
+        else:
+            # Archives already are NDJSON, so decompressed chunks are passed through
+            with open(audit_archive_path(month_key), "rb") as raw:
+                reader = zstandard.ZstdDecompressor().stream_reader(raw, read_across_frames=True)
+                while True:
+                    chunk = await asyncio.to_thread(reader.read, AUDIT_ARCHIVE_CHUNK_SIZE)
+                    if not chunk:
+                        break
+                    yield chunk
 
-# Audit Trail Helper Functions
 async def log_audit_event(user_id: str, action: str, resource_id: Optional[str] = None, 
                          details: Optional[str] = None, ip_address: Optional[str] = None):
     """Log an audit event"""
@@ -290,12 +2308,512 @@ async def log_audit_event(user_id: str, action: str, resource_id: Optional[str]
             details=details,
             ip_address=ip_address
         )
-        await db.audit_logs.insert_one(audit_log.dict())
+        await audit_writer.enqueue(audit_log.dict())
     except Exception as e:
         logging.error(f"Failed to log audit event: {str(e)}")
 
-# Simple session storage (in production, use Redis or proper session management)
-active_sessions = {}
+# Session Store
+# Sessions live behind a SessionStore driver so any worker can serve any token.
+# Expiry slides on use; the store is only written when a session's expiry is
+# pushed out by at least SESSION_REFRESH_SECONDS, and a short per-process cache
+# answers repeated lookups of hot tokens without a round trip.
+SESSION_STORE = os.environ.get('SESSION_STORE', 'memory')
+SESSION_TTL_SECONDS = int(os.environ.get('SESSION_TTL_SECONDS', '28800'))
+SESSION_REFRESH_SECONDS = int(os.environ.get('SESSION_REFRESH_SECONDS', '300'))
+SESSION_MEMORY_MAX = int(os.environ.get('SESSION_MEMORY_MAX', '10000'))
+SESSION_CACHE_SIZE = int(os.environ.get('SESSION_CACHE_SIZE', '1024'))
+SESSION_CACHE_TTL = float(os.environ.get('SESSION_CACHE_TTL', '5'))
+REDIS_URL = os.environ.get('REDIS_URL', 'redis://localhost:6379/0')
+
+class SessionStore(abc.ABC):
+    """Storage driver interface; keys are token digests, never raw tokens"""
+    name = "base"
+    
+    async def start(self):
+        pass
+    
+    async def close(self):
+        pass
+    
+    @abc.abstractmethod
+    async def save(self, key: str, session: Dict[str, Any], ttl: int):
+        """Store a new session that expires after ttl seconds"""
+    
+    @abc.abstractmethod
+    async def load(self, key: str) -> Optional[Dict[str, Any]]:
+        """Return a live session, or None"""
+    
+    @abc.abstractmethod
+    async def touch(self, key: str, expires_at: datetime, ttl: int):
+        """Push out the expiry of an existing session"""
+    
+    @abc.abstractmethod
+    async def delete(self, key: str) -> Optional[Dict[str, Any]]:
+        """Remove a session and return it, or None if it did not exist"""
+
+class MemorySessionStore(SessionStore):
+    """Single-process LRU store, for development and single-worker deployments"""
+    name = "memory"
+    
+    def __init__(self, max_entries: int = SESSION_MEMORY_MAX):
+        self.max_entries = max_entries
+        self._sessions: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+        self.evictions = 0
+    
+    async def save(self, key: str, session: Dict[str, Any], ttl: int):
+        self._sessions[key] = dict(session)
+        self._sessions.move_to_end(key)
+        while len(self._sessions) > self.max_entries:
+            self._sessions.popitem(last=False)
+            self.evictions += 1
+    
+    async def load(self, key: str) -> Optional[Dict[str, Any]]:
+        session = self._sessions.get(key)
+        if session is None:
+            return None
+        if session["expires_at"] <= datetime.utcnow():
+            del self._sessions[key]
+            return None
+        self._sessions.move_to_end(key)
+        return dict(session)
+    
+    async def touch(self, key: str, expires_at: datetime, ttl: int):
+        if key in self._sessions:
+            self._sessions[key]["expires_at"] = expires_at
+    
+    async def delete(self, key: str) -> Optional[Dict[str, Any]]:
+        return self._sessions.pop(key, None)
+
+class MongoSessionStore(SessionStore):
+    """Shared store in MongoDB; a TTL index on expires_at reaps dead sessions"""
+    name = "mongo"
+    
+    def __init__(self, collection):
+        self.collection = collection
+    
+    async def start(self):
+        await self.collection.create_index("key", unique=True)
+        await self.collection.create_index("expires_at", expireAfterSeconds=0)
+    
+    async def save(self, key: str, session: Dict[str, Any], ttl: int):
+        await self.collection.insert_one({"key": key, **session})
+    
+    async def load(self, key: str) -> Optional[Dict[str, Any]]:
+        # The TTL monitor runs about once a minute, so filter on expiry as well
+        return await self.collection.find_one(
+            {"key": key, "expires_at": {"$gt": datetime.utcnow()}},
+            {"_id": 0, "key": 0}
+        )
+    
+    async def touch(self, key: str, expires_at: datetime, ttl: int):
+        await self.collection.update_one({"key": key}, {"$set": {"expires_at": expires_at}})
+    
+    async def delete(self, key: str) -> Optional[Dict[str, Any]]:
+        return await self.collection.find_one_and_delete({"key": key}, {"_id": 0, "key": 0})
+
+class RedisSessionStore(SessionStore):
+    """Shared store on any Redis-protocol server, using native key expiry"""
+    name = "redis"
+    
+    def __init__(self, url: str = REDIS_URL, prefix: str = "session:"):
+        self.redis = aioredis.from_url(url)
+        self.prefix = prefix
+    
+    async def close(self):
+        await self.redis.aclose()
+    
+    @staticmethod
+    def _decode(raw: Optional[bytes]) -> Optional[Dict[str, Any]]:
+        if raw is None:
+            return None
+        session = orjson.loads(raw)
+        for key in ("created_at", "expires_at"):
+            session[key] = datetime.fromisoformat(session[key])
+        return session
+    
+    async def save(self, key: str, session: Dict[str, Any], ttl: int):
+        await self.redis.set(self.prefix + key, orjson.dumps(session), ex=ttl)
+    
+    async def load(self, key: str) -> Optional[Dict[str, Any]]:
+        return self._decode(await self.redis.get(self.prefix + key))
+    
+    async def touch(self, key: str, expires_at: datetime, ttl: int):
+        # Rewrite the payload so expires_at stays in step with the key TTL
+        session = await self.load(key)
+        if session:
+            session["expires_at"] = expires_at
+            await self.redis.set(self.prefix + key, orjson.dumps(session), ex=ttl, xx=True)
+    
+    async def delete(self, key: str) -> Optional[Dict[str, Any]]:
+        return self._decode(await self.redis.getdel(self.prefix + key))
+
+def session_key(session_token: str) -> str:
+    return hashlib.sha256(session_token.encode()).hexdigest()
+
+class SessionManager:
+    """Creates, resolves and destroys sessions with sliding expiry"""
+    
+    def __init__(self, store: SessionStore, ttl: int = SESSION_TTL_SECONDS,
+                 refresh_interval: int = SESSION_REFRESH_SECONDS,
+                 cache_size: int = SESSION_CACHE_SIZE, cache_ttl: float = SESSION_CACHE_TTL):
+        self.store = store
+        self.ttl = ttl
+        self.refresh_interval = refresh_interval
+        self.cache_size = cache_size
+        self.cache_ttl = cache_ttl
+        # Logout on another worker is seen here after at most cache_ttl seconds
+        self._cache: "OrderedDict[str, tuple]" = OrderedDict()
+        self.stats = {"created": 0, "destroyed": 0, "cache_hits": 0, "store_reads": 0, "refreshes": 0, "misses": 0}
+    
+    async def create(self, user_id: str, username: str) -> str:
+        session_token = create_session_token()
+        now = datetime.utcnow()
+        session = {
+            "user_id": user_id,
+            "username": username,
+            "created_at": now,
+            "expires_at": now + timedelta(seconds=self.ttl)
+        }
+        await self.store.save(session_key(session_token), session, self.ttl)
+        self.stats["created"] += 1
+        return session_token
+    
+    async def get(self, session_token: str) -> Optional[Dict[str, Any]]:
+        key = session_key(session_token)
+        entry = self._cache.get(key)
+        if entry and entry[0] > time.monotonic():
+            self._cache.move_to_end(key)
+            session = entry[1]
+            self.stats["cache_hits"] += 1
+        else:
+            self._cache.pop(key, None)
+            session = await self.store.load(key)
+            self.stats["store_reads"] += 1
+            if session is None:
+                self.stats["misses"] += 1
+                return None
+        
+        now = datetime.utcnow()
+        if session["expires_at"] <= now:
+            self._cache.pop(key, None)
+            self.stats["misses"] += 1
+            return None
+        if session["expires_at"] - now <= timedelta(seconds=self.ttl - self.refresh_interval):
+            session = {**session, "expires_at": now + timedelta(seconds=self.ttl)}
+            await self.store.touch(key, session["expires_at"], self.ttl)
+            self.stats["refreshes"] += 1
+        
+        self._cache[key] = (time.monotonic() + self.cache_ttl, session)
+        self._cache.move_to_end(key)
+        while len(self._cache) > self.cache_size:
+            self._cache.popitem(last=False)
+        return dict(session)
+    
+    async def start(self):
+        await self.store.start()
+    
+    async def close(self):
+        await self.store.close()
+    
+    async def destroy(self, session_token: str) -> Optional[Dict[str, Any]]:
+        key = session_key(session_token)
+        self._cache.pop(key, None)
+        session = await self.store.delete(key)
+        if session and session["expires_at"] > datetime.utcnow():
+            self.stats["destroyed"] += 1
+            return session
+        return None
+    
+    def metrics(self) -> Dict[str, Any]:
+        lookups = self.stats["cache_hits"] + self.stats["store_reads"]
+        return {
+            "driver": self.store.name,
+            "ttl_seconds": self.ttl,
+            "cache_size": len(self._cache),
+            "cache_hit_ratio": round(self.stats["cache_hits"] / lookups, 3) if lookups else None,
+            **self.stats
+        }
+
+def build_session_store(driver: str = SESSION_STORE) -> SessionStore:
+    if driver == "mongo":
+        return MongoSessionStore(db.sessions)
+    if driver == "redis":
+        return RedisSessionStore(REDIS_URL)
+    if driver != "memory":
+        logging.warning(f"Unknown SESSION_STORE '{driver}', using memory")
+    return MemorySessionStore()
+
+# Signed Session Tokens
+# With SESSION_TOKEN_MODE=signed, tokens are HMAC-signed claims and verifying
+# one is CPU-only. SESSION_SIGNING_KEYS is "kid:secret,kid:secret"; the first
+# key signs, the rest still verify, so keys rotate by prepending a new one and
+# dropping the oldest once SESSION_TTL_SECONDS has passed. Logout adds the token
+# id to a revocation list every worker mirrors in memory. Revocations are
+# numbered from a counter in MongoDB, so workers sync by sequence number rather
+# than by their own clocks.
+SESSION_TOKEN_MODE = os.environ.get('SESSION_TOKEN_MODE', 'store')
+SESSION_SIGNING_KEYS = os.environ.get('SESSION_SIGNING_KEYS', '')
+REVOCATION_REFRESH_SECONDS = int(os.environ.get('REVOCATION_REFRESH_SECONDS', '15'))
+# How long a missing sequence number may be waited for before it is taken as unused
+REVOCATION_GAP_SECONDS = 60
+SIGNED_TOKEN_VERSION = "v1"
+
+def parse_signing_keys(value: str) -> List[tuple]:
+    keys = []
+    for entry in value.split(","):
+        if entry.strip():
+            kid, _, secret = entry.strip().partition(":")
+            if not secret:
+                raise ValueError("SESSION_SIGNING_KEYS entries must look like kid:secret")
+            keys.append((kid, secret.encode()))
+    return keys
+
+def b64url_encode(data: bytes) -> str:
+    return base64.urlsafe_b64encode(data).rstrip(b"=").decode()
+
+def b64url_decode(data: str) -> bytes:
+    return base64.urlsafe_b64decode(data + "=" * (-len(data) % 4))
+
+class SignedTokenSessions:
+    """Stateless sessions: v1.<kid>.<claims>.<signature>, checked without I/O"""
+    
+    def __init__(self, signing_keys: List[tuple], ttl: int = SESSION_TTL_SECONDS,
+                 refresh_interval: int = REVOCATION_REFRESH_SECONDS):
+        if not signing_keys:
+            logging.warning("SESSION_SIGNING_KEYS is not set; using a per-process key, tokens will not survive restarts")
+            signing_keys = [("local", secrets.token_bytes(32))]
+        self.active_kid = signing_keys[0][0]
+        self.keys = dict(signing_keys)
+        self.ttl = ttl
+        self.refresh_interval = refresh_interval
+        # token id -> expiry; entries can be dropped once the token would have expired anyway
+        self.revoked: Dict[str, datetime] = {}
+        # Every revocation numbered up to this one has been applied
+        self._revocation_seq = 0
+        self._revocation_gap_since: Optional[float] = None
+        self.stats = {"created": 0, "verified": 0, "rejected": 0, "revoked": 0}
+    
+    def _sign(self, kid: str, signing_input: str) -> str:
+        return b64url_encode(hmac.new(self.keys[kid], signing_input.encode(), hashlib.sha256).digest())
+    
+    async def create(self, user_id: str, username: str) -> str:
+        now = datetime.utcnow()
+        claims = {
+            "sub": user_id,
+            "usr": username,
+            "jti": secrets.token_urlsafe(12),
+            "iat": int(now.replace(tzinfo=timezone.utc).timestamp()),
+            "exp": int(now.replace(tzinfo=timezone.utc).timestamp()) + self.ttl
+        }
+        signing_input = f"{SIGNED_TOKEN_VERSION}.{self.active_kid}.{b64url_encode(orjson.dumps(claims))}"
+        self.stats["created"] += 1
+        return f"{signing_input}.{self._sign(self.active_kid, signing_input)}"
+    
+    def _decode(self, session_token: str) -> Optional[Dict[str, Any]]:
+        try:
+            version, kid, payload, signature = session_token.split(".")
+            if version != SIGNED_TOKEN_VERSION or kid not in self.keys:
+                return None
+            # Bytes, as compare_digest rejects str with non-ASCII characters
+            expected = self._sign(kid, f"{version}.{kid}.{payload}")
+            if not hmac.compare_digest(signature.encode(), expected.encode()):
+                return None
+            claims = orjson.loads(b64url_decode(payload))
+        except (TypeError, ValueError, orjson.JSONDecodeError):
+            return None
+        if claims["exp"] <= time.time() or claims["jti"] in self.revoked:
+            return None
+        return claims
+    
+    async def get(self, session_token: str) -> Optional[Dict[str, Any]]:
+        claims = self._decode(session_token)
+        if claims is None:
+            self.stats["rejected"] += 1
+            return None
+        self.stats["verified"] += 1
+        return {
+            "user_id": claims["sub"],
+            "username": claims["usr"],
+            "created_at": datetime.utcfromtimestamp(claims["iat"]),
+            "expires_at": datetime.utcfromtimestamp(claims["exp"])
+        }
+    
+    async def destroy(self, session_token: str) -> Optional[Dict[str, Any]]:
+        session = await self.get(session_token)
+        if session is None:
+            return None
+        claims = orjson.loads(b64url_decode(session_token.split(".")[2]))
+        self.revoked[claims["jti"]] = session["expires_at"]
+        counter = await db.counters.find_one_and_update(
+            {"_id": "revoked_tokens"}, {"$inc": {"seq": 1}}, upsert=True, return_document=ReturnDocument.AFTER
+        )
+        await db.revoked_tokens.update_one(
+            {"jti": claims["jti"]},
+            {"$setOnInsert": {
+                "jti": claims["jti"],
+                "expires_at": session["expires_at"],
+                "revoked_at": datetime.utcnow(),
+                "seq": counter["seq"]
+            }},
+            upsert=True
+        )
+        self.stats["revoked"] += 1
+        return session
+    
+    async def load_revocations(self):
+        """Load every live revocation and start syncing after the newest one"""
+        now = datetime.utcnow()
+        async for revocation in db.revoked_tokens.find(
+            {"expires_at": {"$gt": now}}, {"_id": 0, "jti": 1, "expires_at": 1, "seq": 1}
+        ):
+            self.revoked[revocation["jti"]] = revocation["expires_at"]
+            self._revocation_seq = max(self._revocation_seq, revocation.get("seq", 0))
+    
+    async def refresh_revocations(self):
+        """Pull revocations made by other workers since the last refresh.
+        
+        Numbers are handed out before the revocation is written, so a later
+        one can land first. The sync point only moves past consecutive
+        numbers; a missing one is read again on the next refresh, until it has
+        been missing for REVOCATION_GAP_SECONDS.
+        """
+        now = datetime.utcnow()
+        applied = self._revocation_seq
+        gap = False
+        cursor = db.revoked_tokens.find(
+            {"seq": {"$gt": self._revocation_seq}}, {"_id": 0, "jti": 1, "expires_at": 1, "seq": 1}
+        ).sort("seq", 1)
+        async for revocation in cursor:
+            if revocation["expires_at"] > now:
+                self.revoked[revocation["jti"]] = revocation["expires_at"]
+            if revocation["seq"] == applied + 1 and not gap:
+                applied = revocation["seq"]
+            else:
+                gap = True
+                last_seq = revocation["seq"]
+        if not gap:
+            self._revocation_gap_since = None
+        elif self._revocation_gap_since is None:
+            self._revocation_gap_since = time.monotonic()
+        elif time.monotonic() - self._revocation_gap_since >= REVOCATION_GAP_SECONDS:
+            # The number was claimed by a revocation that was never written
+            applied = last_seq
+            self._revocation_gap_since = None
+        self._revocation_seq = applied
+        for jti in [jti for jti, expires_at in self.revoked.items() if expires_at <= now]:
+            del self.revoked[jti]
+    
+    async def _run_revocation_refresh(self):
+        while True:
+            try:
+                await self.refresh_revocations()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logging.error(f"Revocation list refresh error: {str(e)}")
+            await asyncio.sleep(self.refresh_interval)
+    
+    async def start(self):
+        await db.revoked_tokens.create_index("jti", unique=True)
+        await db.revoked_tokens.create_index("expires_at", expireAfterSeconds=0)
+        await db.revoked_tokens.create_index("seq")
+        await self.load_revocations()
+        self._refresh_task = asyncio.create_task(self._run_revocation_refresh())
+    
+    async def close(self):
+        if getattr(self, "_refresh_task", None):
+            self._refresh_task.cancel()
+    
+    def metrics(self) -> Dict[str, Any]:
+        return {
+            "driver": "signed",
+            "ttl_seconds": self.ttl,
+            "active_kid": self.active_kid,
+            "verification_kids": list(self.keys),
+            "revocation_list_size": len(self.revoked),
+            **self.stats
+        }
+
+if SESSION_TOKEN_MODE == "signed":
+    session_manager = SignedTokenSessions(parse_signing_keys(SESSION_SIGNING_KEYS))
+else:
+    session_manager = SessionManager(build_session_store())
+
+# User Profile Cache
+# /auth/verify runs on every app load; profile fields change rarely enough that
+# a short TTL keeps the endpoint free of per-request database round trips.
+# Writes to users from any worker (or made directly in the database) evict the
+# entry through a change stream; the TTL bounds staleness without one.
+USER_PROFILE_CACHE_SIZE = int(os.environ.get('USER_PROFILE_CACHE_SIZE', '1024'))
+USER_PROFILE_CACHE_TTL = float(os.environ.get('USER_PROFILE_CACHE_TTL', '60'))
+USER_PROFILE_FIELDS = {"_id": 1, "id": 1, "username": 1, "full_name": 1, "email": 1}
+
+class UserProfileCache:
+    """LRU cache of the public profile fields of users"""
+    
+    def __init__(self, max_size: int = USER_PROFILE_CACHE_SIZE, ttl: float = USER_PROFILE_CACHE_TTL):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._entries: "OrderedDict[str, tuple]" = OrderedDict()
+        # MongoDB _id -> user id, since change events only carry the _id
+        self._object_ids: Dict[Any, str] = {}
+        self.stats = {"hits": 0, "misses": 0, "invalidations": 0}
+    
+    async def get(self, user_id: str) -> Optional[Dict[str, Any]]:
+        entry = self._entries.get(user_id)
+        if entry and entry[0] > time.monotonic():
+            self._entries.move_to_end(user_id)
+            self.stats["hits"] += 1
+            return dict(entry[2])
+        self.stats["misses"] += 1
+        profile = await db.users.find_one({"id": user_id}, USER_PROFILE_FIELDS)
+        if profile is None:
+            self.invalidate(user_id)
+            return None
+        object_id = profile.pop("_id")
+        self.invalidate(user_id)
+        self._entries[user_id] = (time.monotonic() + self.ttl, object_id, profile)
+        self._object_ids[object_id] = user_id
+        while len(self._entries) > self.max_size:
+            self.invalidate(next(iter(self._entries)))
+        return dict(profile)
+    
+    def invalidate(self, user_id: str):
+        entry = self._entries.pop(user_id, None)
+        if entry:
+            self._object_ids.pop(entry[1], None)
+    
+    def invalidate_object_id(self, object_id: Any):
+        user_id = self._object_ids.get(object_id)
+        if user_id:
+            self.invalidate(user_id)
+            self.stats["invalidations"] += 1
+    
+    def clear(self):
+        self._entries.clear()
+        self._object_ids.clear()
+    
+    def metrics(self) -> Dict[str, Any]:
+        lookups = self.stats["hits"] + self.stats["misses"]
+        return {
+            "size": len(self._entries),
+            "ttl_seconds": self.ttl,
+            "change_stream_active": change_stream_fanout.active,
+            "hit_ratio": round(self.stats["hits"] / lookups, 3) if lookups else None,
+            **self.stats
+        }
+
+user_profile_cache = UserProfileCache()
+
+async def clear_user_profile_cache():
+    user_profile_cache.clear()
+
+# Evict cached profiles on writes to users from any worker
+change_stream_fanout.register(ChangeStreamConsumer(
+    "user_profile_cache", ["users"], ["update", "replace", "delete"],
+    on_change=lambda change: user_profile_cache.invalidate_object_id(change["documentKey"]["_id"]),
+    on_lost=clear_user_profile_cache
+))
 
 # PDF Generation Functions
 def generate_case_pdf(case: dict) -> BytesIO:
@@ -401,36 +2919,281 @@ def generate_case_pdf(case: dict) -> BytesIO:
     doc.build(story)
     buffer.seek(0)
     return buffer
-async def save_uploaded_file(file: UploadFile) -> Dict[str, Any]:
-    """Save uploaded file and return file info"""
-    file_id = str(uuid.uuid4())
-    file_extension = file.filename.split('.')[-1] if '.' in file.filename else ''
-    saved_filename = f"{file_id}.{file_extension}"
-    file_path = UPLOAD_DIR / saved_filename
+
+# PDF Report Cache
+# ReportLab layout is CPU-bound, so reports render in a process pool. Rendered
+# files are cached on disk under a key that changes whenever the case or its
+# analysis does, and are sent straight from disk with FileResponse. A report's
+# mtime is bumped on every use (atime is unreliable on noatime mounts) and
+# files used within PDF_CACHE_GRACE_SECONDS are never deleted, so a path
+# handed out is still there when the response opens it.
+PDF_RENDER_WORKERS = int(os.environ.get('PDF_RENDER_WORKERS', '2'))
+PDF_CACHE_DIR = Path(os.environ.get('PDF_CACHE_DIR', str(ROOT_DIR / "pdf_cache")))
+PDF_CACHE_MAX_BYTES = int(os.environ.get('PDF_CACHE_MAX_MB', '512')) * 1024 * 1024
+PDF_PRERENDER = os.environ.get('PDF_PRERENDER', 'true').lower() == 'true'
+PDF_CACHE_GRACE_SECONDS = int(os.environ.get('PDF_CACHE_GRACE_SECONDS', '300'))
+
+pdf_render_executor: Optional[ProcessPoolExecutor] = None
+# Cache key -> render in progress, so concurrent exports of a case render once
+pdf_renders_in_flight: Dict[str, asyncio.Future] = {}
+pdf_report_stats = {"renders": 0, "cache_hits": 0, "prerenders": 0, "render_errors": 0, "pruned": 0}
+
+def get_pdf_render_executor() -> ProcessPoolExecutor:
+    global pdf_render_executor
+    if pdf_render_executor is None:
+        pdf_render_executor = ProcessPoolExecutor(max_workers=PDF_RENDER_WORKERS)
+    return pdf_render_executor
+
+def render_case_pdf_bytes(case: dict) -> bytes:
+    """Process pool entry point"""
+    return generate_case_pdf(case).getvalue()
+
+def prepare_case_for_pdf(case: Dict[str, Any]) -> Dict[str, Any]:
+    """Format dates the way the report prints them"""
+    for key in ("created_at", "updated_at"):
+        if hasattr(case.get(key), "strftime"):
+            case[key] = case[key].strftime("%Y-%m-%d %H:%M:%S")
+    return case
+
+def pdf_cache_key(case: Dict[str, Any]) -> str:
+    updated_at = case.get("updated_at")
+    updated_ms = int(updated_at.replace(tzinfo=timezone.utc).timestamp() * 1000) if hasattr(updated_at, "timestamp") else 0
+    return f"{case['id']}-v{case.get('version', 0)}-a{case.get('analysis_version', 0)}-{updated_ms}"
+
+def touch_pdf_cache_file(path: Path) -> bool:
+    """Mark a cached report as just used; False if it is not cached"""
+    try:
+        os.utime(path)
+        return True
+    except FileNotFoundError:
+        return False
+
+def write_pdf_cache_file(case_id: str, path: Path, pdf_bytes: bytes):
+    """Atomically store a rendered report and drop older renders of the case that are no longer in use"""
+    PDF_CACHE_DIR.mkdir(parents=True, exist_ok=True)
+    temp_path = path.with_suffix(f".{uuid.uuid4().hex}.tmp")
+    temp_path.write_bytes(pdf_bytes)
+    os.replace(temp_path, path)
+    in_use_after = time.time() - PDF_CACHE_GRACE_SECONDS
+    for stale in PDF_CACHE_DIR.glob(f"{case_id}-*.pdf"):
+        try:
+            if stale != path and stale.stat().st_mtime < in_use_after:
+                stale.unlink(missing_ok=True)
+        except FileNotFoundError:
+            continue
+
+def prune_pdf_cache():
+    """Evict least recently used reports once the cache exceeds its size budget"""
+    files = []
+    for path in PDF_CACHE_DIR.glob("*.pdf"):
+        try:
+            stat = path.stat()
+            files.append((stat.st_mtime, stat.st_size, path))
+        except FileNotFoundError:
+            continue
+    total = sum(size for _, size, _ in files)
+    in_use_after = time.time() - PDF_CACHE_GRACE_SECONDS
+    for used_at, size, path in sorted(files):
+        # Recently used reports may be about to be served, even over budget
+        if total <= PDF_CACHE_MAX_BYTES or used_at >= in_use_after:
+            break
+        path.unlink(missing_ok=True)
+        total -= size
+        pdf_report_stats["pruned"] += 1
+
+async def _render_case_report(case: Dict[str, Any], path: Path):
+    loop = asyncio.get_running_loop()
+    case["analysis_result"] = await load_case_analysis(case)
+    pdf_bytes = await loop.run_in_executor(get_pdf_render_executor(), render_case_pdf_bytes, prepare_case_for_pdf(case))
+    await asyncio.to_thread(write_pdf_cache_file, case["id"], path, pdf_bytes)
+    pdf_report_stats["renders"] += 1
+    await asyncio.to_thread(prune_pdf_cache)
+
+async def get_case_report(case: Dict[str, Any]) -> Path:
+    """Path of the rendered report for this version of the case, rendering it if needed"""
+    key = pdf_cache_key(case)
+    path = PDF_CACHE_DIR / f"{key}.pdf"
+    if await asyncio.to_thread(touch_pdf_cache_file, path):
+        pdf_report_stats["cache_hits"] += 1
+        return path
+    
+    render = pdf_renders_in_flight.get(key)
+    if render is None:
+        render = asyncio.ensure_future(_render_case_report(case, path))
+        pdf_renders_in_flight[key] = render
+        render.add_done_callback(lambda _: pdf_renders_in_flight.pop(key, None))
+    try:
+        await asyncio.shield(render)
+    except Exception:
+        pdf_report_stats["render_errors"] += 1
+        raise
+    return path
+
+async def prerender_case_report(case_id: str):
+    """Render a case's report in the background so the first export is a cache hit"""
+    try:
+        case = await get_cached_case(case_id)
+        if case:
+            await get_case_report(case)
+            pdf_report_stats["prerenders"] += 1
+    except Exception as e:
+        logging.error(f"PDF pre-render error for case {case_id}: {str(e)}")
+
+def pdf_report_metrics() -> Dict[str, Any]:
+    return {"in_flight": len(pdf_renders_in_flight), "workers": PDF_RENDER_WORKERS, **pdf_report_stats}
+
+# Batch PDF Export
+# Reports render in parallel through the report cache and are streamed into a
+# ZIP archive as each one finishes; zipfile writes to a non-seekable sink using
+# data descriptors, so at most one read chunk of the archive is held in memory.
+# Progress is kept in pdf_exports so that any worker can answer a poll.
+PDF_BATCH_MAX_CASES = int(os.environ.get('PDF_BATCH_MAX_CASES', '500'))
+PDF_BATCH_CONCURRENCY = int(os.environ.get('PDF_BATCH_CONCURRENCY', '4'))
+PDF_ZIP_CHUNK_SIZE = 256 * 1024
+PDF_BATCH_RETENTION_DAYS = 7
+
+class ZipStreamBuffer:
+    """Write-only sink collecting zipfile output until the response drains it"""
+    
+    def __init__(self):
+        self._chunks: List[bytes] = []
+    
+    def write(self, data) -> int:
+        self._chunks.append(bytes(data))
+        return len(data)
+    
+    def flush(self):
+        pass
+    
+    def drain(self) -> bytes:
+        data = b"".join(self._chunks)
+        self._chunks.clear()
+        return data
+
+def report_archive_name(case: Dict[str, Any]) -> str:
+    label = re.sub(r"[^A-Za-z0-9_-]+", "_", case.get("patient_name") or case.get("patient_id") or "case").strip("_")
+    return f"{label or 'case'}_{case['id'][:8]}.pdf"
+
+async def create_batch_pdf_export(total: int) -> Dict[str, Any]:
+    started_at = datetime.utcnow()
+    export = {
+        "id": str(uuid.uuid4()),
+        "status": "running",
+        "total": total,
+        "rendered": 0,
+        "failed": 0,
+        "reports": [],
+        "started_at": started_at,
+        "finished_at": None
+    }
+    # insert_one adds _id to the document it is given
+    await db.pdf_exports.insert_one({
+        **export, "expires_at": started_at + timedelta(days=PDF_BATCH_RETENTION_DAYS)
+    })
+    return export
+
+async def update_batch_pdf_export(export_id: str, update: Dict[str, Any]):
+    """Record export progress; a failed write must not break the download"""
+    try:
+        await db.pdf_exports.update_one({"id": export_id}, update)
+    except Exception as e:
+        logging.error(f"Batch PDF progress update error for {export_id}: {str(e)}")
+
+async def stream_pdf_archive(export: Dict[str, Any], cases: List[Dict[str, Any]]):
+    """Yield a ZIP archive of case reports, adding each report as soon as it is rendered"""
+    semaphore = asyncio.Semaphore(PDF_BATCH_CONCURRENCY)
     
-    # Save file
-    async with aiofiles.open(file_path, 'wb') as f:
-        content = await file.read()
-        await f.write(content)
+    async def render(case):
+        async with semaphore:
+            try:
+                return case, await get_case_report(case), None
+            except Exception as e:
+                logging.error(f"Batch PDF render error for case {case['id']}: {str(e)}")
+                return case, None, str(e)
     
-    # Get file info
-    file_info = {
+    sink = ZipStreamBuffer()
+    archive = zipfile.ZipFile(sink, mode="w", compression=zipfile.ZIP_STORED)
+    tasks = [asyncio.create_task(render(case)) for case in cases]
+    try:
+        for finished in asyncio.as_completed(tasks):
+            case, pdf_path, error = await finished
+            report = {"case_id": case["id"], "file": None, "error": error}
+            if pdf_path:
+                report["file"] = report_archive_name(case)
+                with archive.open(report["file"], "w") as entry:
+                    async with aiofiles.open(pdf_path, "rb") as pdf_file:
+                        while chunk := await pdf_file.read(PDF_ZIP_CHUNK_SIZE):
+                            entry.write(chunk)
+                            yield sink.drain()
+                export["rendered"] += 1
+            else:
+                export["failed"] += 1
+            export["reports"].append(report)
+            await update_batch_pdf_export(export["id"], {
+                "$inc": {"rendered" if pdf_path else "failed": 1}, "$push": {"reports": report}
+            })
+            data = sink.drain()
+            if data:
+                yield data
+        
+        export["status"] = "completed"
+        export["finished_at"] = datetime.utcnow()
+        await update_batch_pdf_export(export["id"], {
+            "$set": {"status": "completed", "finished_at": export["finished_at"]}
+        })
+        archive.writestr("manifest.json", orjson.dumps(export, default=json_default, option=orjson.OPT_INDENT_2))
+        archive.close()
+        yield sink.drain()
+    finally:
+        if export["status"] != "completed":
+            # The client went away mid-download
+            export["status"] = "cancelled"
+            export["finished_at"] = datetime.utcnow()
+        for task in tasks:
+            task.cancel()
+        if export["status"] == "cancelled":
+            await update_batch_pdf_export(export["id"], {
+                "$set": {"status": "cancelled", "finished_at": export["finished_at"]}
+            })
+
+UPLOAD_CHUNK_SIZE = 1024 * 1024
+
+def new_upload_info(filename: str, content_type: Optional[str]) -> Dict[str, Any]:
+    """File info for a new upload; file_size grows as the file is written"""
+    file_id = str(uuid.uuid4())
+    file_extension = filename.split('.')[-1] if '.' in filename else ''
+    saved_filename = f"{file_id}.{file_extension}"
+    return {
         "id": file_id,
-        "original_name": file.filename,
+        "original_name": filename,
         "saved_name": saved_filename,
-        "file_path": str(file_path),
-        "file_size": len(content),
-        "mime_type": file.content_type or mimetypes.guess_type(file.filename)[0] or "application/octet-stream",
+        "file_path": str(UPLOAD_DIR / saved_filename),
+        "file_size": 0,
+        "mime_type": content_type or mimetypes.guess_type(filename)[0] or "application/octet-stream",
         "uploaded_at": datetime.utcnow()
     }
+
+async def save_uploaded_file(file: UploadFile) -> Dict[str, Any]:
+    """Save uploaded file and return file info"""
+    file_info = new_upload_info(file.filename, file.content_type)
+    
+    # Save file chunk by chunk instead of reading it into memory
+    async with aiofiles.open(file_info["file_path"], 'wb') as f:
+        while chunk := await file.read(UPLOAD_CHUNK_SIZE):
+            await f.write(chunk)
+            file_info["file_size"] += len(chunk)
     
     return file_info
 
-async def analyze_clinical_case(case_summary: str, uploaded_files: List[Dict[str, Any]]) -> ClinicalAnalysisResult:
+async def analyze_clinical_case(case_summary: str, uploaded_files: List[Dict[str, Any]],
+                                file_interpretations: Optional[List[Dict[str, Any]]] = None) -> ClinicalAnalysisResult:
     """Analyze clinical case using Gemini 2.5 Pro with enhanced per-file analysis"""
     try:
-        # First, analyze each file individually
-        individual_file_interpretations = await analyze_individual_files(uploaded_files)
+        # First, analyze each file individually unless that already happened during upload
+        if file_interpretations is not None:
+            individual_file_interpretations = file_interpretations
+        else:
+            individual_file_interpretations = await analyze_individual_files(uploaded_files)
         
         # Create a new Gemini chat instance for comprehensive analysis
         session_id = f"clinical-analysis-{uuid.uuid4()}"
@@ -466,7 +3229,7 @@ async def analyze_clinical_case(case_summary: str, uploaded_files: List[Dict[str
             }
             
             Important: This is an AI assistant tool and should not replace professional medical judgment."""
-        ).with_model("gemini", "gemini-2.5-flash-preview-04-17").with_max_tokens(8192)
+        ).with_model("gemini", CLINICAL_ANALYSIS_MODEL).with_max_tokens(8192)
         
         # Prepare files for analysis
         file_contents = []
@@ -571,22 +3334,446 @@ Recommendations: {', '.join(interp['recommendations'])}
             )
         
     except Exception as e:
-        logging.error(f"Error in clinical analysis: {str(e)}")
-        # Return basic analysis on error
-        return ClinicalAnalysisResult(
-            soap_note={
-                "subjective": "Error in analysis",
-                "objective": "Technical issue occurred",
-                "assessment": "Unable to complete analysis",
-                "plan": "Please retry analysis"
-            },
-            differential_diagnoses=[{"diagnosis": "Analysis failed", "likelihood": 0, "rationale": str(e)}],
-            treatment_recommendations=["Retry analysis", "Consult healthcare provider"],
-            investigation_suggestions=["Technical review required"],
-            file_interpretations=[{"file_name": "error", "interpretation": f"Analysis failed: {str(e)}"}],
-            confidence_score=0,
-            overall_assessment=f"Analysis failed due to technical error: {str(e)}"
-        )
+        logging.error(f"Error in clinical analysis: {str(e)}")
+        # Return basic analysis on error
+        return ClinicalAnalysisResult(
+            soap_note={
+                "subjective": "Error in analysis",
+                "objective": "Technical issue occurred",
+                "assessment": "Unable to complete analysis",
+                "plan": "Please retry analysis"
+            },
+            differential_diagnoses=[{"diagnosis": "Analysis failed", "likelihood": 0, "rationale": str(e)}],
+            treatment_recommendations=["Retry analysis", "Consult healthcare provider"],
+            investigation_suggestions=["Technical review required"],
+            file_interpretations=[{"file_name": "error", "interpretation": f"Analysis failed: {str(e)}"}],
+            confidence_score=0,
+            overall_assessment=f"Analysis failed due to technical error: {str(e)}"
+        )
+
+async def run_case_analysis(case: Dict[str, Any], file_interpretations: Optional[List[Dict[str, Any]]] = None):
+    """Analyze a case and store the result as a new analysis version.
+    
+    Returns the analysis result and the stored run, which is None if the
+    case was modified while the analysis ran.
+    """
+    analysis_result = await analyze_clinical_case(
+        case["patient_summary"], 
+        case.get("uploaded_files", []),
+        file_interpretations
+    )
+    stored = await store_case_analysis(case, analysis_result.dict())
+    if stored and PDF_PRERENDER:
+        start_background_job(prerender_case_report(case["id"]))
+    return analysis_result, stored
+
+# Bulk Import Helpers
+IMPORT_BATCH_SIZE = 1000
+IMPORT_MAX_REPORTED_ERRORS = 1000
+IMPORT_ANALYSIS_CONCURRENCY = int(os.environ.get('IMPORT_ANALYSIS_CONCURRENCY', '2'))
+IMPORT_ANALYSIS_PER_MINUTE = int(os.environ.get('IMPORT_ANALYSIS_PER_MINUTE', '30'))
+
+# Strong references to fire-and-forget jobs so they aren't garbage collected
+background_jobs = set()
+
+def start_background_job(coroutine) -> asyncio.Task:
+    """Run a coroutine in the background, keeping a reference until it finishes"""
+    task = asyncio.create_task(coroutine)
+    background_jobs.add(task)
+    task.add_done_callback(background_jobs.discard)
+    return task
+
+async def iter_ndjson_lines(request: Request):
+    """Yield raw lines of a streamed NDJSON request body"""
+    buffer = b""
+    async for chunk in request.stream():
+        buffer += chunk
+        *lines, buffer = buffer.split(b"\n")
+        for line in lines:
+            yield line
+    if buffer:
+        yield buffer
+
+def build_imported_case(row: Dict[str, Any]) -> ClinicalCase:
+    """Validate an import row and turn it into a case, keeping a historical created_at"""
+    case_data = ClinicalCaseCreate(**row)
+    case_obj = ClinicalCase(**case_data.dict())
+    if row.get("created_at"):
+        case_obj.created_at = datetime.fromisoformat(str(row["created_at"]).replace("Z", "+00:00"))
+        if case_obj.created_at.tzinfo is not None:
+            # Stored as naive UTC like every other timestamp
+            case_obj.created_at = case_obj.created_at.astimezone(timezone.utc).replace(tzinfo=None)
+        case_obj.updated_at = case_obj.created_at
+    return case_obj
+
+async def insert_import_batch(batch: List[Dict[str, Any]], row_numbers: List[int],
+                              errors: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """Insert a batch unordered, returning the inserted cases and recording failed rows up to the report limit"""
+    try:
+        await db.clinical_cases.insert_many(batch, ordered=False)
+        query_cache.bump(*(case["doctor_id"] for case in batch))
+        return batch
+    except BulkWriteError as e:
+        query_cache.bump(*(case["doctor_id"] for case in batch))
+        failed = set()
+        for write_error in e.details.get("writeErrors", []):
+            failed.add(write_error["index"])
+            if len(errors) < IMPORT_MAX_REPORTED_ERRORS:
+                errors.append({"row": row_numbers[write_error["index"]], "error": write_error.get("errmsg")})
+        return [case for index, case in enumerate(batch) if index not in failed]
+
+async def analyze_cases_throttled(case_ids: List[str], concurrency: int, per_minute: int):
+    """Analyze cases in the background with bounded concurrency and a start rate limit"""
+    semaphore = asyncio.Semaphore(concurrency)
+    interval = 60.0 / per_minute if per_minute > 0 else 0
+    
+    async def analyze_one(case_id: str):
+        try:
+            case = await db.clinical_cases.find_one({"id": case_id})
+            if case:
+                await run_case_analysis(case)
+        except Exception as e:
+            logging.error(f"Queued analysis error for case {case_id}: {str(e)}")
+        finally:
+            semaphore.release()
+    
+    for case_id in case_ids:
+        await semaphore.acquire()
+        start_background_job(analyze_one(case_id))
+        if interval:
+            await asyncio.sleep(interval)
+    
+    # Wait for the last analyses to finish
+    for _ in range(concurrency):
+        await semaphore.acquire()
+    logging.info(f"Finished queued analysis of {len(case_ids)} imported cases")
+
+# Case Intake
+# One multipart request creates a case, stores its files and analyzes it. The
+# body is parsed while it streams in: each file goes to disk chunk by chunk and
+# its analysis starts as soon as it is complete, while later parts are still
+# arriving. The case is inserted once with all its files, so nothing is re-read.
+# Jobs live in intake_jobs so that any worker can answer a poll.
+INTAKE_MAX_FIELD_BYTES = 1024 * 1024
+INTAKE_JOB_RETENTION_DAYS = 7
+INTAKE_ANALYSIS_CONCURRENCY = int(os.environ.get('INTAKE_ANALYSIS_CONCURRENCY', '4'))
+
+# Shared by all intake requests of this worker, so many files can't start unbounded model calls
+intake_analysis_slots = asyncio.Semaphore(INTAKE_ANALYSIS_CONCURRENCY)
+
+async def analyze_intake_file(file_info: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+    """Analyze one intake file once an analysis slot is free"""
+    async with intake_analysis_slots:
+        return await analyze_single_file(file_info)
+
+class MultipartStream:
+    """Push parser turning chunks of a multipart/form-data body into part events:
+    ("begin", name, filename, content_type), ("data", bytes) and ("end",)
+    """
+    
+    def __init__(self, content_type_header: str):
+        content_type, params = parse_options_header(content_type_header)
+        if content_type != b"multipart/form-data" or not params.get(b"boundary"):
+            raise HTTPException(status_code=400, detail="Expected a multipart/form-data body")
+        self._events: List[tuple] = []
+        self._headers: Dict[bytes, bytes] = {}
+        self._header_field = b""
+        self._header_value = b""
+        self.parser = multipart.MultipartParser(params[b"boundary"], {
+            "on_part_begin": self._on_part_begin,
+            "on_header_field": self._on_header_field,
+            "on_header_value": self._on_header_value,
+            "on_header_end": self._on_header_end,
+            "on_headers_finished": self._on_headers_finished,
+            "on_part_data": self._on_part_data,
+            "on_part_end": self._on_part_end
+        })
+    
+    def feed(self, chunk: bytes) -> List[tuple]:
+        self.parser.write(chunk)
+        return self._take()
+    
+    def finish(self) -> List[tuple]:
+        self.parser.finalize()
+        return self._take()
+    
+    def _take(self) -> List[tuple]:
+        events, self._events = self._events, []
+        return events
+    
+    def _on_part_begin(self):
+        self._headers = {}
+    
+    def _on_header_field(self, data: bytes, start: int, end: int):
+        self._header_field += data[start:end]
+    
+    def _on_header_value(self, data: bytes, start: int, end: int):
+        self._header_value += data[start:end]
+    
+    def _on_header_end(self):
+        self._headers[self._header_field.lower()] = self._header_value
+        self._header_field = b""
+        self._header_value = b""
+    
+    def _on_headers_finished(self):
+        _, options = parse_options_header(self._headers.get(b"content-disposition", b""))
+        filename = options.get(b"filename")
+        self._events.append((
+            "begin",
+            options.get(b"name", b"").decode("latin-1"),
+            None if filename is None else Path(filename.decode("utf-8", "replace")).name,
+            self._headers.get(b"content-type", b"").decode("latin-1") or None
+        ))
+    
+    def _on_part_data(self, data: bytes, start: int, end: int):
+        self._events.append(("data", data[start:end]))
+    
+    def _on_part_end(self):
+        self._events.append(("end",))
+
+async def create_intake_job(case: Dict[str, Any]) -> Dict[str, Any]:
+    started_at = datetime.utcnow()
+    job = {
+        "id": str(uuid.uuid4()),
+        "case_id": case["id"],
+        "status": "analyzing",
+        "file_count": len(case["uploaded_files"]),
+        "analysis": None,
+        "error": None,
+        "started_at": started_at,
+        "finished_at": None,
+        "expires_at": started_at + timedelta(days=INTAKE_JOB_RETENTION_DAYS)
+    }
+    # insert_one adds _id to the document it is given
+    await db.intake_jobs.insert_one(dict(job))
+    return job
+
+async def finish_case_intake(job: Dict[str, Any], case: Dict[str, Any], file_analyses: List[asyncio.Task]):
+    """Wait for the per-file analyses started during upload and store the case analysis"""
+    try:
+        file_interpretations = [
+            interpretation for interpretation in await asyncio.gather(*file_analyses) if interpretation is not None
+        ]
+        analysis_result, stored = await run_case_analysis(case, file_interpretations)
+        job["analysis"] = analysis_result.dict()
+        # Someone else changed the case meanwhile; the analysis was not stored
+        job["status"] = "completed" if stored else "conflict"
+    except Exception as e:
+        logging.error(f"Intake analysis error for case {case['id']}: {str(e)}")
+        job["status"] = "failed"
+        job["error"] = str(e)
+    finally:
+        job["finished_at"] = datetime.utcnow()
+        try:
+            await db.intake_jobs.update_one({"id": job["id"]}, {"$set": {
+                field: job[field] for field in ("status", "analysis", "error", "finished_at")
+            }})
+        except Exception as e:
+            logging.error(f"Intake job update error for {job['id']}: {str(e)}")
+    return job
+
+# Batch Re-analysis
+# Re-runs analysis over a filtered set of cases, e.g. after a model or prompt
+# change. Progress is checkpointed in reanalysis_jobs so a crashed run can resume.
+REANALYSIS_PAGE_SIZE = 100
+
+def is_failed_analysis(result: ClinicalAnalysisResult) -> bool:
+    """Whether analyze_clinical_case returned its technical-error fallback"""
+    diagnoses = result.differential_diagnoses
+    return result.confidence_score == 0 and bool(diagnoses) and diagnoses[0].get("diagnosis") == "Analysis failed"
+
+def build_reanalysis_query(filters: ReanalysisFilters) -> Dict[str, Any]:
+    """Compile re-analysis filters into a case query"""
+    query: Dict[str, Any] = {}
+    if filters.only_analyzed:
+        query["analysis_id"] = {"$ne": None}
+    if filters.doctor_id:
+        query["doctor_id"] = filters.doctor_id
+    if filters.date_from or filters.date_to:
+        query["created_at"] = {}
+        if filters.date_from:
+            query["created_at"]["$gte"] = parse_date_filter(filters.date_from, "date_from")
+        if filters.date_to:
+            query["created_at"]["$lte"] = parse_date_filter(filters.date_to, "date_to")
+    if filters.model or filters.exclude_model:
+        query["analysis_model"] = {}
+        if filters.model:
+            query["analysis_model"]["$eq"] = filters.model
+        if filters.exclude_model:
+            query["analysis_model"]["$ne"] = filters.exclude_model
+    return query
+
+class ReanalysisRunner:
+    """Runs and checkpoints one re-analysis job.
+    
+    Cases are visited in (created_at, id) order. The checkpoint cursor only
+    advances past a case once it and every case before it finished, so a
+    resumed job redoes at most `concurrency` in-flight cases. Stored counters
+    and errors only cover cases behind the cursor, so redone cases are not
+    counted twice.
+    """
+    
+    def __init__(self, job: Dict[str, Any]):
+        self.job = job
+        self.job_id = job["id"]
+        self.filters = ReanalysisFilters(**job["filters"])
+        self.concurrency = max(1, job.get("concurrency", 2))
+        self.per_minute = job.get("per_minute", 0)
+        self.cursor = job.get("cursor")
+        self.counters = {
+            "processed": job.get("processed", 0),
+            "succeeded": job.get("succeeded", 0),
+            "failed": job.get("failed", 0),
+            "conflicts": job.get("conflicts", 0)
+        }
+        self.total = job.get("total", 0)
+        self._session_started = None
+        self._session_processed = 0
+        self._next_position = 0
+        self._commit_position = 0
+        self._pending_cursors: Dict[int, str] = {}
+        # Position -> (outcome, error) of cases finished ahead of the cursor
+        self._completed: Dict[int, tuple] = {}
+        self._checkpoint_lock = asyncio.Lock()
+    
+    @classmethod
+    async def create(cls, request: ReanalysisJobCreate) -> "ReanalysisRunner":
+        """Register a new job and count the cases it will process"""
+        total = await db.clinical_cases.count_documents(build_reanalysis_query(request.filters))
+        job = {
+            "id": str(uuid.uuid4()),
+            "filters": request.filters.dict(),
+            "concurrency": request.concurrency,
+            "per_minute": request.per_minute,
+            "model": CLINICAL_ANALYSIS_MODEL,
+            "status": "pending",
+            "total": total,
+            "processed": 0,
+            "succeeded": 0,
+            "failed": 0,
+            "conflicts": 0,
+            "cursor": None,
+            "errors": [],
+            "created_at": datetime.utcnow(),
+            "updated_at": datetime.utcnow()
+        }
+        await db.reanalysis_jobs.insert_one(job)
+        job.pop("_id", None)
+        return cls(job)
+    
+    @classmethod
+    async def load(cls, job_id: str) -> Optional["ReanalysisRunner"]:
+        job = await db.reanalysis_jobs.find_one({"id": job_id}, {"_id": 0})
+        return cls(job) if job else None
+    
+    def progress(self) -> Dict[str, Any]:
+        """Counters plus throughput and ETA of the current session"""
+        elapsed = time.monotonic() - self._session_started if self._session_started else 0
+        rate = self._session_processed / elapsed if elapsed > 0 else 0
+        counters = dict(self.counters)
+        for outcome, _ in self._completed.values():
+            counters["processed"] += 1
+            counters[outcome] += 1
+        remaining = max(self.total - counters["processed"], 0)
+        return {
+            "job_id": self.job_id,
+            "status": self.job.get("status"),
+            "total": self.total,
+            **counters,
+            "cases_per_minute": round(rate * 60, 2),
+            "eta_seconds": round(remaining / rate) if rate > 0 else None
+        }
+    
+    async def _checkpoint(self, errors: Optional[List[Dict[str, str]]] = None, **fields):
+        async with self._checkpoint_lock:
+            update: Dict[str, Any] = {
+                "$set": {**self.counters, "cursor": self.cursor, "updated_at": datetime.utcnow(), **fields}
+            }
+            if errors:
+                update["$push"] = {"errors": {"$each": errors, "$slice": -100}}
+            await db.reanalysis_jobs.update_one({"id": self.job_id}, update)
+    
+    async def _reanalyze(self, position: int, case: Dict[str, Any], semaphore: asyncio.Semaphore):
+        outcome = "failed"
+        error = None
+        try:
+            result = await analyze_clinical_case(case["patient_summary"], case.get("uploaded_files", []))
+            if is_failed_analysis(result):
+                error = result.overall_assessment
+            else:
+                # Compare-and-swap against the version the page was read at, so a
+                # case edited while its analysis ran is not overwritten with a stale result
+                stored = await store_case_analysis(case, result.dict())
+                outcome = "succeeded" if stored else "conflicts"
+        except Exception as e:
+            error = str(e)
+        finally:
+            semaphore.release()
+        
+        if error:
+            logging.error(f"Re-analysis of case {case['id']} failed: {error}")
+            error = {"case_id": case["id"], "error": error[:500]}
+        self._session_processed += 1
+        self._completed[position] = (outcome, error)
+        
+        # Fold the cases now behind the cursor into the stored counters
+        errors = []
+        while self._commit_position in self._completed:
+            committed_outcome, committed_error = self._completed.pop(self._commit_position)
+            self.counters["processed"] += 1
+            self.counters[committed_outcome] += 1
+            if committed_error:
+                errors.append(committed_error)
+            self.cursor = self._pending_cursors.pop(self._commit_position)
+            self._commit_position += 1
+        await self._checkpoint(errors)
+    
+    async def run(self):
+        """Process all remaining cases, resuming after the stored cursor"""
+        self._session_started = time.monotonic()
+        self.job["status"] = "running"
+        await self._checkpoint(status="running")
+        
+        query = build_reanalysis_query(self.filters)
+        semaphore = asyncio.Semaphore(self.concurrency)
+        interval = 60.0 / self.per_minute if self.per_minute > 0 else 0
+        page_after = self.cursor
+        try:
+            while True:
+                page_query = {**query, **decode_export_cursor(page_after)} if page_after else query
+                # Keyset pagination instead of one long-lived cursor, which could
+                # time out while slow analyses are running
+                page = await db.clinical_cases.find(page_query, {"_id": 0}).sort(
+                    [("created_at", 1), ("id", 1)]
+                ).limit(REANALYSIS_PAGE_SIZE).to_list(REANALYSIS_PAGE_SIZE)
+                if not page:
+                    break
+                for case in page:
+                    await semaphore.acquire()
+                    position = self._next_position
+                    self._next_position += 1
+                    self._pending_cursors[position] = encode_export_cursor(case)
+                    start_background_job(self._reanalyze(position, case, semaphore))
+                    if interval:
+                        await asyncio.sleep(interval)
+                page_after = encode_export_cursor(page[-1])
+            
+            # Wait for in-flight analyses
+            for _ in range(self.concurrency):
+                await semaphore.acquire()
+            self.job["status"] = "completed"
+            await self._checkpoint(status="completed", completed_at=datetime.utcnow())
+        except asyncio.CancelledError:
+            self.job["status"] = "interrupted"
+            await self._checkpoint(status="interrupted")
+            raise
+        except Exception as e:
+            logging.error(f"Re-analysis job {self.job_id} error: {str(e)}")
+            self.job["status"] = "failed"
+            await self._checkpoint(status="failed")
+
+# Jobs started by this process, for live progress reporting
+reanalysis_runners: Dict[str, ReanalysisRunner] = {}
 
 # API Routes
 @api_router.get("/")
@@ -601,18 +3788,90 @@ async def create_case(case_data: ClinicalCaseCreate):
     
     # Save to database
     result = await db.clinical_cases.insert_one(case_obj.dict())
+    query_cache.bump(case_obj.doctor_id)
+    await record_case_created_rollup(case_obj.dict())
+    await record_patient_cases([case_obj.dict()])
     
     # Log audit event
     await log_audit_event(case_data.doctor_id, "case_created", case_obj.id, f"Created case with summary: {case_data.patient_summary[:100]}")
     
     return case_obj
 
+@api_router.post("/cases/import")
+async def import_cases(request: Request, analyze: bool = False, batch_size: int = IMPORT_BATCH_SIZE,
+                       analysis_concurrency: int = IMPORT_ANALYSIS_CONCURRENCY,
+                       analysis_per_minute: int = IMPORT_ANALYSIS_PER_MINUTE):
+    """Bulk import cases from a streamed NDJSON body of ClinicalCaseCreate rows"""
+    started = time.perf_counter()
+    batch_size = max(1, min(batch_size, 10000))
+    errors: List[Dict[str, Any]] = []
+    error_count = 0
+    imported_ids: List[str] = []
+    imported_count = 0
+    total_rows = 0
+    doctor_ids = set()
+    batch: List[Dict[str, Any]] = []
+    row_numbers: List[int] = []
+    
+    async def flush():
+        nonlocal imported_count, error_count
+        inserted = await insert_import_batch(batch, row_numbers, errors)
+        # Only the first errors are kept, so count failures from what was not inserted
+        error_count += len(batch) - len(inserted)
+        imported_count += len(inserted)
+        await record_cases_created_rollup(inserted)
+        await record_patient_cases(inserted)
+        if analyze:
+            imported_ids.extend(case["id"] for case in inserted)
+        batch.clear()
+        row_numbers.clear()
+    
+    try:
+        async for line in iter_ndjson_lines(request):
+            if not line.strip():
+                continue
+            total_rows += 1
+            try:
+                case_obj = build_imported_case(json.loads(line))
+            except (ValueError, TypeError, ValidationError) as e:
+                error_count += 1
+                if len(errors) < IMPORT_MAX_REPORTED_ERRORS:
+                    errors.append({"row": total_rows, "error": str(e)})
+                continue
+            batch.append(case_obj.dict())
+            row_numbers.append(total_rows)
+            doctor_ids.add(case_obj.doctor_id)
+            if len(batch) >= batch_size:
+                await flush()
+        if batch:
+            await flush()
+    except Exception as e:
+        logging.error(f"Bulk import error: {str(e)}")
+        raise HTTPException(status_code=500, detail=str(e))
+    
+    if analyze and imported_ids:
+        start_background_job(analyze_cases_throttled(imported_ids, max(1, analysis_concurrency), analysis_per_minute))
+    
+    for doctor_id in doctor_ids:
+        await log_audit_event(doctor_id, "cases_imported", details=f"Bulk import of {imported_count} cases")
+    
+    elapsed = time.perf_counter() - started
+    return {
+        "total_rows": total_rows,
+        "imported": imported_count,
+        "failed": error_count,
+        "errors": errors[:IMPORT_MAX_REPORTED_ERRORS],
+        "analysis_queued": len(imported_ids),
+        "elapsed_seconds": round(elapsed, 3),
+        "rows_per_second": round(total_rows / elapsed, 1) if elapsed > 0 else None
+    }
+
 @api_router.post("/cases/{case_id}/upload")
 async def upload_files(case_id: str, files: List[UploadFile] = File(...)):
     """Upload files for a clinical case"""
     try:
-        # Find the case
-        case = await db.clinical_cases.find_one({"id": case_id})
+        # Make sure the case exists before writing anything to disk
+        case = await db.clinical_cases.find_one({"id": case_id}, {"_id": 0, "id": 1})
         if not case:
             raise HTTPException(status_code=404, detail="Case not found")
         
@@ -622,21 +3881,226 @@ async def upload_files(case_id: str, files: List[UploadFile] = File(...)):
             file_info = await save_uploaded_file(file)
             uploaded_files.append(file_info)
         
-        # Update case with uploaded files
-        case["uploaded_files"].extend(uploaded_files)
-        case["updated_at"] = datetime.utcnow()
-        
-        await db.clinical_cases.update_one(
-            {"id": case_id},
-            {"$set": case}
-        )
+        # Append to the case atomically so concurrent uploads don't lose files
+        if not await push_case_files(case_id, uploaded_files):
+            raise HTTPException(status_code=404, detail="Case not found")
         
         return {"message": f"Uploaded {len(files)} files successfully", "files": uploaded_files}
         
+    except HTTPException:
+        raise
     except Exception as e:
         logging.error(f"File upload error: {str(e)}")
         raise HTTPException(status_code=500, detail=str(e))
 
+@api_router.post("/cases/intake")
+async def intake_case(request: Request, wait: bool = True):
+    """Create a case from ClinicalCaseCreate fields and files in one multipart request, then analyze it.
+    
+    With wait=false the response returns as soon as the case is stored, with
+    a job to poll at /cases/intake/{job_id}.
+    """
+    fields: Dict[str, str] = {}
+    uploaded_files: List[Dict[str, Any]] = []
+    file_analyses: List[asyncio.Task] = []
+    part: Optional[Dict[str, Any]] = None
+    output = None
+    case_stored = False
+    
+    async def handle(events: List[tuple]):
+        nonlocal part, output
+        for event in events:
+            if event[0] == "begin":
+                _, name, filename, content_type = event
+                part = {"name": name, "filename": filename, "value": b""}
+                if filename:
+                    part["file_info"] = new_upload_info(filename, content_type)
+                    uploaded_files.append(part["file_info"])
+                    output = await aiofiles.open(part["file_info"]["file_path"], "wb")
+            elif event[0] == "data":
+                if output:
+                    await output.write(event[1])
+                    part["file_info"]["file_size"] += len(event[1])
+                elif part["filename"] is None:
+                    part["value"] += event[1]
+                    if len(part["value"]) > INTAKE_MAX_FIELD_BYTES:
+                        raise HTTPException(status_code=413, detail=f"Field {part['name']} is too large")
+            elif event[0] == "end":
+                if output:
+                    await output.close()
+                    output = None
+                    file_analyses.append(asyncio.create_task(analyze_intake_file(part["file_info"])))
+                elif part["filename"] is None:
+                    try:
+                        fields[part["name"]] = part["value"].decode("utf-8")
+                    except UnicodeDecodeError:
+                        raise HTTPException(status_code=400, detail=f"Field {part['name']} is not valid UTF-8")
+                # File inputs left empty arrive as parts with an empty filename and are skipped
+                part = None
+    
+    try:
+        form = MultipartStream(request.headers.get("content-type", ""))
+        async for chunk in request.stream():
+            await handle(form.feed(chunk))
+        await handle(form.finish())
+        
+        try:
+            case_data = ClinicalCaseCreate(**{name: value for name, value in fields.items() if value != ""})
+        except ValidationError as e:
+            raise HTTPException(status_code=422, detail=str(e))
+        
+        case_obj = ClinicalCase(**case_data.dict(), uploaded_files=uploaded_files)
+        await db.clinical_cases.insert_one(case_obj.dict())
+        case_stored = True
+        case = case_obj.dict()
+        query_cache.bump(case_obj.doctor_id)
+        await record_case_created_rollup(case)
+        await record_patient_cases([case])
+        await log_audit_event(
+            case_obj.doctor_id, "case_created", case_obj.id,
+            f"Created case with {len(uploaded_files)} files via intake: {case_obj.patient_summary[:100]}"
+        )
+        
+        job = await create_intake_job(case)
+        if not wait:
+            start_background_job(finish_case_intake(job, case, file_analyses))
+            return FastJSONResponse({"case": case, "job": job}, status_code=202)
+        await finish_case_intake(job, case, file_analyses)
+        return FastJSONResponse({"case": case, "job": job})
+        
+    except HTTPException:
+        raise
+    except ClientDisconnect:
+        raise HTTPException(status_code=400, detail="Client disconnected during upload")
+    except Exception as e:
+        logging.error(f"Case intake error: {str(e)}")
+        raise HTTPException(status_code=500, detail=str(e))
+    finally:
+        if not case_stored:
+            # Nothing references the files of a request that did not produce a case
+            if output:
+                await output.close()
+            for task in file_analyses:
+                task.cancel()
+            for file_info in uploaded_files:
+                Path(file_info["file_path"]).unlink(missing_ok=True)
+
+@api_router.get("/cases/intake/{job_id}")
+async def get_intake_job(job_id: str):
+    """Get the status and analysis of a case intake"""
+    job = await db.intake_jobs.find_one({"id": job_id}, {"_id": 0})
+    if not job:
+        raise HTTPException(status_code=404, detail="Intake job not found")
+    return FastJSONResponse(job)
+
+# Patient Endpoints
+@api_router.get("/patients")
+async def list_patients(doctor_id: str = "default_doctor", limit: int = 50):
+    """List a doctor's patients, most recently seen first"""
+    limit = max(1, min(limit, PATIENT_TIMELINE_MAX_LIMIT))
+    patients = await db.patients.find({"doctor_id": doctor_id}, {"_id": 0}).sort("last_case_at", -1).to_list(limit)
+    return FastJSONResponse({"patients": patients})
+
+@api_router.get("/patients/search")
+async def search_patients(q: str, doctor_id: str = "default_doctor", limit: int = 10):
+    """Find patients by partial or misspelled name or patient id, best match first"""
+    try:
+        limit = max(1, min(limit, PATIENT_SEARCH_MAX_LIMIT))
+        if not q.strip():
+            return FastJSONResponse({"query": q, "source": "index", "matches": []})
+        
+        if not patient_name_index.ready:
+            # Until the index is loaded, fall back to a substring scan
+            pattern = {"$regex": re.escape(q.strip()), "$options": "i"}
+            patients = await db.patients.find(
+                {"doctor_id": doctor_id, "$or": [{"patient_name": pattern}, {"patient_id": pattern}]}, {"_id": 0}
+            ).sort("last_case_at", -1).to_list(limit)
+            return FastJSONResponse({"query": q, "source": "scan", "matches": patients})
+        
+        hits = patient_name_index.search(doctor_id, q, limit)
+        entries = {}
+        if hits:
+            async for patient in db.patients.find(
+                {"doctor_id": doctor_id, "patient_id": {"$in": [hit["patient_id"] for hit in hits]}}, {"_id": 0}
+            ):
+                entries[patient["patient_id"]] = patient
+        matches = [{**entries.get(hit["patient_id"], {}), **hit} for hit in hits]
+        return FastJSONResponse({"query": q, "source": "index", "matches": matches})
+        
+    except Exception as e:
+        logging.error(f"Patient search error: {str(e)}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+@api_router.get("/patients/{patient_id}")
+async def get_patient(patient_id: str, doctor_id: str = "default_doctor"):
+    """Get a patient's index entry"""
+    patient = await db.patients.find_one({"doctor_id": doctor_id, "patient_id": patient_id}, {"_id": 0})
+    if not patient:
+        raise HTTPException(status_code=404, detail="Patient not found")
+    return FastJSONResponse(patient)
+
+@api_router.get("/patients/{patient_id}/timeline")
+async def get_patient_timeline(patient_id: str, doctor_id: str = "default_doctor", limit: int = 20,
+                               order: str = "asc", after: Optional[str] = None, fields: Optional[str] = None):
+    """Page through a patient's cases in chronological order, resumable with the `after` cursor"""
+    extra_fields = parse_case_fields(fields)
+    if order not in ("asc", "desc"):
+        raise HTTPException(status_code=400, detail="order must be 'asc' or 'desc'")
+    limit = max(1, min(limit, PATIENT_TIMELINE_MAX_LIMIT))
+    descending = order == "desc"
+    try:
+        patient = await db.patients.find_one({"doctor_id": doctor_id, "patient_id": patient_id}, {"_id": 0})
+        if not patient:
+            raise HTTPException(status_code=404, detail="Patient not found")
+        
+        # Keyset paging on the (doctor_id, patient_id, created_at, id) index keeps
+        # every page a bounded index range scan however long the history is
+        query: Dict[str, Any] = {"doctor_id": doctor_id, "patient_id": patient_id}
+        if after:
+            query.update(decode_export_cursor(after, descending=descending))
+        direction = -1 if descending else 1
+        cases = await find_case_summaries(
+            query, limit=limit + 1, extra_fields=extra_fields,
+            sort={"created_at": direction, "id": direction}
+        )
+        
+        next_cursor = None
+        if len(cases) > limit:
+            cases = cases[:limit]
+            next_cursor = encode_export_cursor(cases[-1])
+        
+        return FastJSONResponse({"patient": patient, "cases": cases, "next_cursor": next_cursor})
+        
+    except HTTPException:
+        raise
+    except Exception as e:
+        logging.error(f"Patient timeline error: {str(e)}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+@api_router.get("/patients/{patient_id}/lab-trends")
+async def get_patient_lab_trends(patient_id: str, doctor_id: str = "default_doctor", tests: Optional[str] = None):
+    """Lab value series, changes and trends across a patient's cases"""
+    try:
+        patient = await db.patients.find_one({"doctor_id": doctor_id, "patient_id": patient_id}, {"_id": 0})
+        if not patient:
+            raise HTTPException(status_code=404, detail="Patient not found")
+        
+        trends = await load_patient_lab_trends(patient)
+        if tests:
+            # Aliases ("HGB", "Hb") select the canonical test, with all of its unit series
+            wanted = {canonical_test(test) or test.strip().lower() for test in tests.split(",") if test.strip()}
+            trends = {**trends, "tests": {
+                name: trend for name, trend in trends["tests"].items() if trend["test"] in wanted
+            }}
+        
+        return FastJSONResponse({"patient_id": patient_id, **trends})
+        
+    except HTTPException:
+        raise
+    except Exception as e:
+        logging.error(f"Lab trend error: {str(e)}")
+        raise HTTPException(status_code=500, detail=str(e))
+
 # Authentication Endpoints
 @api_router.post("/auth/register", response_model=User)
 async def register_user(user_data: UserCreate):
@@ -653,7 +4117,7 @@ async def register_user(user_data: UserCreate):
             raise HTTPException(status_code=400, detail="Email already exists")
         
         # Create user
-        password_hash = hash_password(user_data.password)
+        password_hash = await hash_password_async(user_data.password)
         user_dict = user_data.dict()
         del user_dict["password"]  # Remove plain password
         user_dict["password_hash"] = password_hash
@@ -673,25 +4137,38 @@ async def register_user(user_data: UserCreate):
         raise HTTPException(status_code=500, detail=str(e))
 
 @api_router.post("/auth/login")
-async def login_user(login_data: UserLogin):
+async def login_user(login_data: UserLogin, request: Request):
     """Login user and create session"""
     try:
+        # The client address behind Railway's proxy; uvicorn resolves it from
+        # X-Forwarded-For since it runs with --proxy-headers
+        ip_address = request.client.host if request.client else "unknown"
+        username_key = login_data.username.lower()
+        
+        # Reject brute-force bursts before spending any hashing time
+        retry_after = ip_login_throttle.retry_after(ip_address) or username_login_throttle.retry_after(username_key)
+        if retry_after:
+            raise HTTPException(
+                status_code=429,
+                detail="Too many failed login attempts, try again later",
+                headers={"Retry-After": str(retry_after)}
+            )
+        
+        # Count the attempt as failed up front so a concurrent burst is throttled too
+        ip_login_throttle.record_failure(ip_address)
+        username_login_throttle.record_failure(username_key)
+        
         # Find user
         user = await db.users.find_one({"username": login_data.username})
-        if not user:
-            raise HTTPException(status_code=401, detail="Invalid username or password")
         
         # Verify password
-        if not verify_password(login_data.password, user["password_hash"]):
+        if not user or not await verify_password_async(login_data.password, user["password_hash"]):
             raise HTTPException(status_code=401, detail="Invalid username or password")
+        ip_login_throttle.forgive(ip_address)
+        username_login_throttle.reset(username_key)
         
         # Create session token
-        session_token = create_session_token()
-        active_sessions[session_token] = {
-            "user_id": user["id"],
-            "username": user["username"],
-            "created_at": datetime.utcnow()
-        }
+        session_token = await session_manager.create(user["id"], user["username"])
         
         # Update last login
         await db.users.update_one(
@@ -700,7 +4177,7 @@ async def login_user(login_data: UserLogin):
         )
         
         # Log audit event
-        await log_audit_event(user["id"], "login", details=f"User {login_data.username} logged in")
+        await log_audit_event(user["id"], "login", details=f"User {login_data.username} logged in", ip_address=ip_address)
         
         return {
             "message": "Login successful",
@@ -723,10 +4200,8 @@ async def login_user(login_data: UserLogin):
 async def logout_user(session_token: str):
     """Logout user and destroy session"""
     try:
-        if session_token in active_sessions:
-            user_info = active_sessions[session_token]
-            del active_sessions[session_token]
-            
+        user_info = await session_manager.destroy(session_token)
+        if user_info:
             # Log audit event
             await log_audit_event(user_info["user_id"], "logout", details=f"User {user_info['username']} logged out")
             
@@ -744,13 +4219,12 @@ async def logout_user(session_token: str):
 async def verify_session(session_token: str):
     """Verify session token and return user info"""
     try:
-        if session_token not in active_sessions:
+        user_info = await session_manager.get(session_token)
+        if not user_info:
             raise HTTPException(status_code=401, detail="Invalid or expired session")
         
-        user_info = active_sessions[session_token]
-        
         # Get full user details
-        user = await db.users.find_one({"id": user_info["user_id"]})
+        user = await user_profile_cache.get(user_info["user_id"])
         if not user:
             raise HTTPException(status_code=401, detail="User not found")
         
@@ -772,7 +4246,8 @@ async def verify_session(session_token: str):
 
 # Audit Trail Endpoints
 @api_router.get("/audit/logs")
-async def get_audit_logs(user_id: Optional[str] = None, action: Optional[str] = None, limit: int = 100):
+async def get_audit_logs(user_id: Optional[str] = None, action: Optional[str] = None, limit: int = 100,
+                         date_from: Optional[str] = None, date_to: Optional[str] = None):
     """Get audit logs (admin functionality)"""
     try:
         query = {}
@@ -781,17 +4256,18 @@ async def get_audit_logs(user_id: Optional[str] = None, action: Optional[str] =
         if action:
             query["action"] = action
         
-        logs = await db.audit_logs.find(query).sort("timestamp", -1).limit(limit).to_list(limit)
+        try:
+            since = parse_audit_date(date_from)
+            until = parse_audit_date(date_to)
+        except ValueError:
+            raise HTTPException(status_code=400, detail="date_from and date_to must be ISO 8601 dates")
         
-        # Convert datetime objects for serialization
-        for log in logs:
-            if "_id" in log:
-                del log["_id"]
-            if "timestamp" in log and hasattr(log["timestamp"], "isoformat"):
-                log["timestamp"] = log["timestamp"].isoformat()
+        logs = await query_audit_logs(query, limit=limit, since=since, until=until)
         
-        return {"logs": logs, "total": len(logs)}
+        return FastJSONResponse({"logs": logs, "total": len(logs)})
         
+    except HTTPException:
+        raise
     except Exception as e:
         logging.error(f"Audit logs error: {str(e)}")
         raise HTTPException(status_code=500, detail=str(e))
@@ -800,217 +4276,331 @@ async def get_audit_logs(user_id: Optional[str] = None, action: Optional[str] =
 async def get_user_audit_trail(user_id: str):
     """Get audit trail for a specific user"""
     try:
-        logs = await db.audit_logs.find({"user_id": user_id}).sort("timestamp", -1).to_list(100)
+        logs = await query_audit_logs({"user_id": user_id}, limit=100)
         
-        # Convert datetime objects for serialization
-        for log in logs:
-            if "_id" in log:
-                del log["_id"]
-            if "timestamp" in log and hasattr(log["timestamp"], "isoformat"):
-                log["timestamp"] = log["timestamp"].isoformat()
-        
-        return {"user_id": user_id, "logs": logs, "total": len(logs)}
+        return FastJSONResponse({"user_id": user_id, "logs": logs, "total": len(logs)})
         
     except Exception as e:
         logging.error(f"User audit trail error: {str(e)}")
         raise HTTPException(status_code=500, detail=str(e))
 
+@api_router.get("/audit/export")
+async def export_audit_logs(month_from: str, month_to: Optional[str] = None):
+    """Stream audit events of a month range (YYYY-MM) as NDJSON, including archived months"""
+    try:
+        first_month = datetime.strptime(month_from, "%Y-%m").strftime("%Y_%m")
+        last_month = datetime.strptime(month_to, "%Y-%m").strftime("%Y_%m") if month_to else first_month
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Months must be formatted as YYYY-MM")
+    
+    return StreamingResponse(
+        stream_audit_export(first_month, last_month),
+        media_type="application/x-ndjson",
+        headers={"Content-Disposition": f"attachment; filename=audit_{month_from}_{month_to or month_from}.jsonl"}
+    )
+
 # PDF Export Endpoint
 @api_router.get("/cases/{case_id}/export-pdf")
 async def export_case_pdf(case_id: str):
     """Export case to PDF"""
     try:
         # Find the case
-        case = await db.clinical_cases.find_one({"id": case_id})
+        case = await get_cached_case(case_id)
         if not case:
             raise HTTPException(status_code=404, detail="Case not found")
         
-        # Convert datetime objects to strings for PDF generation
-        if "created_at" in case and hasattr(case["created_at"], "strftime"):
-            case["created_at"] = case["created_at"].strftime("%Y-%m-%d %H:%M:%S")
-        if "updated_at" in case and hasattr(case["updated_at"], "strftime"):
-            case["updated_at"] = case["updated_at"].strftime("%Y-%m-%d %H:%M:%S")
-        
-        # Generate PDF
-        pdf_buffer = generate_case_pdf(case)
+        # Rendered off the event loop, or reused from the report cache
+        pdf_path = await get_case_report(case)
         
         # Log audit event
         await log_audit_event(case.get("doctor_id", "unknown"), "case_exported", case_id, "Case exported to PDF")
         
-        # Return PDF as response
-        from fastapi.responses import StreamingResponse
-        
-        return StreamingResponse(
-            io.BytesIO(pdf_buffer.read()),
+        # Served from disk without buffering the report in memory
+        return FileResponse(
+            pdf_path,
             media_type="application/pdf",
-            headers={"Content-Disposition": f"attachment; filename=case_{case_id[:8]}_report.pdf"}
+            filename=f"case_{case_id[:8]}_report.pdf"
         )
         
+    except HTTPException:
+        raise
     except Exception as e:
         logging.error(f"PDF export error: {str(e)}")
         raise HTTPException(status_code=500, detail=str(e))
 
+@api_router.post("/reports/batch")
+async def export_case_pdfs(export_request: BatchPdfExportRequest):
+    """Stream PDF reports for a list of cases, or the cases matching search filters, as a ZIP archive"""
+    if (export_request.case_ids is None) == (export_request.filters is None):
+        raise HTTPException(status_code=400, detail="Provide either case_ids or filters")
+    try:
+        if export_request.case_ids is not None:
+            if not export_request.doctor_id:
+                raise HTTPException(status_code=400, detail="doctor_id is required with case_ids")
+            doctor_id = export_request.doctor_id
+            query = {"doctor_id": doctor_id, "id": {"$in": list(dict.fromkeys(export_request.case_ids))}}
+        else:
+            query = build_search_query(export_request.filters)
+            doctor_id = export_request.filters.doctor_id
+        
+        cases = await db.clinical_cases.find(query, {"_id": 0}).sort("created_at", -1).to_list(PDF_BATCH_MAX_CASES + 1)
+        if not cases:
+            raise HTTPException(status_code=404, detail="No cases matched")
+        if len(cases) > PDF_BATCH_MAX_CASES:
+            raise HTTPException(status_code=400, detail=f"Batch exports are limited to {PDF_BATCH_MAX_CASES} cases")
+        
+        export = await create_batch_pdf_export(len(cases))
+        await log_audit_event(
+            doctor_id, "cases_exported",
+            details=f"Batch PDF export {export['id']} of {len(cases)} cases"
+        )
+        
+        return StreamingResponse(
+            stream_pdf_archive(export, cases),
+            media_type="application/zip",
+            headers={
+                "Content-Disposition": f"attachment; filename=case_reports_{export['id'][:8]}.zip",
+                "X-Export-Id": export["id"]
+            }
+        )
+        
+    except HTTPException:
+        raise
+    except Exception as e:
+        logging.error(f"Batch PDF export error: {str(e)}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+@api_router.get("/reports/batch/{export_id}")
+async def get_batch_export_progress(export_id: str):
+    """Get per-report progress of a batch PDF export"""
+    export = await db.pdf_exports.find_one({"id": export_id}, {"_id": 0, "expires_at": 0})
+    if not export:
+        raise HTTPException(status_code=404, detail="Export not found")
+    return export
+
 @api_router.post("/cases/{case_id}/analyze")
 async def analyze_case(case_id: str):
     """Analyze a clinical case with uploaded files"""
     try:
-        # Find the case
-        case = await db.clinical_cases.find_one({"id": case_id})
+        # Read from the database, not the cache: the stored version is the
+        # compare-and-set guard, and a stale cached one would always conflict
+        case = await db.clinical_cases.find_one({"id": case_id}, {"_id": 0})
         if not case:
             raise HTTPException(status_code=404, detail="Case not found")
         
-        # Perform clinical analysis
-        analysis_result = await analyze_clinical_case(
-            case["patient_summary"], 
-            case.get("uploaded_files", [])
-        )
-        
-        # Update case with analysis result
-        case["analysis_result"] = analysis_result.dict()
-        case["confidence_score"] = analysis_result.confidence_score
-        case["updated_at"] = datetime.utcnow()
-        
-        await db.clinical_cases.update_one(
-            {"id": case_id},
-            {"$set": case}
-        )
+        # Perform clinical analysis; the result is stored only if the case wasn't
+        # modified while the analysis ran, otherwise it would not reflect e.g.
+        # files uploaded in the meantime
+        analysis_result, stored = await run_case_analysis(case)
+        if not stored:
+            raise HTTPException(
+                status_code=409,
+                detail="Case was modified during analysis, please retry the analysis"
+            )
         
         return analysis_result
         
+    except HTTPException:
+        raise
     except Exception as e:
         logging.error(f"Analysis error: {str(e)}")
         raise HTTPException(status_code=500, detail=str(e))
 
-@api_router.get("/cases", response_model=List[ClinicalCase])
-async def get_cases(doctor_id: str = "default_doctor"):
-    """Get all cases for a doctor"""
-    cases = await db.clinical_cases.find({"doctor_id": doctor_id}).sort("created_at", -1).to_list(100)
-    return [ClinicalCase(**case) for case in cases]
+@api_router.get("/cases")
+async def get_cases(request: Request, doctor_id: str = "default_doctor", fields: Optional[str] = None):
+    """Get case summaries for a doctor; pass `fields=` to include heavy fields"""
+    extra_fields = parse_case_fields(fields)
+    cases = await find_case_summaries({"doctor_id": doctor_id}, limit=100, extra_fields=extra_fields)
+    last_modified = max((case["updated_at"] for case in cases if case.get("updated_at")), default=None)
+    etag = case_list_etag(cases, variant=",".join(extra_fields))
+    return conditional_json_response(request, cases, etag, last_modified)
+
+# Case Export Helpers
+EXPORT_BATCH_SIZE = 500
+EXPORT_CSV_COLUMNS = [
+    "id", "created_at", "updated_at", "patient_id", "patient_name", "patient_age", "patient_gender",
+    "doctor_id", "doctor_name", "patient_summary", "file_count", "confidence_score",
+    "top_diagnosis", "top_diagnosis_likelihood", "soap_subjective", "soap_objective",
+    "soap_assessment", "soap_plan", "overall_assessment", "cursor"
+]
+
+def encode_export_cursor(case: Dict[str, Any]) -> str:
+    """Opaque resume token pointing just after a case in export order"""
+    raw = f"{case['created_at'].isoformat()}|{case['id']}"
+    return base64.urlsafe_b64encode(raw.encode()).decode()
+
+def decode_export_cursor(cursor: str, descending: bool = False) -> Dict[str, Any]:
+    """Turn a resume token into a filter matching the cases after it"""
+    try:
+        created_at, case_id = base64.urlsafe_b64decode(cursor.encode()).decode().split("|", 1)
+        created_at = datetime.fromisoformat(created_at)
+    except Exception:
+        raise HTTPException(status_code=400, detail="Invalid export cursor")
+    operator = "$lt" if descending else "$gt"
+    return {"$or": [
+        {"created_at": {operator: created_at}},
+        {"created_at": created_at, "id": {operator: case_id}}
+    ]}
+
+def flatten_case_for_csv(case: Dict[str, Any]) -> Dict[str, Any]:
+    """Flatten a case and its analysis into a single CSV row"""
+    analysis = case.get("analysis_result") or {}
+    soap_note = analysis.get("soap_note") or {}
+    diagnoses = analysis.get("differential_diagnoses") or []
+    top_diagnosis = diagnoses[0] if diagnoses else {}
+    row = {column: case.get(column) for column in EXPORT_CSV_COLUMNS}
+    row.update({
+        "file_count": len(case.get("uploaded_files") or []),
+        "top_diagnosis": top_diagnosis.get("diagnosis"),
+        "top_diagnosis_likelihood": top_diagnosis.get("likelihood"),
+        "soap_subjective": soap_note.get("subjective"),
+        "soap_objective": soap_note.get("objective"),
+        "soap_assessment": soap_note.get("assessment"),
+        "soap_plan": soap_note.get("plan"),
+        "overall_assessment": analysis.get("overall_assessment")
+    })
+    for column in ("created_at", "updated_at"):
+        if hasattr(row[column], "isoformat"):
+            row[column] = row[column].isoformat()
+    return row
+
+def encode_export_batch(cases: List[Dict[str, Any]], export_format: str, include_header: bool) -> bytes:
+    """Encode a batch of cases as NDJSON lines or CSV rows"""
+    if export_format == "csv":
+        output = io.StringIO()
+        writer = csv.DictWriter(output, fieldnames=EXPORT_CSV_COLUMNS)
+        if include_header:
+            writer.writeheader()
+        for case in cases:
+            writer.writerow(flatten_case_for_csv(case))
+        return output.getvalue().encode()
+    return b"".join(orjson.dumps(case, default=json_default, option=orjson.OPT_APPEND_NEWLINE) for case in cases)
+
+async def stream_case_export(query: Dict[str, Any], export_format: str, compress: bool):
+    """Yield exported cases batch by batch, holding at most one batch in memory"""
+    compressor = zlib.compressobj(wbits=31) if compress else None
+    cursor = db.clinical_cases.find(query, {"_id": 0}).sort([("created_at", 1), ("id", 1)]).batch_size(EXPORT_BATCH_SIZE)
+    
+    def emit(data: bytes) -> bytes:
+        return compressor.compress(data) if compressor else data
+    
+    batch = []
+    first_batch = True
+    async for case in cursor:
+        case["cursor"] = encode_export_cursor(case)
+        batch.append(case)
+        if len(batch) >= EXPORT_BATCH_SIZE:
+            await attach_analysis_results(batch)
+            yield emit(encode_export_batch(batch, export_format, first_batch))
+            batch = []
+            first_batch = False
+    if batch or (first_batch and export_format == "csv"):
+        await attach_analysis_results(batch)
+        yield emit(encode_export_batch(batch, export_format, first_batch))
+    if compressor:
+        yield compressor.flush()
+
+@api_router.get("/cases/export")
+async def export_cases(request: Request, doctor_id: str = "default_doctor", format: str = "ndjson",
+                       date_from: Optional[str] = None, date_to: Optional[str] = None,
+                       after: Optional[str] = None):
+    """Stream all cases of a doctor as NDJSON or CSV, resumable with the `after` cursor"""
+    if format not in ("ndjson", "csv"):
+        raise HTTPException(status_code=400, detail="Format must be ndjson or csv")
+    
+    query: Dict[str, Any] = {"doctor_id": doctor_id}
+    if date_from or date_to:
+        query["created_at"] = {}
+        if date_from:
+            query["created_at"]["$gte"] = parse_date_filter(date_from, "date_from")
+        if date_to:
+            query["created_at"]["$lte"] = parse_date_filter(date_to, "date_to")
+    if after:
+        query.update(decode_export_cursor(after))
+    
+    # The export stream is only ever gzip-compressed
+    compress = negotiate_encoding(request.headers.get("accept-encoding", ""), ("gzip",)) == "gzip"
+    headers = {"Content-Disposition": f"attachment; filename=cases_{doctor_id}.{'csv' if format == 'csv' else 'jsonl'}"}
+    if compress:
+        headers["Content-Encoding"] = "gzip"
+        headers["Vary"] = "Accept-Encoding"
+    
+    return StreamingResponse(
+        stream_case_export(query, format, compress),
+        media_type="text/csv" if format == "csv" else "application/x-ndjson",
+        headers=headers
+    )
 
 @api_router.get("/cases/{case_id}", response_model=ClinicalCase)
-async def get_case(case_id: str):
+async def get_case(case_id: str, request: Request):
     """Get a specific case"""
-    case = await db.clinical_cases.find_one({"id": case_id})
+    case = await get_cached_case(case_id)
     if not case:
         raise HTTPException(status_code=404, detail="Case not found")
-    return ClinicalCase(**case)
+    etag = case_etag(case)
+    # Skip loading the analysis when the client's copy is current
+    if is_not_modified(request, etag):
+        return Response(status_code=304, headers={"ETag": etag, "Cache-Control": "no-cache"})
+    case["analysis_result"] = await load_case_analysis(case)
+    # Returned as-is rather than through response_model, so apply its defaults here
+    return conditional_json_response(request, with_case_defaults(case), etag, case.get("updated_at"))
+
+@api_router.get("/cases/{case_id}/analyses")
+async def get_case_analyses(case_id: str):
+    """List the analysis runs of a case, newest first"""
+    analyses = await db.case_analyses.find(
+        {"case_id": case_id}, {"_id": 0, "result": 0}
+    ).sort("version", -1).to_list(100)
+    return {"case_id": case_id, "analyses": analyses, "total": len(analyses)}
+
+@api_router.get("/cases/{case_id}/analyses/{version}")
+async def get_case_analysis_version(case_id: str, version: int):
+    """Get a specific analysis run of a case"""
+    analysis = await db.case_analyses.find_one({"case_id": case_id, "version": version}, {"_id": 0})
+    if not analysis:
+        raise HTTPException(status_code=404, detail="Analysis not found")
+    return analysis
 
 @api_router.post("/query")
-async def query_cases(query_data: RetrievalQuery):
-    """Handle natural language queries about cases with improved command parsing"""
+async def query_cases(query_data: RetrievalQuery, fields: Optional[str] = None, explain: bool = False):
+    """Handle natural language queries about cases, planned into a single indexed filter"""
+    extra_fields = parse_case_fields(fields)
     try:
-        # Advanced query processing
-        query_lower = query_data.query.lower()
-        
-        # Parse specific commands
-        response_text = ""
-        cases = []
-        
-        # Check for date-specific queries
-        if "yesterday" in query_lower:
-            from datetime import datetime, timedelta
-            yesterday = datetime.utcnow() - timedelta(days=1)
-            start_date = yesterday.replace(hour=0, minute=0, second=0, microsecond=0)
-            end_date = yesterday.replace(hour=23, minute=59, second=59, microsecond=999999)
-            
-            cases = await db.clinical_cases.find({
-                "doctor_id": query_data.doctor_id,
-                "created_at": {
-                    "$gte": start_date,
-                    "$lte": end_date
-                }
-            }).to_list(10)
-            
-            response_text = f"Found {len(cases)} cases from yesterday"
-            
-        elif "today" in query_lower:
-            from datetime import datetime
-            today = datetime.utcnow()
-            start_date = today.replace(hour=0, minute=0, second=0, microsecond=0)
-            
-            cases = await db.clinical_cases.find({
-                "doctor_id": query_data.doctor_id,
-                "created_at": {"$gte": start_date}
-            }).to_list(10)
-            
-            response_text = f"Found {len(cases)} cases from today"
-            
-        # Check for specific test types
-        elif any(test in query_lower for test in ["cbc", "blood", "lab", "test"]):
-            cases = await db.clinical_cases.find({
-                "doctor_id": query_data.doctor_id,
-                "$or": [
-                    {"patient_summary": {"$regex": "lab|blood|cbc|test", "$options": "i"}},
-                    {"analysis_result.investigation_suggestions": {"$regex": "lab|blood|cbc|test", "$options": "i"}}
-                ]
-            }).to_list(10)
-            
-            response_text = f"Found {len(cases)} cases with lab/blood work"
-            
-        # Check for specific patient ID
-        elif "patient" in query_lower and any(char.isdigit() for char in query_lower):
-            import re
-            patient_id_match = re.search(r'patient\s*(\d+)', query_lower)
-            if patient_id_match:
-                patient_id = patient_id_match.group(1)
-                cases = await db.clinical_cases.find({
-                    "doctor_id": query_data.doctor_id,
-                    "patient_summary": {"$regex": patient_id, "$options": "i"}
-                }).to_list(10)
-                
-                response_text = f"Found {len(cases)} cases for patient {patient_id}"
-            
-        # General text search
-        else:
-            cases = await db.clinical_cases.find({
-                "doctor_id": query_data.doctor_id,
-                "$or": [
-                    {"patient_summary": {"$regex": query_lower, "$options": "i"}},
-                    {"analysis_result.overall_assessment": {"$regex": query_lower, "$options": "i"}},
-                    {"analysis_result.soap_note.subjective": {"$regex": query_lower, "$options": "i"}},
-                    {"analysis_result.soap_note.assessment": {"$regex": query_lower, "$options": "i"}}
-                ]
-            }).to_list(10)
-            
-            response_text = f"Found {len(cases)} matching cases for: {query_data.query}"
+        plan = plan_case_query(query_data.query, query_data.doctor_id)
+        mongo_query = plan.mongo_filter()
         
-        if not cases:
-            return {"response": "No matching cases found for your query."}
+        # The compiled filter is the cache key, so relative dates roll over correctly
+        fingerprint = query_cache.fingerprint(mongo_query, extra_fields)
+        if not explain:
+            cached = query_cache.get(query_data.doctor_id, "query", fingerprint)
+            if cached is not None:
+                return cached_json_response(cached)
+        generation = query_cache.generation(query_data.doctor_id)
         
-        # Convert MongoDB documents to serializable format
-        serializable_cases = []
-        for case in cases:
-            # Convert ObjectId to string if present
-            if "_id" in case:
-                del case["_id"]  # Remove MongoDB ObjectId
-            
-            # Convert datetime objects to ISO format strings
-            if "created_at" in case and hasattr(case["created_at"], "isoformat"):
-                case["created_at"] = case["created_at"].isoformat()
-            if "updated_at" in case and hasattr(case["updated_at"], "isoformat"):
-                case["updated_at"] = case["updated_at"].isoformat()
-                
-            # Convert file upload dates
-            for file_info in case.get("uploaded_files", []):
-                if "uploaded_at" in file_info and hasattr(file_info["uploaded_at"], "isoformat"):
-                    file_info["uploaded_at"] = file_info["uploaded_at"].isoformat()
-            
-            serializable_cases.append(case)
+        cases = await find_case_summaries(mongo_query, limit=10, extra_fields=extra_fields)
+        
+        response_text = f"Found {len(cases)} cases {plan.describe()}"
+        result = {}
+        if explain:
+            result["plan"] = plan.explain()
+            result["plan"]["execution"] = summarize_query_explain(
+                await db.clinical_cases.find(mongo_query).sort("created_at", -1).limit(10).explain()
+            )
         
-        # Add case summaries to response
-        if serializable_cases:
+        if not cases:
+            response = FastJSONResponse({"response": "No matching cases found for your query.", **result})
+        else:
+            # Add case summaries to response
             response_text += ":\n"
-            for case in serializable_cases[:3]:  # Show top 3
-                case_date = case.get('created_at', 'Unknown date')
-                if isinstance(case_date, str):
-                    try:
-                        case_date = datetime.fromisoformat(case_date.replace('Z', '+00:00')).strftime('%Y-%m-%d')
-                    except:
-                        case_date = case_date[:10] if len(case_date) > 10 else case_date
-                        
+            for case in cases[:3]:  # Show top 3
+                case_date = case.get('created_at')
+                case_date = case_date.strftime('%Y-%m-%d') if hasattr(case_date, 'strftime') else 'Unknown date'
                 response_text += f"- Case from {case_date}: {case['patient_summary'][:100]}...\n"
+            response = FastJSONResponse({"response": response_text, "cases": cases, **result})
         
-        return {"response": response_text, "cases": serializable_cases}
+        if not explain:
+            query_cache.set(query_data.doctor_id, "query", fingerprint, generation, response.body)
+        return response
         
     except Exception as e:
         logging.error(f"Query error: {str(e)}")
@@ -1021,7 +4611,7 @@ async def submit_feedback(case_id: str, feedback_data: CaseFeedbackCreate):
     """Submit feedback for a case analysis"""
     try:
         # Verify case exists
-        case = await db.clinical_cases.find_one({"id": case_id})
+        case = await get_cached_case(case_id)
         if not case:
             raise HTTPException(status_code=404, detail="Case not found")
         
@@ -1032,9 +4622,13 @@ async def submit_feedback(case_id: str, feedback_data: CaseFeedbackCreate):
         
         # Save to database
         await db.case_feedback.insert_one(feedback_obj.dict())
+        query_cache.bump(case.get("doctor_id"), feedback_obj.doctor_id)
+        await record_feedback_rollup(feedback_obj.dict())
         
         return feedback_obj
         
+    except HTTPException:
+        raise
     except Exception as e:
         logging.error(f"Feedback error: {str(e)}")
         raise HTTPException(status_code=500, detail=str(e))
@@ -1043,16 +4637,10 @@ async def submit_feedback(case_id: str, feedback_data: CaseFeedbackCreate):
 async def get_feedback_stats(doctor_id: str = "default_doctor"):
     """Get feedback statistics for the dashboard"""
     try:
-        # Count positive and negative feedback
-        positive_count = await db.case_feedback.count_documents({
-            "doctor_id": doctor_id,
-            "feedback_type": "positive"
-        })
-        
-        negative_count = await db.case_feedback.count_documents({
-            "doctor_id": doctor_id,
-            "feedback_type": "negative"
-        })
+        rollup = await db.dashboard_rollups.find_one({"doctor_id": doctor_id}, {"_id": 0, "feedback": 1}) or {}
+        feedback = rollup.get("feedback", {})
+        positive_count = feedback.get("positive", 0)
+        negative_count = feedback.get("negative", 0)
         
         total_feedback = positive_count + negative_count
         satisfaction_rate = (positive_count / total_feedback * 100) if total_feedback > 0 else 0
@@ -1068,83 +4656,162 @@ async def get_feedback_stats(doctor_id: str = "default_doctor"):
         logging.error(f"Feedback stats error: {str(e)}")
         raise HTTPException(status_code=500, detail=str(e))
 
+@api_router.get("/dashboard/stats")
+async def get_dashboard_stats(doctor_id: str = "default_doctor", days: int = 30):
+    """Get all dashboard figures for a doctor from the precomputed rollup"""
+    try:
+        rollup = await db.dashboard_rollups.find_one({"doctor_id": doctor_id}, {"_id": 0}) or {}
+        feedback = rollup.get("feedback", {})
+        positive_count = feedback.get("positive", 0)
+        negative_count = feedback.get("negative", 0)
+        total_feedback = positive_count + negative_count
+        satisfaction_rate = (positive_count / total_feedback * 100) if total_feedback > 0 else 0
+        
+        # Only return the requested window of daily counts
+        days = max(1, min(days, ROLLUP_RETENTION_DAYS))
+        today = datetime.utcnow().date()
+        cases_per_day = rollup.get("cases_per_day", {})
+        recent_days = [(today - timedelta(days=offset)).isoformat() for offset in range(days - 1, -1, -1)]
+        
+        histogram = rollup.get("confidence_histogram", {})
+        
+        return {
+            "doctor_id": doctor_id,
+            "cases_total": rollup.get("cases_total", 0),
+            "cases_per_day": {day: cases_per_day.get(day, 0) for day in recent_days},
+            "confidence_histogram": {str(bucket): histogram.get(str(bucket), 0) for bucket in range(0, 100, 10)},
+            "analyses_total": rollup.get("analyses_total", 0),
+            "files_analyzed": rollup.get("files_analyzed", 0),
+            "positive_feedback": positive_count,
+            "negative_feedback": negative_count,
+            "total_feedback": total_feedback,
+            "satisfaction_rate": round(satisfaction_rate, 2),
+            "updated_at": rollup.get("updated_at"),
+            "reconciled_at": rollup.get("reconciled_at")
+        }
+        
+    except Exception as e:
+        logging.error(f"Dashboard stats error: {str(e)}")
+        raise HTTPException(status_code=500, detail=str(e))
+
 @api_router.post("/cases/search")
-async def advanced_search(filters: SearchFilters):
+async def advanced_search(filters: SearchFilters, fields: Optional[str] = None):
     """Advanced search and filtering for cases"""
+    extra_fields = parse_case_fields(fields)
     try:
-        # Build MongoDB query
-        mongo_query = {"doctor_id": filters.doctor_id}
-        
-        # Date range filter
-        if filters.date_from or filters.date_to:
-            date_filter = {}
-            if filters.date_from:
-                from datetime import datetime
-                date_filter["$gte"] = datetime.fromisoformat(filters.date_from)
-            if filters.date_to:
-                from datetime import datetime
-                date_filter["$lte"] = datetime.fromisoformat(filters.date_to)
-            mongo_query["created_at"] = date_filter
-        
-        # Confidence score filter
-        if filters.confidence_min is not None:
-            mongo_query["confidence_score"] = {"$gte": filters.confidence_min}
-        
-        # Files filter
-        if filters.has_files is not None:
-            if filters.has_files:
-                mongo_query["uploaded_files"] = {"$ne": [], "$exists": True}
-            else:
-                mongo_query["$or"] = [
-                    {"uploaded_files": {"$size": 0}},
-                    {"uploaded_files": {"$exists": False}}
-                ]
-        
-        # Text search
-        if filters.search_text:
-            text_regex = {"$regex": filters.search_text, "$options": "i"}
-            mongo_query["$or"] = [
-                {"patient_summary": text_regex},
-                {"analysis_result.overall_assessment": text_regex},
-                {"analysis_result.soap_note.subjective": text_regex},
-                {"analysis_result.soap_note.assessment": text_regex}
-            ]
+        fingerprint = query_cache.fingerprint(filters.dict(), extra_fields)
+        cached = query_cache.get(filters.doctor_id, "search", fingerprint)
+        if cached is not None:
+            return cached_json_response(cached)
+        generation = query_cache.generation(filters.doctor_id)
         
-        # Execute search
-        cases = await db.clinical_cases.find(mongo_query).sort("created_at", -1).to_list(100)
+        mongo_query = build_search_query(filters)
+        limit = max(1, min(filters.limit, SEARCH_MAX_LIMIT))
+        skip = max(0, filters.skip)
         
-        # Convert to serializable format
-        serializable_cases = []
-        for case in cases:
-            if "_id" in case:
-                del case["_id"]
-            
-            # Convert datetime objects
-            if "created_at" in case and hasattr(case["created_at"], "isoformat"):
-                case["created_at"] = case["created_at"].isoformat()
-            if "updated_at" in case and hasattr(case["updated_at"], "isoformat"):
-                case["updated_at"] = case["updated_at"].isoformat()
-                
-            # Convert file upload dates
-            for file_info in case.get("uploaded_files", []):
-                if "uploaded_at" in file_info and hasattr(file_info["uploaded_at"], "isoformat"):
-                    file_info["uploaded_at"] = file_info["uploaded_at"].isoformat()
-            
-            serializable_cases.append(case)
+        # Execute search
+        facets = None
+        if filters.facets:
+            # The page stays an indexed sort; inside $facet it would sort every match in memory
+            cases, result = await asyncio.gather(
+                find_case_summaries(mongo_query, limit=limit, extra_fields=extra_fields, skip=skip),
+                db.clinical_cases.aggregate(
+                    [{"$match": mongo_query}, {"$facet": build_search_facets()}], allowDiskUse=True
+                ).to_list(1)
+            )
+            facets = format_search_facets(result[0])
+        else:
+            cases = await find_case_summaries(mongo_query, limit=limit, extra_fields=extra_fields, skip=skip)
         
-        return {
-            "cases": serializable_cases,
-            "total_found": len(serializable_cases),
+        body = {
+            "cases": cases,
+            "total_found": len(cases),
             "filters_applied": filters.dict()
         }
+        if facets is not None:
+            body["facets"] = facets
+        response = FastJSONResponse(body)
+        query_cache.set(filters.doctor_id, "search", fingerprint, generation, response.body)
+        return response
         
+    except HTTPException:
+        raise
     except Exception as e:
         logging.error(f"Advanced search error: {str(e)}")
         raise HTTPException(status_code=500, detail=str(e))
 
+@api_router.get("/events/stream")
+async def stream_case_events(request: Request, doctor_id: str = "default_doctor",
+                             last_event_id: Optional[str] = None):
+    """Push case and feedback changes for a doctor as Server-Sent Events"""
+    resume_from = request.headers.get("last-event-id") or last_event_id
+    return StreamingResponse(
+        case_event_stream(request, doctor_id, resume_from),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+@api_router.get("/metrics")
+async def get_metrics():
+    """Get in-process runtime metrics"""
+    return {
+        "audit_log": audit_writer.metrics(),
+        "case_cache": case_cache.metrics(),
+        "case_events": case_event_hub.metrics(),
+        "change_stream": change_stream_fanout.metrics(),
+        "query_cache": query_cache.metrics(),
+        "lab_trends": lab_trend_cache.metrics(),
+        "patient_name_index": {
+            **patient_name_index.metrics(),
+            "change_stream_active": change_stream_fanout.active
+        },
+        "sessions": session_manager.metrics(),
+        "user_profile_cache": user_profile_cache.metrics(),
+        "pdf_reports": pdf_report_metrics(),
+        "login_throttle": {
+            "per_username": username_login_throttle.metrics(),
+            "per_ip": ip_login_throttle.metrics()
+        }
+    }
+
+@api_router.post("/reanalysis/jobs")
+async def start_reanalysis_job(job_request: ReanalysisJobCreate):
+    """Start a background re-analysis job over a filtered set of cases"""
+    runner = await ReanalysisRunner.create(job_request)
+    reanalysis_runners[runner.job_id] = runner
+    start_background_job(runner.run())
+    return runner.progress()
+
+@api_router.post("/reanalysis/jobs/{job_id}/resume")
+async def resume_reanalysis_job(job_id: str):
+    """Resume an interrupted re-analysis job from its checkpoint"""
+    running = reanalysis_runners.get(job_id)
+    if running and running.job.get("status") == "running":
+        raise HTTPException(status_code=409, detail="Job is already running")
+    runner = await ReanalysisRunner.load(job_id)
+    if not runner:
+        raise HTTPException(status_code=404, detail="Job not found")
+    if runner.job.get("status") == "completed":
+        raise HTTPException(status_code=409, detail="Job already completed")
+    reanalysis_runners[job_id] = runner
+    start_background_job(runner.run())
+    return runner.progress()
+
+@api_router.get("/reanalysis/jobs/{job_id}")
+async def get_reanalysis_job(job_id: str):
+    """Get the checkpointed state of a re-analysis job, with live throughput if it runs here"""
+    job = await db.reanalysis_jobs.find_one({"id": job_id}, {"_id": 0})
+    if not job:
+        raise HTTPException(status_code=404, detail="Job not found")
+    if job_id in reanalysis_runners:
+        job["progress"] = reanalysis_runners[job_id].progress()
+    return job
+
 # Include the router in the main app
 app.include_router(api_router)
 
+app.add_middleware(JSONCompressionMiddleware)
+
 app.add_middleware(
     CORSMiddleware,
     allow_credentials=True,
@@ -1160,6 +4827,64 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+@app.on_event("startup")
+async def ensure_indexes():
+    """Create the indexes backing case listings and searches"""
+    try:
+        await db.clinical_cases.create_index("id", unique=True)
+        await db.clinical_cases.create_index([("doctor_id", 1), ("created_at", -1)])
+        await db.clinical_cases.create_index([("doctor_id", 1), ("patient_id", 1), ("created_at", -1), ("id", -1)])
+        await db.clinical_cases.create_index([("doctor_id", 1), ("confidence_score", -1)])
+        await db.case_analyses.create_index("id", unique=True)
+        await db.case_analyses.create_index([("case_id", 1), ("version", -1)], unique=True)
+        await db.dashboard_rollups.create_index("doctor_id", unique=True)
+        await db.patients.create_index([("doctor_id", 1), ("patient_id", 1)], unique=True)
+        await db.patients.create_index([("doctor_id", 1), ("last_case_at", -1)])
+        await db.reanalysis_jobs.create_index("id", unique=True)
+        await db.intake_jobs.create_index("id", unique=True)
+        await db.pdf_exports.create_index("id", unique=True)
+        await db.pdf_exports.create_index("expires_at", expireAfterSeconds=0)
+        await db.intake_jobs.create_index("expires_at", expireAfterSeconds=0)
+    except Exception as e:
+        logger.error(f"Index creation error: {str(e)}")
+
+@app.on_event("startup")
+async def start_rollup_reconciliation():
+    """Migrate embedded analyses, then reconcile dashboard rollups on startup and periodically"""
+    app.state.rollup_task = asyncio.create_task(run_rollup_reconciliation())
+
+@app.on_event("startup")
+async def start_change_stream_fanout():
+    """Load the patient name index and keep caches in sync with writes made by other workers"""
+    app.state.change_stream_task = asyncio.create_task(change_stream_fanout.run())
+
+@app.on_event("startup")
+async def start_session_store():
+    """Prepare the configured session store driver or revocation list"""
+    try:
+        await session_manager.start()
+    except Exception as e:
+        logger.error(f"Session store startup error: {str(e)}")
+
+@app.on_event("startup")
+async def start_audit_writer():
+    """Start the buffered audit log writer and the audit storage lifecycle"""
+    audit_writer.start()
+    app.state.audit_lifecycle_task = asyncio.create_task(run_audit_lifecycle())
+
 @app.on_event("shutdown")
 async def shutdown_db_client():
+    if getattr(app.state, "rollup_task", None):
+        app.state.rollup_task.cancel()
+    if getattr(app.state, "audit_lifecycle_task", None):
+        app.state.audit_lifecycle_task.cancel()
+    if getattr(app.state, "change_stream_task", None):
+        app.state.change_stream_task.cancel()
+    case_event_hub.close()
+    # Flush pending audit events before the client goes away
+    await audit_writer.stop()
+    await session_manager.close()
+    password_hash_executor.shutdown(wait=False)
+    if pdf_render_executor is not None:
+        pdf_render_executor.shutdown(wait=False, cancel_futures=True)
     client.close()
\ No newline at end of file
@@ -5,6 +5,7 @@ import os
 import tempfile
 import unittest
 import time
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timedelta
 
 # Get the backend URL from the frontend .env file
@@ -164,6 +165,22 @@ class ClinicalInsightAPITest(unittest.TestCase):
             self.assertIn(self.__class__.case_id, case_ids)
             print(f"Found our test case in the retrieved cases list")
         
+        # List endpoints return summary projections without heavy fields
+        for case in cases:
+            self.assertIn("file_count", case)
+            self.assertIn("has_analysis", case)
+            self.assertNotIn("analysis_result", case)
+            self.assertNotIn("uploaded_files", case)
+        
+        # Heavy fields can be opted into
+        response = requests.get(f"{API_URL}/cases?doctor_id=test_doctor&fields=uploaded_files")
+        self.assertEqual(response.status_code, 200)
+        for case in response.json():
+            self.assertIn("uploaded_files", case)
+        
+        response = requests.get(f"{API_URL}/cases?doctor_id=test_doctor&fields=password_hash")
+        self.assertEqual(response.status_code, 400)
+        
         print(f"Retrieved {len(cases)} cases")
         print("✅ Case retrieval test passed")
         
@@ -187,6 +204,14 @@ class ClinicalInsightAPITest(unittest.TestCase):
         if case["analysis_result"]:
             print("Analysis results are present in the case")
             
+            # Analysis runs are kept as versioned history
+            response = requests.get(f"{API_URL}/cases/{self.__class__.case_id}/analyses")
+            self.assertEqual(response.status_code, 200)
+            history = response.json()
+            self.assertGreaterEqual(history["total"], 1)
+            self.assertEqual(history["analyses"][0]["version"], case["analysis_version"])
+            self.assertNotIn("result", history["analyses"][0])
+            
         print("✅ Specific case retrieval test passed")
         
     def test_07_query_cases_fixed(self):
@@ -677,6 +702,638 @@ class ClinicalInsightAPITest(unittest.TestCase):
             print(f"Retrieved {len(user_logs['logs'])} logs for user {user_id}")
         
         print("✅ Audit trail test passed")
+    
+    def test_14_concurrent_uploads(self):
+        """Test that parallel uploads to the same case don't lose files"""
+        print("\n=== Testing Concurrent Uploads ===")
+        
+        response = requests.post(f"{API_URL}/cases", json={
+            "patient_summary": self.sample_patient_summary,
+            "doctor_id": "test_doctor"
+        })
+        self.assertEqual(response.status_code, 200)
+        case_id = response.json()["id"]
+        
+        def upload(index):
+            files = [('files', (f'note_{index}.txt', f"Concurrent note {index}".encode(), 'text/plain'))]
+            return requests.post(f"{API_URL}/cases/{case_id}/upload", files=files)
+        
+        upload_count = 20
+        with ThreadPoolExecutor(max_workers=upload_count) as executor:
+            responses = list(executor.map(upload, range(upload_count)))
+        
+        for response in responses:
+            self.assertEqual(response.status_code, 200)
+        
+        response = requests.get(f"{API_URL}/cases/{case_id}")
+        self.assertEqual(response.status_code, 200)
+        case = response.json()
+        self.assertEqual(len(case["uploaded_files"]), upload_count)
+        self.assertEqual(case["version"], upload_count)
+        
+        print(f"All {upload_count} parallel uploads were kept")
+        print("✅ Concurrent uploads test passed")
+    
+    def test_15_analyze_racing_upload(self):
+        """Test that an analysis racing an upload never clobbers the uploaded files"""
+        print("\n=== Testing Analysis Racing Upload ===")
+        
+        response = requests.post(f"{API_URL}/cases", json={
+            "patient_summary": self.sample_patient_summary,
+            "doctor_id": "test_doctor"
+        })
+        self.assertEqual(response.status_code, 200)
+        case_id = response.json()["id"]
+        
+        def analyze():
+            return requests.post(f"{API_URL}/cases/{case_id}/analyze")
+        
+        def upload():
+            files = [('files', ('late_note.txt', b"Uploaded while analyzing", 'text/plain'))]
+            return requests.post(f"{API_URL}/cases/{case_id}/upload", files=files)
+        
+        with ThreadPoolExecutor(max_workers=2) as executor:
+            analyze_future = executor.submit(analyze)
+            time.sleep(0.5)
+            upload_future = executor.submit(upload)
+            analyze_response = analyze_future.result()
+            upload_response = upload_future.result()
+        
+        self.assertEqual(upload_response.status_code, 200)
+        # The analysis either completed before the upload or was rejected as stale
+        self.assertIn(analyze_response.status_code, [200, 409])
+        
+        response = requests.get(f"{API_URL}/cases/{case_id}")
+        case = response.json()
+        self.assertEqual(len(case["uploaded_files"]), 1)
+        
+        print(f"Analysis status {analyze_response.status_code}, upload kept")
+        print("✅ Analysis racing upload test passed")
+    
+    def test_16_dashboard_stats(self):
+        """Test that dashboard counters are maintained on writes"""
+        print("\n=== Testing Dashboard Stats ===")
+        
+        response = requests.get(f"{API_URL}/dashboard/stats?doctor_id=test_doctor")
+        self.assertEqual(response.status_code, 200)
+        before = response.json()
+        for key in ["cases_total", "cases_per_day", "confidence_histogram", "files_analyzed",
+                    "positive_feedback", "negative_feedback", "satisfaction_rate"]:
+            self.assertIn(key, before)
+        
+        response = requests.post(f"{API_URL}/cases", json={
+            "patient_summary": self.sample_patient_summary,
+            "doctor_id": "test_doctor"
+        })
+        self.assertEqual(response.status_code, 200)
+        case_id = response.json()["id"]
+        
+        response = requests.post(f"{API_URL}/cases/{case_id}/feedback", json={
+            "case_id": case_id,
+            "doctor_id": "test_doctor",
+            "feedback_type": "positive"
+        })
+        self.assertEqual(response.status_code, 200)
+        
+        after = requests.get(f"{API_URL}/dashboard/stats?doctor_id=test_doctor").json()
+        self.assertEqual(after["cases_total"], before["cases_total"] + 1)
+        self.assertEqual(after["positive_feedback"], before["positive_feedback"] + 1)
+        
+        print(f"Dashboard stats: {after['cases_total']} cases, {after['total_feedback']} feedback")
+        print("✅ Dashboard stats test passed")
+    
+    def test_17_case_export(self):
+        """Test streaming case export as NDJSON and CSV with resumable cursors"""
+        print("\n=== Testing Case Export ===")
+        
+        response = requests.get(f"{API_URL}/cases/export?doctor_id=test_doctor&format=ndjson", stream=True)
+        self.assertEqual(response.status_code, 200)
+        rows = [json.loads(line) for line in response.iter_lines() if line]
+        self.assertGreater(len(rows), 0)
+        for row in rows:
+            self.assertNotIn("_id", row)
+            self.assertIn("cursor", row)
+        
+        # Resuming after the first row skips it
+        response = requests.get(
+            f"{API_URL}/cases/export?doctor_id=test_doctor&format=ndjson&after={rows[0]['cursor']}"
+        )
+        resumed = [json.loads(line) for line in response.iter_lines() if line]
+        self.assertEqual(len(resumed), len(rows) - 1)
+        
+        response = requests.get(f"{API_URL}/cases/export?doctor_id=test_doctor&format=csv")
+        self.assertEqual(response.status_code, 200)
+        header = response.text.splitlines()[0]
+        self.assertIn("top_diagnosis", header)
+        self.assertIn("soap_assessment", header)
+        
+        # q=0 refuses gzip
+        response = requests.get(f"{API_URL}/cases/export?doctor_id=test_doctor",
+                                headers={"Accept-Encoding": "gzip;q=0, identity"})
+        self.assertNotIn("Content-Encoding", response.headers)
+        
+        response = requests.get(f"{API_URL}/cases/export?doctor_id=test_doctor&date_from=yesterday")
+        self.assertEqual(response.status_code, 400)
+        response = requests.post(f"{API_URL}/cases/search", json={"doctor_id": "test_doctor", "date_to": "2026-13-40"})
+        self.assertEqual(response.status_code, 400)
+        
+        print(f"Exported {len(rows)} cases")
+        print("✅ Case export test passed")
+    
+    def test_18_bulk_import_benchmark(self):
+        """Benchmark bulk NDJSON import and check per-row error reporting"""
+        print("\n=== Testing Bulk Import ===")
+        
+        row_count = 5000
+        rows = [
+            json.dumps({
+                "patient_summary": f"Imported historical case {index}: {self.sample_patient_summary}",
+                "patient_id": f"IMP{index % 500}",
+                "doctor_id": "import_test_doctor",
+                "created_at": (datetime.utcnow() - timedelta(days=index % 365)).isoformat()
+            })
+            for index in range(row_count)
+        ]
+        # Two invalid rows: missing patient_summary and malformed JSON
+        rows.insert(10, json.dumps({"doctor_id": "import_test_doctor"}))
+        rows.insert(20, "{not json")
+        body = "\n".join(rows).encode()
+        
+        def body_chunks():
+            for start in range(0, len(body), 64 * 1024):
+                yield body[start:start + 64 * 1024]
+        
+        started = time.time()
+        response = requests.post(
+            f"{API_URL}/cases/import",
+            data=body_chunks(),
+            headers={"Content-Type": "application/x-ndjson"}
+        )
+        elapsed = time.time() - started
+        
+        self.assertEqual(response.status_code, 200)
+        result = response.json()
+        self.assertEqual(result["imported"], row_count)
+        self.assertEqual(result["failed"], 2)
+        self.assertEqual(sorted(error["row"] for error in result["errors"]), [11, 21])
+        
+        print(f"Server-side: {result['rows_per_second']} rows/s, end-to-end: {row_count / elapsed:.1f} rows/s")
+        print("✅ Bulk import test passed")
+    
+    def test_19_case_cache(self):
+        """Test that repeated case reads are served from the cache and writes invalidate it"""
+        print("\n=== Testing Case Cache ===")
+        
+        response = requests.post(f"{API_URL}/cases", json={
+            "patient_summary": self.sample_patient_summary,
+            "doctor_id": "test_doctor"
+        })
+        case_id = response.json()["id"]
+        
+        before = requests.get(f"{API_URL}/metrics").json()["case_cache"]
+        for _ in range(5):
+            self.assertEqual(requests.get(f"{API_URL}/cases/{case_id}").status_code, 200)
+        after = requests.get(f"{API_URL}/metrics").json()["case_cache"]
+        self.assertGreaterEqual(after["hits"] - before["hits"], 4)
+        
+        # An upload must be visible on the next read
+        files = [('files', ('cache_note.txt', b"Cache invalidation note", 'text/plain'))]
+        self.assertEqual(requests.post(f"{API_URL}/cases/{case_id}/upload", files=files).status_code, 200)
+        case = requests.get(f"{API_URL}/cases/{case_id}").json()
+        self.assertEqual(len(case["uploaded_files"]), 1)
+        
+        print(f"Case cache hit ratio: {after['hit_ratio']}, change stream active: {after['change_stream_active']}")
+        print("✅ Case cache test passed")
+    
+    def test_20_conditional_get_and_compression(self):
+        """Test ETag revalidation and negotiated compression"""
+        print("\n=== Testing Conditional GET ===")
+        
+        response = requests.post(f"{API_URL}/cases", json={
+            "patient_summary": self.sample_patient_summary,
+            "doctor_id": "test_doctor"
+        })
+        case_id = response.json()["id"]
+        
+        response = requests.get(f"{API_URL}/cases/{case_id}")
+        etag = response.headers.get("ETag")
+        self.assertIsNotNone(etag)
+        
+        response = requests.get(f"{API_URL}/cases/{case_id}", headers={"If-None-Match": etag})
+        self.assertEqual(response.status_code, 304)
+        
+        # A write changes the ETag
+        files = [('files', ('etag_note.txt', b"ETag note", 'text/plain'))]
+        requests.post(f"{API_URL}/cases/{case_id}/upload", files=files)
+        response = requests.get(f"{API_URL}/cases/{case_id}", headers={"If-None-Match": etag})
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response.headers.get("ETag"), etag)
+        
+        response = requests.get(f"{API_URL}/cases?doctor_id=test_doctor")
+        self.assertIn("Last-Modified", response.headers)
+        list_etag = response.headers["ETag"]
+        response = requests.get(f"{API_URL}/cases?doctor_id=test_doctor", headers={"If-None-Match": list_etag})
+        self.assertEqual(response.status_code, 304)
+        
+        response = requests.get(f"{API_URL}/cases?doctor_id=test_doctor", headers={"Accept-Encoding": "gzip"})
+        if len(response.content) >= 1024:
+            self.assertEqual(response.headers.get("Content-Encoding"), "gzip")
+            # The compressed body is not byte-identical, so its ETag is weak
+            self.assertTrue(response.headers["ETag"].startswith("W/"))
+            response = requests.get(f"{API_URL}/cases?doctor_id=test_doctor", headers={"If-None-Match": response.headers["ETag"]})
+            self.assertEqual(response.status_code, 304)
+        
+        # q=0 refuses a coding
+        response = requests.get(f"{API_URL}/cases?doctor_id=test_doctor", headers={"Accept-Encoding": "br;q=0"})
+        self.assertNotIn("Content-Encoding", response.headers)
+        
+        print("✅ Conditional GET test passed")
+    
+    def test_21_case_change_feed(self):
+        """Test that case changes are pushed over the SSE change feed"""
+        print("\n=== Testing Case Change Feed ===")
+        
+        doctor_id = f"feed_doctor_{int(time.time())}"
+        stream = requests.get(f"{API_URL}/events/stream?doctor_id={doctor_id}", stream=True, timeout=30)
+        self.assertEqual(stream.status_code, 200)
+        self.assertTrue(stream.headers["Content-Type"].startswith("text/event-stream"))
+        
+        def create_case():
+            time.sleep(1)
+            return requests.post(f"{API_URL}/cases", json={
+                "patient_summary": self.sample_patient_summary,
+                "doctor_id": doctor_id
+            }).json()["id"]
+        
+        with ThreadPoolExecutor(max_workers=1) as executor:
+            created = executor.submit(create_case)
+            event_type = None
+            for line in stream.iter_lines(decode_unicode=True):
+                if line.startswith("event: "):
+                    event_type = line[len("event: "):]
+                elif line.startswith("data: ") and event_type in ("case_created", "unavailable"):
+                    data = json.loads(line[len("data: "):])
+                    break
+            case_id = created.result()
+        stream.close()
+        
+        if event_type == "unavailable":
+            print("Change streams not supported by this MongoDB deployment, skipping delta checks")
+            return
+        self.assertEqual(data["case"]["id"], case_id)
+        self.assertEqual(data["case"]["file_count"], 0)
+        self.assertFalse(data["case"]["has_analysis"])
+        
+        print("✅ Case change feed test passed")
+    
+    def test_22_session_store(self):
+        """Test that repeated session checks are served by the hot-token cache"""
+        print("\n=== Testing Session Store ===")
+        
+        username = f"session_user_{int(time.time())}"
+        requests.post(f"{API_URL}/auth/register", json={
+            "username": username,
+            "email": f"{username}@example.com",
+            "password": "SecurePassword123!",
+            "full_name": "Session User"
+        })
+        response = requests.post(f"{API_URL}/auth/login", json={"username": username, "password": "SecurePassword123!"})
+        session_token = response.json()["session_token"]
+        
+        before = requests.get(f"{API_URL}/metrics").json()["sessions"]
+        for _ in range(10):
+            self.assertEqual(requests.get(f"{API_URL}/auth/verify?session_token={session_token}").status_code, 200)
+        after = requests.get(f"{API_URL}/metrics").json()["sessions"]
+        if after["driver"] != "signed":
+            self.assertGreaterEqual(after["cache_hits"] - before["cache_hits"], 1)
+        
+        # Profile fields for /auth/verify come from the short-TTL profile cache
+        profiles = requests.get(f"{API_URL}/metrics").json()["user_profile_cache"]
+        self.assertGreaterEqual(profiles["hits"], 9)
+        
+        self.assertEqual(requests.get(f"{API_URL}/auth/verify?session_token=not-a-session").status_code, 401)
+        self.assertEqual(requests.post(f"{API_URL}/auth/logout?session_token={session_token}").status_code, 200)
+        self.assertEqual(requests.get(f"{API_URL}/auth/verify?session_token={session_token}").status_code, 401)
+        
+        print(f"Session driver: {after['driver']}, profile cache hit ratio: {profiles['hit_ratio']}")
+        print("✅ Session store test passed")
+    
+    def test_23_login_throttling(self):
+        """Test that repeated failed logins for a username are rejected before hashing"""
+        print("\n=== Testing Login Throttling ===")
+        
+        username = f"throttle_user_{int(time.time())}"
+        requests.post(f"{API_URL}/auth/register", json={
+            "username": username,
+            "email": f"{username}@example.com",
+            "password": "SecurePassword123!",
+            "full_name": "Throttle User"
+        })
+        
+        statuses = [
+            requests.post(f"{API_URL}/auth/login", json={"username": username, "password": "wrong"}).status_code
+            for _ in range(5)
+        ]
+        self.assertEqual(statuses, [401] * 5)
+        
+        # Even the right password is refused while the username is throttled
+        response = requests.post(f"{API_URL}/auth/login", json={"username": username, "password": "SecurePassword123!"})
+        self.assertEqual(response.status_code, 429)
+        self.assertIn("Retry-After", response.headers)
+        
+        throttle = requests.get(f"{API_URL}/metrics").json()["login_throttle"]
+        self.assertGreaterEqual(throttle["per_username"]["rejected"], 1)
+        
+        print("✅ Login throttling test passed")
+    
+    def test_24_pdf_report_cache(self):
+        """Test that repeated PDF exports are served from the rendered-report cache"""
+        print("\n=== Testing PDF Report Cache ===")
+        
+        response = requests.post(f"{API_URL}/cases", json={
+            "patient_summary": self.sample_patient_summary,
+            "doctor_id": "test_doctor"
+        })
+        case_id = response.json()["id"]
+        
+        first = requests.get(f"{API_URL}/cases/{case_id}/export-pdf")
+        self.assertEqual(first.status_code, 200)
+        self.assertEqual(first.headers["Content-Type"], "application/pdf")
+        self.assertTrue(first.content.startswith(b"%PDF"))
+        
+        before = requests.get(f"{API_URL}/metrics").json()["pdf_reports"]
+        second = requests.get(f"{API_URL}/cases/{case_id}/export-pdf")
+        after = requests.get(f"{API_URL}/metrics").json()["pdf_reports"]
+        self.assertEqual(second.content, first.content)
+        self.assertEqual(after["cache_hits"] - before["cache_hits"], 1)
+        self.assertEqual(after["renders"], before["renders"])
+        
+        # Changing the case invalidates the cached report
+        files = [('files', ('pdf_note.txt', b"PDF cache note", 'text/plain'))]
+        requests.post(f"{API_URL}/cases/{case_id}/upload", files=files)
+        requests.get(f"{API_URL}/cases/{case_id}/export-pdf")
+        final = requests.get(f"{API_URL}/metrics").json()["pdf_reports"]
+        self.assertEqual(final["renders"] - after["renders"], 1)
+        
+        print("✅ PDF report cache test passed")
+    
+    def test_25_batch_pdf_export(self):
+        """Test that a batch of reports streams back as a ZIP archive with progress"""
+        print("\n=== Testing Batch PDF Export ===")
+        import io
+        import zipfile
+        
+        case_ids = []
+        for _ in range(3):
+            response = requests.post(f"{API_URL}/cases", json={
+                "patient_summary": self.sample_patient_summary,
+                "doctor_id": "test_doctor"
+            })
+            case_ids.append(response.json()["id"])
+        
+        response = requests.post(f"{API_URL}/reports/batch", json={"case_ids": case_ids, "doctor_id": "test_doctor"},
+                                 stream=True)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.headers["Content-Type"], "application/zip")
+        export_id = response.headers["X-Export-Id"]
+        archive = zipfile.ZipFile(io.BytesIO(response.content))
+        
+        names = archive.namelist()
+        self.assertIn("manifest.json", names)
+        self.assertEqual(len([name for name in names if name.endswith(".pdf")]), 3)
+        self.assertTrue(all(archive.read(name).startswith(b"%PDF") for name in names if name.endswith(".pdf")))
+        
+        progress = requests.get(f"{API_URL}/reports/batch/{export_id}").json()
+        self.assertEqual(progress["status"], "completed")
+        self.assertEqual(progress["rendered"], 3)
+        self.assertEqual(sorted(report["case_id"] for report in progress["reports"]), sorted(case_ids))
+        
+        response = requests.post(f"{API_URL}/reports/batch", json={})
+        self.assertEqual(response.status_code, 400)
+        response = requests.post(f"{API_URL}/reports/batch", json={"case_ids": case_ids})
+        self.assertEqual(response.status_code, 400)
+        # Another doctor's cases do not match
+        response = requests.post(f"{API_URL}/reports/batch", json={"case_ids": case_ids, "doctor_id": "other_doctor"})
+        self.assertEqual(response.status_code, 404)
+        
+        print("✅ Batch PDF export test passed")
+    
+    def test_26_query_planner_explain(self):
+        """Test that /query compiles recognised constraints into an indexed filter"""
+        print("\n=== Testing Query Planner ===")
+        
+        patient_id = f"QP{int(time.time())}"
+        requests.post(f"{API_URL}/cases", json={
+            "patient_summary": self.sample_patient_summary,
+            "patient_id": patient_id,
+            "doctor_id": "test_doctor"
+        })
+        
+        response = requests.post(f"{API_URL}/query?explain=true", json={
+            "query": f"patient {patient_id} from today",
+            "doctor_id": "test_doctor"
+        })
+        self.assertEqual(response.status_code, 200)
+        result = response.json()
+        self.assertEqual(len(result["cases"]), 1)
+        self.assertEqual(result["cases"][0]["patient_id"], patient_id)
+        
+        plan = result["plan"]
+        self.assertEqual(plan["constraints"]["patient_id"], patient_id)
+        self.assertIsNotNone(plan["constraints"]["date_from"])
+        self.assertEqual(plan["filter"]["patient_id"], patient_id)
+        self.assertFalse(plan["execution"]["collection_scan"])
+        print(f"Plan used indexes {plan['execution']['indexes_used']}, examined {plan['execution']['documents_examined']} documents")
+        
+        print("✅ Query planner test passed")
+    
+    def test_27_query_result_cache(self):
+        """Test that repeated searches are cached until the doctor's cases change"""
+        print("\n=== Testing Query Result Cache ===")
+        
+        doctor_id = f"cache_doctor_{int(time.time())}"
+        requests.post(f"{API_URL}/cases", json={"patient_summary": self.sample_patient_summary, "doctor_id": doctor_id})
+        filters = {"doctor_id": doctor_id, "search_text": "chest pain"}
+        
+        first = requests.post(f"{API_URL}/cases/search", json=filters)
+        second = requests.post(f"{API_URL}/cases/search", json=filters)
+        self.assertNotEqual(first.headers.get("X-Cache"), "hit")
+        self.assertEqual(second.headers.get("X-Cache"), "hit")
+        self.assertEqual(second.json(), first.json())
+        
+        query = {"query": "chest pain", "doctor_id": doctor_id}
+        requests.post(f"{API_URL}/query", json=query)
+        self.assertEqual(requests.post(f"{API_URL}/query", json=query).headers.get("X-Cache"), "hit")
+        
+        # A new case for the doctor invalidates both cached results
+        requests.post(f"{API_URL}/cases", json={"patient_summary": self.sample_patient_summary, "doctor_id": doctor_id})
+        third = requests.post(f"{API_URL}/cases/search", json=filters)
+        self.assertNotEqual(third.headers.get("X-Cache"), "hit")
+        self.assertEqual(third.json()["total_found"], 2)
+        self.assertNotEqual(requests.post(f"{API_URL}/query", json=query).headers.get("X-Cache"), "hit")
+        
+        metrics = requests.get(f"{API_URL}/metrics").json()["query_cache"]
+        self.assertGreaterEqual(metrics["hits"], 2)
+        print(f"Query cache hit ratio: {metrics['hit_ratio']}")
+        
+        print("✅ Query result cache test passed")
+    
+    def test_28_patient_timeline(self):
+        """Test the patient index and paged, chronological patient timeline"""
+        print("\n=== Testing Patient Timeline ===")
+        
+        patient_id = f"PT{int(time.time())}"
+        case_ids = []
+        for visit in range(3):
+            response = requests.post(f"{API_URL}/cases", json={
+                "patient_summary": f"Follow-up visit {visit}: {self.sample_patient_summary}",
+                "patient_id": patient_id,
+                "patient_name": "Timeline Patient",
+                "doctor_id": "test_doctor"
+            })
+            case_ids.append(response.json()["id"])
+        
+        patient = requests.get(f"{API_URL}/patients/{patient_id}?doctor_id=test_doctor").json()
+        self.assertEqual(patient["case_count"], 3)
+        self.assertEqual(patient["patient_name"], "Timeline Patient")
+        
+        first_page = requests.get(f"{API_URL}/patients/{patient_id}/timeline?doctor_id=test_doctor&limit=2").json()
+        self.assertEqual([case["id"] for case in first_page["cases"]], case_ids[:2])
+        self.assertIsNotNone(first_page["next_cursor"])
+        
+        second_page = requests.get(
+            f"{API_URL}/patients/{patient_id}/timeline?doctor_id=test_doctor&limit=2&after={first_page['next_cursor']}"
+        ).json()
+        self.assertEqual([case["id"] for case in second_page["cases"]], case_ids[2:])
+        self.assertIsNone(second_page["next_cursor"])
+        
+        newest_first = requests.get(f"{API_URL}/patients/{patient_id}/timeline?doctor_id=test_doctor&order=desc").json()
+        self.assertEqual([case["id"] for case in newest_first["cases"]], case_ids[::-1])
+        
+        response = requests.get(f"{API_URL}/patients/unknown_patient/timeline?doctor_id=test_doctor")
+        self.assertEqual(response.status_code, 404)
+        
+        print("✅ Patient timeline test passed")
+    
+    def test_29_patient_lab_trends(self):
+        """Test lab trends for a patient and their cache invalidation on new cases"""
+        print("\n=== Testing Patient Lab Trends ===")
+        
+        patient_id = f"LT{int(time.time())}"
+        requests.post(f"{API_URL}/cases", json={
+            "patient_summary": self.sample_patient_summary,
+            "patient_id": patient_id,
+            "patient_name": "Trend Patient",
+            "doctor_id": "test_doctor"
+        })
+        
+        response = requests.get(f"{API_URL}/patients/{patient_id}/lab-trends?doctor_id=test_doctor")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()["tests"], {})
+        
+        hits = requests.get(f"{API_URL}/metrics").json()["lab_trends"]["hits"]
+        requests.get(f"{API_URL}/patients/{patient_id}/lab-trends?doctor_id=test_doctor&tests=hemoglobin")
+        self.assertEqual(requests.get(f"{API_URL}/metrics").json()["lab_trends"]["hits"], hits + 1)
+        
+        response = requests.get(f"{API_URL}/patients/unknown_patient/lab-trends?doctor_id=test_doctor")
+        self.assertEqual(response.status_code, 404)
+        
+        print("✅ Patient lab trends test passed")
+    
+    def test_30_patient_fuzzy_search(self):
+        """Test fuzzy patient lookup by misspelled name and by patient id"""
+        print("\n=== Testing Patient Search ===")
+        
+        patient_id = f"FZ{int(time.time())}"
+        requests.post(f"{API_URL}/cases", json={
+            "patient_summary": self.sample_patient_summary,
+            "patient_id": patient_id,
+            "patient_name": "Venkatesh Subramanian",
+            "doctor_id": "test_doctor"
+        })
+        
+        response = requests.get(f"{API_URL}/patients/search", params={"q": "Venkatesh Subramaniam", "doctor_id": "test_doctor"})
+        self.assertEqual(response.status_code, 200)
+        self.assertIn(patient_id, [match["patient_id"] for match in response.json()["matches"]])
+        
+        by_id = requests.get(f"{API_URL}/patients/search", params={"q": patient_id, "doctor_id": "test_doctor"}).json()
+        self.assertEqual(by_id["matches"][0]["patient_id"], patient_id)
+        
+        other_doctor = requests.get(f"{API_URL}/patients/search", params={"q": "Venkatesh", "doctor_id": "other_doctor"}).json()
+        self.assertNotIn(patient_id, [match["patient_id"] for match in other_doctor["matches"]])
+        
+        print("✅ Patient search test passed")
+    
+    def test_31_search_facets(self):
+        """Test combined file and text filters and facet counts on advanced search"""
+        print("\n=== Testing Search Facets ===")
+        
+        marker = f"facetmarker{int(time.time())}"
+        for _ in range(3):
+            requests.post(f"{API_URL}/cases", json={
+                "patient_summary": f"{marker} {self.sample_patient_summary}",
+                "doctor_id": "test_doctor"
+            })
+        
+        response = requests.post(f"{API_URL}/cases/search", json={
+            "doctor_id": "test_doctor",
+            "search_text": marker,
+            "has_files": False,
+            "limit": 2,
+            "facets": True
+        })
+        self.assertEqual(response.status_code, 200)
+        data = response.json()
+        # Both filters apply: only the marked cases, all of them without files
+        self.assertEqual(data["total_found"], 2)
+        self.assertEqual(data["facets"]["total"], 3)
+        self.assertEqual(data["facets"]["files"], {"with_files": 0, "without_files": 3})
+        self.assertEqual(sum(data["facets"]["cases_per_week"].values()), 3)
+        
+        with_files = requests.post(f"{API_URL}/cases/search", json={
+            "doctor_id": "test_doctor", "search_text": marker, "has_files": True
+        }).json()
+        self.assertEqual(with_files["total_found"], 0)
+        self.assertNotIn("facets", with_files)
+        
+        print("✅ Search facets test passed")
+    
+    def test_32_case_intake(self):
+        """Test creating, uploading and analyzing a case in one multipart request"""
+        print("\n=== Testing Case Intake ===")
+        
+        response = requests.post(
+            f"{API_URL}/cases/intake?wait=false",
+            data={
+                "patient_summary": self.sample_patient_summary,
+                "patient_name": "Intake Patient",
+                "patient_age": "52",
+                "doctor_id": "test_doctor"
+            },
+            files=[("files", ("labs.csv", "test,value,unit\nHemoglobin,11.2,g/dL\n", "text/csv"))]
+        )
+        self.assertEqual(response.status_code, 202)
+        data = response.json()
+        self.assertEqual(data["case"]["patient_age"], 52)
+        self.assertEqual([f["original_name"] for f in data["case"]["uploaded_files"]], ["labs.csv"])
+        self.assertGreater(data["case"]["uploaded_files"][0]["file_size"], 0)
+        
+        job = requests.get(f"{API_URL}/cases/intake/{data['job']['id']}").json()
+        self.assertEqual(job["case_id"], data["case"]["id"])
+        self.assertIn(job["status"], ["analyzing", "completed", "conflict", "failed"])
+        
+        stored = requests.get(f"{API_URL}/cases/{data['case']['id']}").json()
+        self.assertEqual(len(stored["uploaded_files"]), 1)
+        
+        response = requests.post(f"{API_URL}/cases/intake", data={"doctor_id": "test_doctor"},
+                                 files=[("files", ("notes.txt", "no summary", "text/plain"))])
+        self.assertEqual(response.status_code, 422)
+        
+        response = requests.post(f"{API_URL}/cases/intake",
+                                 files=[("patient_summary", (None, b"\xff\xfe summary")), ("doctor_id", (None, "test_doctor"))])
+        self.assertEqual(response.status_code, 400)
+        
+        print("✅ Case intake test passed")
 
 if __name__ == "__main__":
     # Run the tests in order
@@ -106,6 +106,7 @@ const AppContent = () => {
   const [cases, setCases] = useState([]);
   const [selectedCase, setSelectedCase] = useState(null);
   const [feedbackStats, setFeedbackStats] = useState(null);
+  const [liveUpdates, setLiveUpdates] = useState(false);
   
   // Auth forms state
   const [loginData, setLoginData] = useState({ username: '', password: '' });
@@ -168,6 +169,45 @@ const AppContent = () => {
     }
   }, [isAuthenticated]);
 
+  // Apply case and feedback changes pushed by the server instead of polling
+  useEffect(() => {
+    if (!isAuthenticated || !currentUser || typeof EventSource === 'undefined') return;
+    
+    const source = new EventSource(`${API}/api/events/stream?doctor_id=${currentUser.id}`);
+    const mergeCase = (event) => {
+      const { case: delta } = JSON.parse(event.data);
+      setCases(prev => prev.map(item => item.id === delta.id ? { ...item, ...delta } : item));
+    };
+    
+    source.onopen = () => setLiveUpdates(true);
+    source.onerror = () => setLiveUpdates(false);
+    source.addEventListener('case_created', (event) => {
+      const { case: created } = JSON.parse(event.data);
+      setCases(prev => [created, ...prev.filter(item => item.id !== created.id)]);
+      loadFeedbackStats();
+    });
+    source.addEventListener('case_updated', mergeCase);
+    source.addEventListener('files_added', mergeCase);
+    source.addEventListener('analysis_completed', (event) => {
+      mergeCase(event);
+      loadFeedbackStats();
+    });
+    source.addEventListener('feedback_submitted', () => loadFeedbackStats());
+    source.addEventListener('reset', () => {
+      loadCases();
+      loadFeedbackStats();
+    });
+    source.addEventListener('unavailable', () => {
+      source.close();
+      setLiveUpdates(false);
+    });
+    
+    return () => {
+      source.close();
+      setLiveUpdates(false);
+    };
+  }, [isAuthenticated, currentUser]);
+
   // Update patient summary when speech transcript changes
   useEffect(() => {
     if (transcript && currentView === 'new-case') {
@@ -261,7 +301,7 @@ const AppContent = () => {
   const loadFeedbackStats = async () => {
     if (!currentUser) return;
     try {
-      const response = await axios.get(`${API}/api/feedback/stats?doctor_id=${currentUser.id}`);
+      const response = await axios.get(`${API}/api/dashboard/stats?doctor_id=${currentUser.id}`);
       setFeedbackStats(response.data);
     } catch (error) {
       console.error('Error loading feedback stats:', error);
@@ -276,34 +316,34 @@ const AppContent = () => {
 
     setLoading(true);
     try {
-      // Create case
-      const caseResponse = await axios.post(`${API}/api/cases`, {
+      // Create, upload and analyze in one request; fields go first so the
+      // server has them before the files stream in
+      const formData = new FormData();
+      const caseFields = {
+        ...patientDetails,
         patient_summary: patientSummary,
         doctor_id: currentUser.id,
-        doctor_name: currentUser.full_name || currentUser.username,
-        ...patientDetails,
-        patient_age: patientDetails.patient_age ? parseInt(patientDetails.patient_age) : null
+        doctor_name: patientDetails.doctor_name || currentUser.full_name || currentUser.username
+      };
+      Object.entries(caseFields).forEach(([key, value]) => {
+        if (value !== '' && value !== null && value !== undefined) {
+          formData.append(key, value);
+        }
+      });
+      selectedFiles.forEach(file => {
+        formData.append('files', file);
       });
       
-      const caseId = caseResponse.data.id;
-      
-      // Upload files if any
-      if (selectedFiles.length > 0) {
-        const formData = new FormData();
-        selectedFiles.forEach(file => {
-          formData.append('files', file);
-        });
-        
-        await axios.post(`${API}/api/cases/${caseId}/upload`, formData, {
-          headers: {
-            'Content-Type': 'multipart/form-data',
-          },
-        });
+      const intakeResponse = await axios.post(`${API}/api/cases/intake`, formData, {
+        headers: {
+          'Content-Type': 'multipart/form-data',
+        },
+      });
+      const { case: createdCase, job } = intakeResponse.data;
+      if (job.status === 'failed') {
+        throw new Error(job.error);
       }
-      
-      // Analyze case
-      const analysisResponse = await axios.post(`${API}/api/cases/${caseId}/analyze`);
-      setAnalysisResult({...analysisResponse.data, case_id: caseId});
+      setAnalysisResult({...job.analysis, case_id: createdCase.id});
       
       // Reset form
       setPatientSummary('');
@@ -316,8 +356,10 @@ const AppContent = () => {
       });
       setSelectedFiles([]);
       
-      // Reload cases
-      loadCases();
+      // Reload cases unless the change feed already delivered them
+      if (!liveUpdates) {
+        loadCases();
+      }
       
     } catch (error) {
       console.error('Error creating case:', error);
@@ -336,8 +378,10 @@ const AppContent = () => {
         feedback_text: feedbackText
       });
       
-      // Reload feedback stats
-      loadFeedbackStats();
+      // Reload feedback stats unless the change feed already delivered them
+      if (!liveUpdates) {
+        loadFeedbackStats();
+      }
       alert('Feedback submitted successfully!');
       
     } catch (error) {
@@ -368,6 +412,30 @@ const AppContent = () => {
     }
   };
 
+  const exportSearchResultsPDF = async () => {
+    try {
+      const response = await axios.post(`${API}/api/reports/batch`, {
+        case_ids: searchResults.cases.map(case_item => case_item.id),
+        doctor_id: currentUser.id
+      }, {
+        responseType: 'blob'
+      });
+      
+      const url = window.URL.createObjectURL(new Blob([response.data], { type: 'application/zip' }));
+      const link = document.createElement('a');
+      link.href = url;
+      link.setAttribute('download', 'case_reports.zip');
+      document.body.appendChild(link);
+      link.click();
+      document.body.removeChild(link);
+      window.URL.revokeObjectURL(url);
+      
+    } catch (error) {
+      console.error('Error exporting reports:', error);
+      alert('Error exporting reports');
+    }
+  };
+
   const handleFileChange = (e) => {
     const files = Array.from(e.target.files);
     setSelectedFiles(files);
@@ -396,7 +464,8 @@ const AppContent = () => {
     try {
       const filters = {
         doctor_id: currentUser.id,
-        ...searchFilters
+        ...searchFilters,
+        facets: true
       };
       
       // Remove empty filters
@@ -1050,7 +1119,35 @@ const AppContent = () => {
         
         {searchResults && (
           <div className="mt-4 p-4 bg-success-50 dark:bg-success-900/20 border-l-4 border-success-500 rounded">
-            <h4 className="font-semibold text-gray-900 dark:text-white">Found {searchResults.total_found} cases</h4>
+            <div className="flex items-center justify-between">
+              <h4 className="font-semibold text-gray-900 dark:text-white">Found {searchResults.total_found} cases</h4>
+              {searchResults.total_found > 0 && (
+                <Button variant="secondary" size="sm" onClick={exportSearchResultsPDF} icon={<Icons.Download />}>
+                  Export all as PDF (ZIP)
+                </Button>
+              )}
+            </div>
+            {searchResults.facets && searchResults.facets.total > 0 && (
+              <div className="mt-3 space-y-2 text-sm text-gray-600 dark:text-gray-400">
+                {searchResults.facets.total > searchResults.total_found && (
+                  <p>Showing {searchResults.total_found} of {searchResults.facets.total} matching cases</p>
+                )}
+                <div className="flex flex-wrap gap-2">
+                  <Badge variant="secondary" size="sm">{searchResults.facets.files.with_files} with files</Badge>
+                  <Badge variant="secondary" size="sm">{searchResults.facets.files.without_files} without files</Badge>
+                  {Object.entries(searchResults.facets.confidence_histogram).map(([bucket, count]) => (
+                    <Badge key={bucket} variant="secondary" size="sm">{bucket}-{bucket === '90' ? 100 : Number(bucket) + 9}%: {count}</Badge>
+                  ))}
+                </div>
+                {searchResults.facets.top_diagnoses.length > 0 && (
+                  <div className="flex flex-wrap gap-2">
+                    {searchResults.facets.top_diagnoses.map((item) => (
+                      <Badge key={item.diagnosis} variant="primary" size="sm">{item.diagnosis} ({item.count})</Badge>
+                    ))}
+                  </div>
+                )}
+              </div>
+            )}
           </div>
         )}
       </Card>
@@ -1087,7 +1184,7 @@ const AppContent = () => {
             
             <div className="flex justify-between items-center mb-4">
               <div className="flex items-center gap-4 text-sm text-gray-500 dark:text-gray-400">
-                <span>{case_item.uploaded_files.length} files</span>
+                <span>{case_item.file_count} files</span>
                 {case_item.confidence_score && (
                   <Badge 
                     variant={case_item.confidence_score >= 80 ? 'success' : case_item.confidence_score >= 60 ? 'warning' : 'error'}
@@ -1111,7 +1208,7 @@ const AppContent = () => {
                 >
                   View Details
                 </Button>
-                {case_item.analysis_result && (
+                {case_item.has_analysis && (
                   <Button 
                     variant="secondary"
                     size="sm"
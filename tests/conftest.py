@@ -0,0 +1,47 @@
+"""Fixtures for tests that drive backend/server.py against a live MongoDB.
+
+Tests using them are skipped when the backend dependencies are not installed
+or no MongoDB server answers at MONGO_URL.
+"""
+import asyncio
+import os
+import sys
+import uuid
+from pathlib import Path
+
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / "backend"))
+
+
+@pytest.fixture(scope="session")
+def server():
+    try:
+        import server as server_module
+    except ImportError as e:
+        pytest.skip(f"backend dependencies are not installed: {e}")
+    return server_module
+
+
+@pytest.fixture(scope="session")
+def loop():
+    event_loop = asyncio.new_event_loop()
+    asyncio.set_event_loop(event_loop)
+    yield event_loop
+    event_loop.close()
+
+
+@pytest.fixture
+def db(server, loop, monkeypatch):
+    """A throwaway database swapped in for the server's own"""
+    from pymongo import MongoClient
+    from pymongo.errors import PyMongoError
+
+    try:
+        MongoClient(os.environ["MONGO_URL"], serverSelectionTimeoutMS=500).admin.command("ping")
+    except PyMongoError:
+        pytest.skip("no MongoDB server at MONGO_URL")
+    database = server.client[f"test_{uuid.uuid4().hex[:12]}"]
+    monkeypatch.setattr(server, "db", database)
+    yield database
+    loop.run_until_complete(server.client.drop_database(database.name))
@@ -0,0 +1,78 @@
+import asyncio
+from datetime import datetime, timedelta
+
+import pytest
+
+MONTH = "2020_01"
+
+
+@pytest.fixture
+def archive_dir(server, tmp_path, monkeypatch):
+    monkeypatch.setattr(server, "AUDIT_ARCHIVE_DIR", tmp_path)
+    return tmp_path
+
+
+def audit_events(count):
+    return [
+        {"id": f"event-{number}", "user_id": f"user-{number % 3}", "action": "case_viewed",
+         "timestamp": datetime(2020, 1, 1) + timedelta(hours=number)}
+        for number in range(count)
+    ]
+
+
+def restore(server, loop, **filters):
+    return loop.run_until_complete(server.query_audit_logs(
+        filters, limit=1000, since=datetime(2020, 1, 1), until=datetime(2020, 1, 31, 23, 59)
+    ))
+
+
+def test_archive_and_restore(server, db, loop, archive_dir):
+    loop.run_until_complete(server.write_audit_events(audit_events(50)))
+
+    assert loop.run_until_complete(server.archive_audit_month(MONTH)) is True
+
+    assert f"audit_logs_{MONTH}" not in loop.run_until_complete(db.list_collection_names())
+    assert loop.run_until_complete(server.list_audit_months()) == {MONTH: "archived"}
+    assert list(archive_dir.glob("*.tmp")) == []
+    logs = restore(server, loop)
+    assert [log["id"] for log in logs] == [f"event-{number}" for number in range(49, -1, -1)]
+    assert len(restore(server, loop, user_id="user-1")) == 17
+
+
+def test_late_events_are_appended(server, db, loop, archive_dir):
+    loop.run_until_complete(server.write_audit_events(audit_events(10)))
+    loop.run_until_complete(server.archive_audit_month(MONTH))
+    late = [{**event, "id": f"late-{number}"} for number, event in enumerate(audit_events(2))]
+    loop.run_until_complete(server.write_audit_events(late))
+
+    loop.run_until_complete(server.archive_audit_month(MONTH))
+
+    assert len(restore(server, loop)) == 12
+
+
+def test_interrupted_archive_does_not_duplicate_events(server, db, loop, archive_dir, monkeypatch):
+    loop.run_until_complete(server.write_audit_events(audit_events(20)))
+    collection_type = type(server.audit_collection(MONTH))
+    drop = collection_type.drop
+
+    async def crash(self, *args, **kwargs):
+        raise RuntimeError("worker stopped")
+
+    monkeypatch.setattr(collection_type, "drop", crash)
+    with pytest.raises(RuntimeError):
+        loop.run_until_complete(server.archive_audit_month(MONTH))
+    monkeypatch.setattr(collection_type, "drop", drop)
+
+    assert loop.run_until_complete(server.archive_audit_month(MONTH)) is True
+
+    assert len(restore(server, loop)) == 20
+
+
+def test_one_worker_archives_a_month_at_a_time(server, db, loop, archive_dir):
+    loop.run_until_complete(server.write_audit_events(audit_events(20)))
+
+    async def archive_twice():
+        return await asyncio.gather(server.archive_audit_month(MONTH), server.archive_audit_month(MONTH))
+
+    assert sorted(loop.run_until_complete(archive_twice())) == [False, True]
+    assert len(restore(server, loop)) == 20
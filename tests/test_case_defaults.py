@@ -0,0 +1,27 @@
+from datetime import datetime
+
+import orjson
+
+
+def test_legacy_case_gets_model_defaults(server, db, loop):
+    from starlette.requests import Request
+
+    # Shaped like a case stored before uploaded_files, version and the analysis fields existed
+    loop.run_until_complete(db.clinical_cases.insert_one({
+        "id": "legacy-case",
+        "patient_summary": "Cough for three days",
+        "doctor_id": "legacy_doctor",
+        "created_at": datetime(2023, 5, 1),
+        "updated_at": datetime(2023, 5, 1)
+    }))
+    request = Request({"type": "http", "method": "GET", "path": "/api/cases/legacy-case", "headers": []})
+
+    response = loop.run_until_complete(server.get_case("legacy-case", request))
+
+    case = orjson.loads(response.body)
+    server.ClinicalCase(**case)
+    assert case["uploaded_files"] == []
+    assert case["version"] == 0
+    assert case["analysis_version"] == 0
+    assert case["analysis_result"] is None
+    assert case["created_at"].startswith("2023-05-01")
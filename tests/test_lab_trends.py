@@ -0,0 +1,103 @@
+import sys
+from datetime import datetime, timedelta
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / "backend"))
+
+from lab_trends import collect_observations, compute_lab_trends, extract_lab_values  # noqa: E402
+
+START = datetime(2026, 1, 1)
+
+
+def observation(test, day, value, **extra):
+    return {"case_id": f"case-{day}", "observed_at": START + timedelta(days=day), "test": test, "value": value, **extra}
+
+
+def test_structured_values_take_precedence():
+    values = extract_lab_values({
+        "lab_values": [{"test": "HGB", "value": "11.2", "unit": "g/dL", "reference_low": 13.5, "reference_high": 17.5}],
+        "abnormal_values": ["Creatinine 2.1 mg/dL"]
+    })
+    assert values == [{"test": "hemoglobin", "value": 11.2, "unit": "g/dL", "reference_low": 13.5, "reference_high": 17.5}]
+
+
+def test_free_text_fallback():
+    values = extract_lab_values({
+        "abnormal_values": ["Serum creatinine elevated at 2.1 mg/dL", "HbA1c: 8.4%"],
+        "key_findings": ["Creatinine 1.0 mg/dL on repeat"]
+    })
+    assert {value["test"]: value["value"] for value in values} == {"creatinine": 2.1, "hba1c": 8.4}
+
+
+def test_collect_observations_skips_unanalyzed_cases():
+    result = {"file_interpretations": [{"lab_values": [{"test": "potassium", "value": 5.9}]}]}
+    observations = collect_observations([("a", START, result), ("b", START, None)])
+    assert [(o["case_id"], o["test"], o["value"]) for o in observations] == [("a", "potassium", 5.9)]
+
+
+def test_deltas_and_reference_change():
+    trends = compute_lab_trends([
+        observation("hemoglobin", 30, 12.4),
+        observation("hemoglobin", 0, 13.0),
+        observation("hemoglobin", 60, 10.5),
+    ])["tests"]["hemoglobin"]
+    assert [point["value"] for point in trends["points"]] == [13.0, 12.4, 10.5]
+    assert [point["delta"] for point in trends["points"]] == [None, -0.6, -1.9]
+    assert [point["significant_change"] for point in trends["points"]] == [False, False, True]
+    assert trends["significant_changes"] == 1
+
+
+def test_slope_and_significance():
+    rising = compute_lab_trends([observation("creatinine", day, 1.0 + day * 0.01) for day in range(0, 100, 10)])
+    trend = rising["tests"]["creatinine"]
+    assert trend["slope_per_30_days"] == 0.3
+    assert trend["trend_significant"] is True
+    assert trend["t_stat"] is None
+
+    noisy = compute_lab_trends([observation("sodium", day, value) for day, value in enumerate([140, 136, 141, 137])])
+    assert noisy["tests"]["sodium"]["trend_significant"] is False
+
+
+def test_out_of_range_runs_and_reported_ranges():
+    values = [5.8, 5.9, 4.2, 5.6, 5.7, 5.9]
+    trends = compute_lab_trends([observation("potassium", day, value) for day, value in enumerate(values)])
+    potassium = trends["tests"]["potassium"]
+    assert potassium["out_of_range_count"] == 5
+    assert potassium["longest_out_of_range_run"] == 3
+    assert potassium["current_out_of_range_run"] == 3
+
+    # A report's own range overrides the default interval
+    custom = compute_lab_trends([observation("glucose", 0, 105, reference_low=70, reference_high=110)])
+    assert custom["tests"]["glucose"]["points"][0]["out_of_range"] is False
+
+
+def test_filter_by_tests():
+    observations = [observation("alt", 0, 40), observation("ast", 0, 30)]
+    assert list(compute_lab_trends(observations, tests=["ast"])["tests"]) == ["ast"]
+    assert compute_lab_trends([]) == {"tests": {}, "observation_count": 0}
+
+
+def test_short_aliases_need_a_value_and_unit():
+    values = extract_lab_values({
+        "abnormal_values": ["Back pain for 2 weeks", "Mass in the neck 4cm", "Lump in breast 2 cm", "Serum na 3"],
+        "key_findings": ["K 5.9 mmol/L", "Hb: 9.8 g/dL"]
+    })
+    assert {value["test"]: value["value"] for value in values} == {"potassium": 5.9, "hemoglobin": 9.8}
+
+
+def test_units_are_converted_or_kept_apart():
+    values = extract_lab_values({"lab_values": [
+        {"test": "creatinine", "value": 176.84, "unit": "µmol/L", "reference_low": 61.9, "reference_high": 114.9}
+    ]})
+    assert values[0]["unit"] == "mg/dL" and values[0]["value"] == 2.0
+    assert round(values[0]["reference_high"], 2) == 1.3
+
+    trends = compute_lab_trends([
+        observation("creatinine", 0, 1.0, unit="mg/dL"),
+        observation("creatinine", 10, 1.4),
+        observation("creatinine", 20, 0.2, unit="mmol/x"),
+    ])["tests"]
+    assert sorted(trends) == ["creatinine", "creatinine (mmol/x)"]
+    assert trends["creatinine"]["count"] == 2
+    assert trends["creatinine (mmol/x)"]["test"] == "creatinine"
+    assert trends["creatinine (mmol/x)"]["reference_high"] is None
@@ -0,0 +1,59 @@
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / "backend"))
+
+from patient_search import TrigramIndex, trigrams  # noqa: E402
+
+
+def build(patients, doctor_id="doc"):
+    index = TrigramIndex()
+    for patient_id, name in patients:
+        index.add(doctor_id, patient_id, name)
+    return index
+
+
+def names(matches):
+    return [match["patient_name"] for match in matches]
+
+
+def test_trigrams_are_padded_per_word_and_accent_free():
+    assert trigrams("José Li") == {"  j", " jo", "jos", "ose", "se ", "  l", " li", "li "}
+    assert trigrams("") == set()
+
+
+def test_misspelled_and_partial_names_rank_the_closest_first():
+    index = build([("P1", "Lakshmi Iyer"), ("P2", "Lakshmi Narayanan"), ("P3", "Rahul Sharma"), ("P4", "Rahul Verma")])
+    assert names(index.search("doc", "Laxmi Iyer"))[0] == "Lakshmi Iyer"
+    assert names(index.search("doc", "rahul sharm"))[0] == "Rahul Sharma"
+    assert names(index.search("doc", "Narayan")) == ["Lakshmi Narayanan"]
+    assert index.search("doc", "zzzz") == []
+
+
+def test_exact_patient_id_ranks_first():
+    index = build([("MRN1001", "Anita Rao"), ("MRN1002", "Anita Rao"), ("MRN10021", "Arun Rao")])
+    matches = index.search("doc", "MRN1002")
+    assert matches[0] == {"patient_id": "MRN1002", "patient_name": "Anita Rao", "score": 1.0}
+    assert {match["patient_id"] for match in matches} >= {"MRN1001", "MRN10021"}
+
+
+def test_results_are_scoped_by_doctor():
+    index = build([("P1", "Meera Nair")], doctor_id="doc_a")
+    assert index.search("doc_b", "Meera Nair") == []
+    assert names(index.search("doc_a", "Meera Nair")) == ["Meera Nair"]
+
+
+def test_renames_and_removals_replace_the_old_entry():
+    index = build([("P1", "Sunita Das")])
+    assert index.add("doc", "P1", "Sunita Das") is False
+    assert index.add("doc", "P1", "Sunita Menon") is True
+    assert names(index.search("doc", "Sunita")) == ["Sunita Menon"]
+    assert index.remove("doc", "P1") is True
+    assert index.search("doc", "Sunita") == []
+    assert index.metrics()["tombstones"] == 2
+
+
+def test_limit_keeps_the_best_matches():
+    index = build([(f"P{number}", f"Arjun Patel{suffix}") for number, suffix in enumerate(["", "a", "ani", "anikar"])]
+                  + [(f"Q{number}", f"Arjun Kumar {number}") for number in range(50)])
+    assert names(index.search("doc", "Arjun Patel", limit=2)) == ["Arjun Patel", "Arjun Patela"]
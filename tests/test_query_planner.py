@@ -0,0 +1,86 @@
+import sys
+from datetime import datetime
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / "backend"))
+
+from query_planner import LAB_REGEX, plan_case_query  # noqa: E402
+
+NOW = datetime(2026, 3, 18, 15, 30)
+
+
+def plan(query):
+    return plan_case_query(query, "doc", now=NOW)
+
+
+def test_relative_dates():
+    assert plan("cases from yesterday").mongo_filter()["created_at"] == {
+        "$gte": datetime(2026, 3, 17), "$lt": datetime(2026, 3, 18)
+    }
+    assert plan("today's cases").mongo_filter()["created_at"] == {"$gte": datetime(2026, 3, 18)}
+    assert plan("last 7 days").date_from == datetime(2026, 3, 12)
+    last_month = plan("cases last month")
+    assert (last_month.date_from, last_month.date_to) == (datetime(2026, 2, 1), datetime(2026, 3, 1))
+    # An absurd window is clamped instead of overflowing
+    assert plan("cases from the last 999999999 years").date_from.year == 1826
+
+
+def test_absolute_dates():
+    between = plan("between 2026-01-01 and 2026-01-31")
+    assert (between.date_from, between.date_to) == (datetime(2026, 1, 1), datetime(2026, 2, 1))
+    assert plan("since 2025-12-01").date_from == datetime(2025, 12, 1)
+    assert plan("cases in January 2026").date_to == datetime(2026, 2, 1)
+
+
+def test_out_of_range_years_are_not_dates():
+    assert plan("on 9999-12-31").date_from is None
+    assert plan("between 2026-01-01 and 9999-12-31").date_label == "on 2026-01-01"
+    assert plan("in dec 0000").date_from is None
+    assert plan("in dec 9999").date_from is None
+
+
+def test_patient_id_uses_equality():
+    query = plan("patient P001 from yesterday")
+    assert query.mongo_filter()["patient_id"] == "P001"
+    assert query.expected_index() == "doctor_id_1_patient_id_1_created_at_-1_id_-1"
+    assert query.text_terms == []
+
+
+def test_patient_name_and_confidence():
+    query = plan("patient named Jane Doe with confidence above 80")
+    mongo_filter = query.mongo_filter()
+    assert mongo_filter["patient_name"]["$regex"] == "^Jane\\ Doe"
+    assert mongo_filter["confidence_score"] == {"$gte": 80.0}
+    assert plan("low confidence").mongo_filter()["confidence_score"] == {"$lt": 50}
+
+
+def test_patient_keyword_ignores_case():
+    assert plan("Patient 123").patient_id == "123"
+    assert plan("Patient Jane Doe").patient_name == "Jane Doe"
+    assert plan("PATIENT named Jane").patient_name == "Jane"
+    assert plan("Patient with fever").patient_name is None
+
+
+def test_files_diagnosis_and_labs():
+    query = plan("diagnosed with pneumonia with files")
+    mongo_filter = query.mongo_filter()
+    assert mongo_filter["analysis_summary.primary_diagnosis"]["$regex"] == "pneumonia"
+    assert mongo_filter["uploaded_files.0"] == {"$exists": True}
+    assert plan("cases without attachments").mongo_filter()["uploaded_files.0"] == {"$exists": False}
+    assert plan("cbc results").lab_work
+
+
+def test_stopwords_and_word_parts_are_not_constraints():
+    assert plan("diagnosis of").diagnosis is None
+    assert plan("diagnosis of the").diagnosis is None
+    assert plan("diagnosis of asthma").diagnosis == "asthma"
+    assert not plan("latest available cases").lab_work
+    assert plan("blood work").mongo_filter()["$or"][0]["patient_summary"]["$regex"] == LAB_REGEX
+
+
+def test_residual_text_is_escaped_and_combined():
+    query = plan("show me cases with chest pain + dyspnea from today and fever")
+    assert query.text_terms == ["chest pain + dyspnea", "fever"]
+    mongo_filter = query.mongo_filter()
+    assert len(mongo_filter["$and"]) == 2
+    assert mongo_filter["$and"][0]["$or"][0] == {"patient_summary": {"$regex": "chest\\ pain\\ \\+\\ dyspnea", "$options": "i"}}
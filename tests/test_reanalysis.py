@@ -0,0 +1,96 @@
+import asyncio
+
+import pytest
+
+DOCTOR = "reanalysis_test_doctor"
+
+
+@pytest.fixture
+def cases(server, db, loop):
+    docs = [server.ClinicalCase(patient_summary=f"case {number}", doctor_id=DOCTOR).dict() for number in range(5)]
+    loop.run_until_complete(db.clinical_cases.insert_many(docs))
+    return docs
+
+
+def analysis_result(server):
+    return server.ClinicalAnalysisResult(
+        soap_note={"assessment": "stable"},
+        differential_diagnoses=[{"diagnosis": "Viral infection", "probability": 60}],
+        treatment_recommendations=[],
+        investigation_suggestions=[],
+        file_interpretations=[],
+        confidence_score=60,
+        overall_assessment="stable"
+    )
+
+
+def job_request(server, concurrency=2):
+    return server.ReanalysisJobCreate(
+        filters=server.ReanalysisFilters(doctor_id=DOCTOR, only_analyzed=False),
+        concurrency=concurrency,
+        per_minute=0
+    )
+
+
+def test_runner_stores_results_and_counts_conflicts(server, db, loop, cases, monkeypatch):
+    async def analyze(summary, uploaded_files, file_interpretations=None):
+        if summary == "case 2":
+            # The case is edited while its analysis is running
+            await db.clinical_cases.update_one({"patient_summary": summary}, {"$inc": {"version": 1}})
+        return analysis_result(server)
+
+    monkeypatch.setattr(server, "analyze_clinical_case", analyze)
+
+    async def scenario():
+        runner = await server.ReanalysisRunner.create(job_request(server))
+        await runner.run()
+        return runner
+
+    runner = loop.run_until_complete(scenario())
+
+    job = loop.run_until_complete(db.reanalysis_jobs.find_one({"id": runner.job_id}))
+    assert (job["status"], job["processed"], job["succeeded"], job["conflicts"], job["failed"]) == ("completed", 5, 4, 1, 0)
+    edited = loop.run_until_complete(db.clinical_cases.find_one({"patient_summary": "case 2"}))
+    assert edited["analysis_id"] is None
+
+
+def test_resumed_runner_counts_each_case_once(server, db, loop, cases, monkeypatch):
+    first_case_started = asyncio.Event()
+
+    async def stalled(summary, uploaded_files, file_interpretations=None):
+        if summary == "case 0":
+            first_case_started.set()
+            await asyncio.Event().wait()
+        return analysis_result(server)
+
+    async def analyze(summary, uploaded_files, file_interpretations=None):
+        return analysis_result(server)
+
+    async def interrupted_run():
+        runner = await server.ReanalysisRunner.create(job_request(server))
+        task = asyncio.create_task(runner.run())
+        await first_case_started.wait()
+        while runner.progress()["processed"] < 1:
+            await asyncio.sleep(0.01)
+        # The worker dies with case 0 in flight and case 1 already finished
+        task.cancel()
+        for job in list(server.background_jobs):
+            job.cancel()
+        await asyncio.gather(task, *server.background_jobs, return_exceptions=True)
+        return runner.job_id
+
+    monkeypatch.setattr(server, "analyze_clinical_case", stalled)
+    job_id = loop.run_until_complete(interrupted_run())
+
+    job = loop.run_until_complete(db.reanalysis_jobs.find_one({"id": job_id}))
+    assert (job["status"], job["processed"], job["cursor"]) == ("interrupted", 0, None)
+
+    async def resumed_run():
+        runner = await server.ReanalysisRunner.load(job_id)
+        await runner.run()
+
+    monkeypatch.setattr(server, "analyze_clinical_case", analyze)
+    loop.run_until_complete(resumed_run())
+
+    job = loop.run_until_complete(db.reanalysis_jobs.find_one({"id": job_id}))
+    assert (job["status"], job["processed"], job["succeeded"]) == ("completed", 5, 5)
@@ -0,0 +1,78 @@
+import asyncio
+import os
+import uuid
+from datetime import datetime, timedelta
+
+import pytest
+
+
+@pytest.fixture
+def mongo_store(server, db, loop):
+    store = server.MongoSessionStore(db.sessions)
+    loop.run_until_complete(store.start())
+    return store
+
+
+@pytest.fixture
+def redis_store(server, loop):
+    import redis
+    from redis.exceptions import RedisError
+
+    url = os.environ.get("REDIS_URL", server.REDIS_URL)
+    try:
+        redis.Redis.from_url(url, socket_connect_timeout=0.5).ping()
+    except RedisError:
+        pytest.skip(f"no Redis server at {url}")
+    store = server.RedisSessionStore(url, prefix=f"test-session-{uuid.uuid4().hex[:8]}:")
+    yield store
+    loop.run_until_complete(store.close())
+
+
+@pytest.fixture(params=["mongo_store", "redis_store"])
+def store(request):
+    return request.getfixturevalue(request.param)
+
+
+def new_session(ttl=3600):
+    now = datetime.utcnow().replace(microsecond=0)
+    return {"user_id": "user-1", "username": "doctor", "created_at": now, "expires_at": now + timedelta(seconds=ttl)}
+
+
+def test_session_store_is_abstract(server):
+    with pytest.raises(TypeError):
+        server.SessionStore()
+
+
+def test_save_load_and_delete(store, loop):
+    session = new_session()
+    loop.run_until_complete(store.save("key-1", session, 3600))
+
+    assert loop.run_until_complete(store.load("key-1")) == session
+    assert loop.run_until_complete(store.load("missing")) is None
+    assert loop.run_until_complete(store.delete("key-1")) == session
+    assert loop.run_until_complete(store.load("key-1")) is None
+    assert loop.run_until_complete(store.delete("key-1")) is None
+
+
+def test_touch_extends_expiry(store, loop):
+    session = new_session(ttl=60)
+    loop.run_until_complete(store.save("key-2", session, 60))
+    extended = session["expires_at"] + timedelta(hours=1)
+
+    loop.run_until_complete(store.touch("key-2", extended, 3660))
+
+    assert loop.run_until_complete(store.load("key-2"))["expires_at"] == extended
+    # Touching a session that is gone does not bring it back
+    loop.run_until_complete(store.touch("missing", extended, 3660))
+    assert loop.run_until_complete(store.load("missing")) is None
+
+
+def test_expired_sessions_are_not_loaded(store, loop):
+    session = new_session(ttl=1)
+    session["expires_at"] = datetime.utcnow() - timedelta(seconds=1)
+    loop.run_until_complete(store.save("key-3", session, 1))
+
+    if store.name == "redis":
+        # Redis expires the key itself
+        loop.run_until_complete(asyncio.sleep(1.1))
+    assert loop.run_until_complete(store.load("key-3")) is None